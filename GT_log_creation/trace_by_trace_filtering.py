@@ -1,10 +1,17 @@
 
 
+import os
+import sys
+
 import pandas as pd
 import pm4py
-from pm4py.algo.conformance.tokenreplay import algorithm as token_replay
 import utils
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import artifact_writer
+import reachability_acceptor
+import token_replay_engine
+
 
 def filter_perfect_fitting_cases_one_by_one(
     df_log: pd.DataFrame,
@@ -14,7 +21,9 @@ def filter_perfect_fitting_cases_one_by_one(
     case_id_col: str = "case:concept:name") -> pd.DataFrame:
     """
     Keep only those cases in df_log whose token‐replay fitness is perfect (trace_is_fit == True).
-    This does a per‐case conversion & replay, avoiding the bulk diagnostics API.
+    The check runs on the reachability acceptor of the model (reachability_acceptor.py), which gives the same flags
+    as token replay without its diagnostics, and falls back to the compiled replay engine for unbounded nets.
+    Cases of the same variant share a single check.
 
     Parameters
     ----------
@@ -32,16 +41,18 @@ def filter_perfect_fitting_cases_one_by_one(
     pd.DataFrame
         Subset of df_log containing only perfectly fitting cases.
     """
+    compiled = token_replay_engine.compile_net(net, initial_marking, final_marking)
+    cases = df_log.groupby(case_id_col)["concept:name"].agg(tuple)
+    # every variant is only checked once
+    fit_variants = reachability_acceptor.fit_flags(set(cases), compiled)
+
     perfect_cases = []
     i = 0
     # iterate through each case
-    for case_id, single_log in df_log.groupby(case_id_col):
-
-        # replay returns a list of dicts—here it will be length 1
-        result = token_replay.apply(single_log, net, initial_marking, final_marking)
+    for case_id, activities in cases.items():
 
         # check its fit-flag
-        if result[0]['trace_is_fit']:
+        if fit_variants[activities]:
             # if the trace is fit, add the case_id to the list
             perfect_cases.append(case_id)
         i += 1 
@@ -52,14 +63,17 @@ def filter_perfect_fitting_cases_one_by_one(
     return df_log[df_log[case_id_col].isin(perfect_cases)].copy()
 
 
-def do_slow_filtering(logname, noise_threshold= 0.2, zipfile=False):
+def do_slow_filtering(logname, noise_thresholds=(0.2,), zipfile=False):
     """
     Perform slow filtering of the event log to keep only perfectly fitting cases.
+    The models of all noise thresholds are discovered in one inductive miner sweep on the log.
 
     Parameters
     ----------
     logname : str
         The name of the event log file (without extension).
+    noise_thresholds : list of float
+        Noise thresholds of the inductive miner, one filtered log is written per threshold.
     """
     # Load the event log
     if zipfile:
@@ -67,21 +81,25 @@ def do_slow_filtering(logname, noise_threshold= 0.2, zipfile=False):
     else:
         log = pm4py.read_xes('original_event_logs/' + logname + '.xes')  # Replace with your log file path
 
-    # Discover the process model
-    net, im, fm = utils.discover_net(log, algo='inductive', noise_threshold=noise_threshold)
+    # Discover the process models
+    nets = utils.discover_inductive_nets(log, noise_thresholds)
 
-    # Save the process model
-    pm4py.write_pnml(net, im, fm, 'process_models/' + logname + '_' + str(noise_threshold).replace('.', '_') + '_inductive.pnml')  # Replace with your desired output path
+    for noise_threshold in noise_thresholds:
+        net, im, fm = nets[noise_threshold]
+        suffix = str(noise_threshold).replace('.', '_')
 
-    # Show view of the process model
-    pm4py.save_vis_petri_net(net, im, fm, file_path='process_models/' + logname + '_' + str(noise_threshold).replace('.', '_') +'_inductive_view.png')  # This will save a view for the Petri net
+        # Save the process model
+        artifact_writer.write_pnml(net, im, fm, 'process_models/' + logname + '_' + suffix + '_inductive.pnml')  # Replace with your desired output path
 
-    # Filter the log to keep only the perfectly fitting cases
-    new_log = filter_perfect_fitting_cases_one_by_one(log, net, im, fm)
+        # Show view of the process model
+        artifact_writer.save_petri_net_view(net, im, fm, 'process_models/' + logname + '_' + suffix +'_inductive_view.png')  # This will save a view for the Petri net
 
-    # Save the filtered log
-    print(len(new_log))
-    pm4py.write_xes(new_log, 'cleaned_event_logs/' + logname + '_' + str(noise_threshold).replace('.', '_') + '_perfect_fitting_cases.xes')  # Replace with your desired output path
+        # Filter the log to keep only the perfectly fitting cases
+        new_log = filter_perfect_fitting_cases_one_by_one(log, net, im, fm)
+
+        # Save the filtered log
+        print(len(new_log))
+        artifact_writer.write_xes(new_log, 'cleaned_event_logs/' + logname + '_' + suffix + '_perfect_fitting_cases.xes')  # Replace with your desired output path
    
 
 '''
@@ -94,29 +112,13 @@ do_slow_filtering('RTFM', zipfile=False)
 
 # Apply the filtering to all logs with different thresholds (from 0.1 to 0.5)
 
-do_slow_filtering('BPI_Challenge_2012', noise_threshold=0.1, zipfile=True)
-do_slow_filtering('BPI_Challenge_2012', noise_threshold=0.2, zipfile=True)
-do_slow_filtering('BPI_Challenge_2012', noise_threshold=0.3, zipfile=True)
-do_slow_filtering('BPI_Challenge_2012', noise_threshold=0.4, zipfile=True)
-do_slow_filtering('BPI_Challenge_2012', noise_threshold=0.5, zipfile=True)
-
-do_slow_filtering('Hospital Billing - Event Log', noise_threshold=0.1, zipfile=True)
-do_slow_filtering('Hospital Billing - Event Log', noise_threshold=0.2, zipfile=True)
-do_slow_filtering('Hospital Billing - Event Log', noise_threshold=0.3, zipfile=True)
-do_slow_filtering('Hospital Billing - Event Log', noise_threshold=0.4, zipfile=True)
-do_slow_filtering('Hospital Billing - Event Log', noise_threshold=0.5, zipfile=True)
-
-do_slow_filtering('Sepsis Cases - Event Log', noise_threshold=0.1, zipfile=True)
-do_slow_filtering('Sepsis Cases - Event Log', noise_threshold=0.2, zipfile=True)
-do_slow_filtering('Sepsis Cases - Event Log', noise_threshold=0.3, zipfile=True)
-do_slow_filtering('Sepsis Cases - Event Log', noise_threshold=0.4, zipfile=True)
-do_slow_filtering('Sepsis Cases - Event Log', noise_threshold=0.5, zipfile=True)
-
-do_slow_filtering('Road_Traffic_Fine_Management_Process', noise_threshold=0.1, zipfile=True)
-do_slow_filtering('Road_Traffic_Fine_Management_Process', noise_threshold=0.2, zipfile=True)
-do_slow_filtering('Road_Traffic_Fine_Management_Process', noise_threshold=0.3, zipfile=True)
-do_slow_filtering('Road_Traffic_Fine_Management_Process', noise_threshold=0.4, zipfile=True)
-do_slow_filtering('Road_Traffic_Fine_Management_Process', noise_threshold=0.5, zipfile=True)
+do_slow_filtering('BPI_Challenge_2012', noise_thresholds=[0.1, 0.2, 0.3, 0.4, 0.5], zipfile=True)
+
+do_slow_filtering('Hospital Billing - Event Log', noise_thresholds=[0.1, 0.2, 0.3, 0.4, 0.5], zipfile=True)
+
+do_slow_filtering('Sepsis Cases - Event Log', noise_thresholds=[0.1, 0.2, 0.3, 0.4, 0.5], zipfile=True)
+
+do_slow_filtering('Road_Traffic_Fine_Management_Process', noise_thresholds=[0.1, 0.2, 0.3, 0.4, 0.5], zipfile=True)
 
 # Converting the helpdesk log to an XES
 df_log = pd.read_csv('original_event_logs/' + 'Helpdesk - Event Log' + '.csv')
@@ -124,8 +126,4 @@ df_log = pm4py.format_dataframe(df_log, case_id='Case ID', activity_key='Activit
 log = pm4py.convert_to_event_log(df_log)
 pm4py.write_xes(log, 'original_event_logs/' + 'Helpdesk - Event Log' + '.xes')  # Replace with your desired output path
 
-do_slow_filtering('Helpdesk - Event Log', noise_threshold=0.1, zipfile=False)
-do_slow_filtering('Helpdesk - Event Log', noise_threshold=0.2, zipfile=False)
-do_slow_filtering('Helpdesk - Event Log', noise_threshold=0.3, zipfile=False)
-do_slow_filtering('Helpdesk - Event Log', noise_threshold=0.4, zipfile=False)
-do_slow_filtering('Helpdesk - Event Log', noise_threshold=0.5, zipfile=False)
+do_slow_filtering('Helpdesk - Event Log', noise_thresholds=[0.1, 0.2, 0.3, 0.4, 0.5], zipfile=False)
@@ -1,6 +1,11 @@
-from typing import Tuple, Any
+import os
+import sys
+from typing import Tuple, Any, Dict, List
 import pm4py
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discovery_index
+
 def discover_net(
     log: Any, 
     algo: str, 
@@ -28,7 +33,7 @@ def discover_net(
         Tuple[Any, Any, Any]: Discovered Petri net, initial marking, and final marking.
     """
     if algo == "inductive":
-        return pm4py.discover_petri_net_inductive(log, noise_threshold=noise_threshold)
+        return discovery_index.get_index(log).discover_inductive(noise_threshold)
     elif algo == "heuristic":
         return pm4py.discover_petri_net_heuristic(
             log, 
@@ -41,4 +46,20 @@ def discover_net(
     elif algo == "ilp":
         return pm4py.discover_petri_net_ilp(log, alpha=alpha_ilp)
     else:
-        raise ValueError(f"Unknown discovery algorithm: '{algo}'")
\ No newline at end of file
+        raise ValueError(f"Unknown discovery algorithm: '{algo}'")
+
+
+def discover_inductive_nets(log: Any, noise_thresholds: List[float]) -> Dict[float, Tuple[Any, Any, Any]]:
+    """Discover a Petri net with the inductive miner for every noise threshold in one sweep.
+
+    The thresholds share the variants and DFG of the log and the cuts found on it, which is
+    considerably cheaper than calling discover_net once per threshold.
+
+    Args:
+        log (Any): Event log to discover process models from.
+        noise_thresholds (List[float]): Noise thresholds of the inductive miner.
+
+    Returns:
+        Dict[float, Tuple[Any, Any, Any]]: Petri net, initial marking, and final marking per noise threshold.
+    """
+    return discovery_index.get_index(log).discover_inductive_sweep(noise_thresholds)
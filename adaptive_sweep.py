@@ -0,0 +1,123 @@
+import heapq
+import math
+
+
+"""
+Adaptive refinement of the pollution percentages of a sensitivity sweep
+
+Instead of evaluating every algorithm on a fixed grid of percentages, the sweep starts from a coarse grid and only
+bisects the intervals in which a metric of some algorithm changes by more than a tolerance, or in which the ranking
+of the algorithms on some metric changes by more than the tolerance. Intervals are refined by decreasing priority until
+no interval qualifies anymore or the budget of cells (one cell = one algorithm evaluated at one percentage) is used up.
+The sweeps of several polluters share one budget, their intervals compete for it. Metrics that are NaN at either end
+of an interval (cells that exceeded their budget) are left out of its priority.
+"""
+
+
+COARSE_GRID = [0.1, 0.5, 0.9]
+TOLERANCE = 0.02
+MAX_CELLS = 100
+MIN_INTERVAL_WIDTH = 0.025
+
+
+def _rankings_cross(lower, upper, algorithms, metric, tolerance):
+    # two algorithms swap places if their difference changes sign and by more than the tolerance, so that ties within
+    # noise do not count as crossings
+    for i, first in enumerate(algorithms):
+        for second in algorithms[i + 1:]:
+            lower_difference = lower[first][metric] - lower[second][metric]
+            upper_difference = upper[first][metric] - upper[second][metric]
+            if math.isnan(lower_difference) or math.isnan(upper_difference):
+                continue
+            if lower_difference * upper_difference < 0 and abs(lower_difference - upper_difference) > tolerance:
+                return True
+    return False
+
+
+def _interval_priority(lower, upper, algorithms, metrics, tolerance):
+    """
+    Returns the priority of refining the interval between two evaluated percentages, or None if it is flat enough.
+    Intervals in which rankings cross come first, then the ones with the largest metric change.
+    """
+    changes = [abs(upper[algorithm][metric] - lower[algorithm][metric])
+               for algorithm in algorithms for metric in metrics]
+    largest_change = max((change for change in changes if not math.isnan(change)), default=0.0)
+    rankings_cross = any(_rankings_cross(lower, upper, algorithms, metric, tolerance) for metric in metrics)
+    if not rankings_cross and largest_change <= tolerance:
+        return None
+    return (1 if rankings_cross else 0), largest_change
+
+
+def refine_percentages(evaluate_percentage, algorithms, metrics, coarse_grid=COARSE_GRID, tolerance=TOLERANCE,
+                       max_cells=MAX_CELLS, min_interval_width=MIN_INTERVAL_WIDTH):
+    """
+    Evaluates the coarse grid and then bisects the intervals where the metrics are not flat, within a budget of cells.
+    Same as refine_sweep with a single sweep, returns {percentage: {algorithm: {metric: value}}}.
+    """
+    return refine_sweep({None: evaluate_percentage}, algorithms, metrics, coarse_grid=coarse_grid,
+                        tolerance=tolerance, max_cells=max_cells, min_interval_width=min_interval_width)[None]
+
+
+def refine_sweep(evaluators, algorithms, metrics, coarse_grid=COARSE_GRID, tolerance=TOLERANCE, max_cells=MAX_CELLS,
+                 min_interval_width=MIN_INTERVAL_WIDTH):
+    """
+    Evaluates the coarse grid of every sweep (e.g. one per polluter) and then bisects the intervals where the metrics
+    are not flat. The sweeps share one budget of cells: the intervals of all sweeps are refined by decreasing priority.
+
+    Parameters
+    ----------
+    evaluators : dict
+        {sweep: evaluate_percentage}, evaluate_percentage evaluates all algorithms at one pollution percentage and
+        returns {algorithm: {metric: value}}.
+    algorithms : list of str
+        Algorithms evaluated at each percentage, each costs one cell.
+    metrics : list of str
+        Metrics whose changes and rankings decide which intervals are refined.
+    coarse_grid : list of float
+        Percentages evaluated in any case.
+    tolerance : float
+        Largest metric change within an interval that is still considered flat, and smallest change of the difference
+        of two algorithms for their ranking to cross.
+    max_cells : int
+        Budget of cells of the whole sweep, the coarse grids are always evaluated and count towards it.
+    min_interval_width : float
+        Intervals narrower than this are not bisected anymore.
+
+    Returns
+    -------
+    dict
+        {sweep: {percentage: {algorithm: {metric: value}}}} for all evaluated percentages.
+    """
+    results = {}
+    for sweep, evaluate_percentage in evaluators.items():
+        results[sweep] = {percentage: evaluate_percentage(percentage) for percentage in coarse_grid}
+    cells = len(evaluators) * len(coarse_grid) * len(algorithms)
+
+    # max-heap of the intervals still to refine, over all sweeps; the order of the sweeps breaks ties
+    order = {sweep: i for i, sweep in enumerate(evaluators)}
+    queue = []
+
+    def push(sweep, lower, upper):
+        if upper - lower < min_interval_width:
+            return
+        priority = _interval_priority(results[sweep][lower], results[sweep][upper], algorithms, metrics, tolerance)
+        if priority is not None:
+            heapq.heappush(queue, (-priority[0], -priority[1], order[sweep], lower, upper, sweep))
+
+    grid = sorted(coarse_grid)
+    for sweep in evaluators:
+        for lower, upper in zip(grid, grid[1:]):
+            push(sweep, lower, upper)
+
+    while queue and cells + len(algorithms) <= max_cells:
+        _, _, _, lower, upper, sweep = heapq.heappop(queue)
+        middle = round((lower + upper) / 2, 4)
+        print("> refining pollution percentages between " + str(lower) + " and " + str(upper) + ": " + str(middle))
+        results[sweep][middle] = evaluators[sweep](middle)
+        cells += len(algorithms)
+        push(sweep, lower, middle)
+        push(sweep, middle, upper)
+
+    if queue:
+        print("> cell budget used up, " + str(len(queue)) + " intervals left unrefined")
+    return results
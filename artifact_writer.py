@@ -0,0 +1,163 @@
+import os
+import queue
+import threading
+import traceback
+from multiprocessing import util
+
+
+"""
+Background writing of artifacts
+
+Rendering a Petri net shells out to graphviz and writing PNML or XES files waits for the disk, neither of which the
+sweeps need to wait for. An ArtifactWriter runs such writes on a background thread, in the order they were submitted.
+A write to a path that is still waiting replaces the waiting one, so a path overwritten in every cell of a sweep is
+only written as often as the writer keeps up.
+
+Controls (see configure):
+    enabled         False skips all artifact writes
+    background      False writes synchronously, as before
+    sample_rate     fraction of the sampled writes (the visualizations) that is carried out; the choice is made by
+                    counting, so it does not draw from the random number generators seeded for the pollution
+
+The objects handed to a write must not be modified afterwards. Waiting writes are completed when the process exits,
+also in the worker processes of replicates.py and memory_scheduler.py; flush waits for them explicitly. Errors of
+background writes are printed and do not stop the sweep.
+"""
+
+
+# the writer of this process, see get_writer
+_WRITER = None
+_SETTINGS = {'enabled': True, 'background': True, 'sample_rate': 1.0}
+
+
+class ArtifactWriter:
+
+    def __init__(self, enabled=True, background=True, sample_rate=1.0):
+        self.enabled = enabled
+        self.background = background
+        self.sample_rate = sample_rate
+        self.errors = []
+        self._sampled = {}      # kind -> (submitted, carried out)
+        self._pending = {}      # path -> (function, args, kwargs)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self.pid = os.getpid()
+
+    def _take(self, kind):
+        # carries out the next sampled write of a kind if that keeps the carried-out fraction at most sample_rate
+        submitted, carried_out = self._sampled.get(kind, (0, 0))
+        submitted += 1
+        take = carried_out < submitted * self.sample_rate
+        self._sampled[kind] = (submitted, carried_out + take)
+        return take
+
+    def submit(self, path, function, *args, sampled=None, **kwargs):
+        """
+        Writes path by calling function(*args, **kwargs). sampled is the kind of the write if it is subject to
+        sample_rate (e.g. 'petri_net_view'), None if it is always carried out.
+        """
+        if not self.enabled or (sampled is not None and not self._take(sampled)):
+            return
+        if not self.background:
+            function(*args, **kwargs)
+            return
+
+        with self._lock:
+            replaced = path in self._pending
+            self._pending[path] = (function, args, kwargs)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, daemon=True)
+                self._thread.start()
+        if not replaced:
+            self._queue.put(path)
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            with self._lock:
+                function, args, kwargs = self._pending.pop(path)
+            try:
+                function(*args, **kwargs)
+            except Exception:
+                self.errors.append((path, traceback.format_exc()))
+                print("Writing " + path + " failed:\n" + self.errors[-1][1])
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Waits until all submitted writes are done
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+
+def configure(enabled=None, background=None, sample_rate=None):
+    """
+    Changes the settings of the writers of this process (None keeps a setting)
+    """
+    for name, value in [('enabled', enabled), ('background', background), ('sample_rate', sample_rate)]:
+        if value is not None:
+            _SETTINGS[name] = value
+            if _WRITER is not None:
+                setattr(_WRITER, name, value)
+
+
+def get_writer():
+    """
+    Returns the writer of this process, a forked process gets its own one
+    """
+    global _WRITER
+    if _WRITER is None or _WRITER.pid != os.getpid():
+        _WRITER = ArtifactWriter(**_SETTINGS)
+        # finalizers run at the exit of the main process and of multiprocessing workers alike
+        util.Finalize(_WRITER, _WRITER.flush, exitpriority=10)
+    return _WRITER
+
+
+def flush():
+    if _WRITER is not None and _WRITER.pid == os.getpid():
+        _WRITER.flush()
+
+
+def _make_directory(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def _save_petri_net_view(net, im, fm, path):
+    import pm4py
+
+    _make_directory(path)
+    pm4py.save_vis_petri_net(net, im, fm, file_path=path)
+
+
+def _write_pnml(net, im, fm, path):
+    import pm4py
+
+    _make_directory(path)
+    pm4py.write_pnml(net, im, fm, path)
+
+
+def _write_xes(log, path):
+    import pm4py
+
+    _make_directory(path)
+    pm4py.write_xes(log, path)
+
+
+def save_petri_net_view(net, im, fm, path):
+    """
+    Renders a Petri net to an image file, sampled
+    """
+    get_writer().submit(path, _save_petri_net_view, net, im, fm, path, sampled='petri_net_view')
+
+
+def write_pnml(net, im, fm, path):
+    get_writer().submit(path, _write_pnml, net, im, fm, path)
+
+
+def write_xes(log, path):
+    get_writer().submit(path, _write_xes, log, path)
@@ -0,0 +1,171 @@
+import multiprocessing
+import os
+import resource
+import signal
+import time
+import traceback
+from collections import Counter
+
+from pm4py.objects.log.obj import EventLog
+
+import memory_scheduler
+
+
+"""
+Wall-clock and memory budgets of discovery and conformance calls
+
+ILP discovery and alignments can run for hours on some polluted logs, and neither can be interrupted from within
+Python once it is inside a solver or a search. run calls a function in a subprocess forked from the calling process,
+which inherits the logs and models the function needs, and kills it (with the processes it started, e.g. the pool of
+the alignments) once the time budget is used up. The memory budget caps the address space the subprocess may add to
+what it inherited, so an exploding search fails with MemoryError in the subprocess instead of taking the machine.
+The result is sent back to the calling process pickled.
+
+A CellBudget is the budget of one sweep cell, one algorithm discovered on a polluted log and evaluated: its calls
+share the time budget, and the wall-clock time of every call is recorded, including the call that exceeded the
+budget. A call that exceeds the budget raises BudgetExceeded with its status:
+
+    timeout     the time budget was used up, the subprocess was killed
+    memory      the subprocess ran out of its memory budget
+    died        the subprocess ended without a result (e.g. killed by the out-of-memory killer)
+
+Exceptions raised by the function itself are raised again as RuntimeError with the traceback of the subprocess.
+Without budgets, or where fork is not available, functions are called directly. The peak memory of a subprocess
+counts towards the stage of memory_scheduler it runs in.
+"""
+
+
+class BudgetExceeded(Exception):
+
+    def __init__(self, status, seconds):
+        super().__init__(f"Budget exceeded ({status}) after {seconds:.1f}s")
+        self.status = status
+        self.seconds = seconds
+        # name of the CellBudget call that exceeded the budget
+        self.call = None
+
+
+def _run_child(sender, function, args, kwargs, max_memory_mb):
+    # the subprocess leads a process group of its own, so that killing the group also kills the processes it started
+    os.setpgid(0, 0)
+    memory_scheduler.start_subprocess()
+    if max_memory_mb is not None:
+        limit = int(((memory_scheduler._status_mb('VmSize') or 0.0) + max_memory_mb) * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        outcome = ('ok', function(*args, **kwargs))
+    except MemoryError:
+        outcome = ('memory', None)
+    except Exception:
+        outcome = ('error', traceback.format_exc())
+    try:
+        sender.send(outcome + (memory_scheduler.cell_peak_mb(),))
+    except MemoryError:
+        sender.send(('memory', None, None))
+    except Exception:
+        sender.send(('error', traceback.format_exc(), None))
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        process.kill()
+
+
+def run(function, *args, max_seconds=None, max_memory_mb=None, **kwargs):
+    """
+    Calls function(*args, **kwargs) in a forked subprocess within max_seconds of wall-clock time and max_memory_mb of
+    memory (None disables a budget) and returns its result. Raises BudgetExceeded if a budget is exceeded.
+    """
+    if max_seconds is None and max_memory_mb is None or 'fork' not in multiprocessing.get_all_start_methods():
+        return function(*args, **kwargs)
+    if max_seconds is not None and max_seconds <= 0:
+        raise BudgetExceeded('timeout', 0.0)
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    start = time.perf_counter()
+    process = context.Process(target=_run_child, args=(sender, function, args, kwargs, max_memory_mb))
+    process.start()
+    sender.close()
+    status = None
+    try:
+        if receiver.poll(max_seconds):
+            try:
+                status, payload, peak = receiver.recv()
+            except EOFError:
+                status, payload, peak = 'died', None, None
+        else:
+            status, payload, peak = 'timeout', None, None
+    finally:
+        if process.is_alive() and status != 'ok':
+            _kill_group(process)
+        process.join()
+        receiver.close()
+    seconds = time.perf_counter() - start
+
+    memory_scheduler.report_peak(peak)
+    if status == 'error':
+        raise RuntimeError("Budgeted call failed:\n" + payload)
+    if status != 'ok':
+        raise BudgetExceeded(status, seconds)
+    return payload
+
+
+class CellBudget:
+    """
+    Time and memory budget shared by the calls of one sweep cell, see call
+    """
+
+    def __init__(self, max_seconds=None, max_memory_mb=None):
+        self.max_seconds = max_seconds
+        self.max_memory_mb = max_memory_mb
+        self.seconds = {}   # call name -> wall-clock seconds
+        self.restart()
+
+    @property
+    def enabled(self):
+        return self.max_seconds is not None or self.max_memory_mb is not None
+
+    def restart(self):
+        """
+        Starts the time budget anew, e.g. for a retry
+        """
+        self._started = time.perf_counter()
+
+    def remaining(self):
+        if self.max_seconds is None:
+            return None
+        return self.max_seconds - (time.perf_counter() - self._started)
+
+    def call(self, name, function, *args, **kwargs):
+        """
+        Calls function(*args, **kwargs) within what is left of the budget (see run), recording its time as name
+        """
+        start = time.perf_counter()
+        try:
+            return run(function, *args, max_seconds=self.remaining(), max_memory_mb=self.max_memory_mb, **kwargs)
+        except BudgetExceeded as exceeded:
+            exceeded.call = name
+            raise
+        finally:
+            self.seconds[name] = time.perf_counter() - start
+
+
+def reduce_to_frequent_variants(log, coverage):
+    """
+    Returns an EventLog with the traces of the most frequent variants of the log that together cover at least the
+    given fraction of its traces. The traces are shared with the log, not copied.
+    """
+    variants = [tuple(event['concept:name'] for event in trace) for trace in log]
+    kept = set()
+    covered = 0
+    for variant, count in Counter(variants).most_common():
+        if covered >= coverage * len(log):
+            break
+        kept.add(variant)
+        covered += count
+    return EventLog([trace for trace, variant in zip(log, variants) if variant in kept], attributes=log.attributes,
+                    extensions=log.extensions, omni_present=log.omni_present, classifiers=log.classifiers,
+                    properties=log.properties)
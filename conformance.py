@@ -0,0 +1,596 @@
+import hashlib
+import math
+import os
+import random
+import signal
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+from pm4py.algo.conformance.alignments.petri_net import algorithm as alignments
+from pm4py.algo.evaluation.precision.variants import align_etconformance
+from pm4py.algo.evaluation.replay_fitness.variants import alignment_based as alignment_fitness
+from pm4py.objects.log.obj import Event, Trace
+from pm4py.objects.petri_net.obj import Marking
+from pm4py.objects.petri_net.utils import align_utils, check_soundness
+from pm4py.objects.petri_net.utils.align_utils import get_visible_transitions_eventually_enabled_by_marking
+from pm4py.util import exec_utils
+
+import token_replay_engine
+
+
+"""
+Model evaluation used by run_pipeline and the sweep scripts
+
+Supported evaluation methods:
+    tbr         token-based replay (compiled replay engine, same results as pm4py)
+    sampled     token-based replay of the frequent variants and a sample of the rare ones, with confidence intervals
+    alignments  variant-based alignments, cached per (variant, model) and computed in a process pool
+"""
+
+
+EVALUATION_METHODS = ["tbr", "sampled", "alignments"]
+
+# suffix of the fitness and precision result columns per evaluation method
+METRIC_SUFFIXES = {"tbr": "tbr", "sampled": "tbr", "alignments": "alignments"}
+
+# diagnostics of the evaluation methods, carried by the fitness dictionary returned by evaluate besides pm4py's keys
+DIAGNOSTICS = {"tbr": [], "sampled": ["sample_size", "ci_fitness", "ci_precision", "ci_generalization"],
+               "alignments": ["timed_out_traces", "timed_out_prefix_weight"]}
+
+# default budgets for a single variant (or prefix) alignment
+MAX_ALIGN_TIME_VARIANT = 10.0   # seconds
+MAX_ALIGN_MEMORY_MB = None      # bounds the state space a worker may explore, None disables the limit
+
+# defaults of the sampled evaluation
+SAMPLE_TARGET_ERROR = 0.01      # half-width of the confidence intervals to reach
+SAMPLE_CONFIDENCE = 0.95
+SAMPLE_INITIAL_SIZE = 500       # traces
+SAMPLE_MAX_GROWTH = 4.0         # factor by which the sample may grow per round
+SAMPLE_MAX_FRACTION = 0.2       # of the traces of the log, the sample does not grow beyond it
+
+# alignments computed so far, keyed by model fingerprint and then by (kind, activities), the models used least
+# recently are dropped first. Prefix alignments store their stop markings by the canonical names of the model places
+# (see get_canonical_names), so a model discovered again with other node names reuses them.
+_ALIGNMENT_CACHE = {}
+ALIGNMENT_CACHE_SIZE = 8        # models
+
+# (net, im, fm, model fingerprint, compiled net) of the nets most recently compiled for token-based replay, see
+# get_compiled_net
+_COMPILED_NETS = []
+COMPILED_NETS_CACHE_SIZE = 32
+
+# model and budgets of the current worker process, set by _init_alignment_worker
+_WORKER_MODEL = None
+_WORKER_MAX_TIME = None
+# whether the alignment timer of the worker may still interrupt the search, cleared before the timer is disarmed
+_ALARM_ARMED = False
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+def get_canonical_names(net, im, fm):
+    """
+    Names of the places and transitions of a Petri net that only depend on the labels of the transitions, the arcs and
+    the markings, not on the names pm4py gives the nodes (the inductive miner draws new ones for every discovery).
+    The names are refined from the labels and the markings along the arcs until they stop telling more nodes apart.
+    Returns {node: name}, or None if some nodes are still not told apart (e.g. two invisible transitions between the
+    same places).
+    """
+    names = {t: repr(('t', t.label)) for t in net.transitions}
+    names.update({p: repr(('p', im.get(p, 0), fm.get(p, 0))) for p in net.places})
+    distinct = len(set(names.values()))
+    while True:
+        names = {node: hashlib.sha1(repr((name, sorted((names[a.source], a.weight) for a in node.in_arcs),
+                                          sorted((names[a.target], a.weight) for a in node.out_arcs))).encode()).hexdigest()
+                 for node, name in names.items()}
+        refined = len(set(names.values()))
+        if refined == distinct:
+            break
+        distinct = refined
+    if distinct < len(names):
+        return None
+    return names
+
+
+def get_model_fingerprint(net, im, fm, names=None):
+    """
+    Returns a hash of the structure of a Petri net and its markings, used as cache key for alignments. Nets with the
+    same structure by label get the same hash whatever the names of their nodes, if get_canonical_names (whose result
+    may be passed as names) tells all their nodes apart; otherwise the hash depends on the names of the nodes.
+    """
+    if names is None:
+        names = get_canonical_names(net, im, fm)
+    if names is None:
+        names = {node: node.name for node in list(net.places) + list(net.transitions)}
+        kind = 'names'
+    else:
+        kind = 'labels'
+    transitions = sorted((str(names[t]), str(t.label)) for t in net.transitions)
+    places = sorted(str(names[p]) for p in net.places)
+    arcs = sorted((str(names[a.source]), str(names[a.target]), a.weight) for a in net.arcs)
+    initial = sorted((str(names[p]), count) for p, count in im.items())
+    final = sorted((str(names[p]), count) for p, count in fm.items())
+    return kind + ':' + hashlib.sha1(repr((transitions, places, arcs, initial, final)).encode()).hexdigest()
+
+
+def get_compiled_net(net, im, fm):
+    """
+    Returns the net compiled for token-based replay (see token_replay_engine.py), compiling it at the first request.
+    Nets are recognised by identity, as the compiled net refers to the places and transitions of the net and replays
+    in the order of their names; it is compiled again if the structure of the net changed since.
+    """
+    model_fingerprint = get_model_fingerprint(net, im, fm)
+    for i, (compiled_net, compiled_im, compiled_fm, compiled_fingerprint, compiled) in enumerate(_COMPILED_NETS):
+        if compiled_net is net and compiled_im == im and compiled_fm == fm:
+            del _COMPILED_NETS[i]
+            if compiled_fingerprint == model_fingerprint:
+                _COMPILED_NETS.append((net, compiled_im, compiled_fm, model_fingerprint, compiled))
+                return compiled
+            break
+    compiled = token_replay_engine.compile_net(net, im, fm)
+    _COMPILED_NETS.append((net, Marking(im), Marking(fm), model_fingerprint, compiled))
+    if len(_COMPILED_NETS) > COMPILED_NETS_CACHE_SIZE:
+        _COMPILED_NETS.pop(0)
+    return compiled
+
+
+def prepare(log, net, im, fm):
+    """
+    Builds the log index and the compiled net evaluate uses on the log and model ahead of it, e.g. before evaluating
+    in a forked subprocess (see cell_budget.py), which then inherits them instead of building its own and losing it
+    when it ends
+    """
+    token_replay_engine.get_log_index(log)
+    get_compiled_net(net, im, fm)
+
+
+def _model_alignments(model_fingerprint):
+    # alignments cached for the model, marked as used most recently
+    alignments_of_model = _ALIGNMENT_CACHE.pop(model_fingerprint, None)
+    if alignments_of_model is None:
+        alignments_of_model = {}
+        if len(_ALIGNMENT_CACHE) >= ALIGNMENT_CACHE_SIZE:
+            del _ALIGNMENT_CACHE[next(iter(_ALIGNMENT_CACHE))]
+    _ALIGNMENT_CACHE[model_fingerprint] = alignments_of_model
+    return alignments_of_model
+
+
+def get_variants(log):
+    """
+    Returns a Counter mapping each variant (tuple of activity labels) of the log to its frequency
+    """
+    return Counter(tuple(e['concept:name'] for e in tr) for tr in log)
+
+
+def _variant_to_trace(activities):
+    trace = Trace()
+    for activity in activities:
+        trace.append(Event({'concept:name': activity}))
+    return trace
+
+
+def _on_alarm(signum, frame):
+    global _ALARM_ARMED
+    # an alarm arriving while the timer is disarmed has nothing left to interrupt
+    if _ALARM_ARMED:
+        _ALARM_ARMED = False
+        raise _BudgetExceeded()
+
+
+def _init_alignment_worker(net, im, fm, best_worst_cost, max_time, max_memory_mb):
+    global _WORKER_MODEL, _WORKER_MAX_TIME
+    _WORKER_MODEL = (net, im, fm, best_worst_cost)
+    _WORKER_MAX_TIME = max_time
+
+    if max_memory_mb is not None:
+        # the search state space is what blows up memory, so capping the worker's address space caps the state space
+        import resource
+        limit = int(max_memory_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _align(kind, activities):
+    """
+    Aligns a single variant (kind 'variant') or prefix (kind 'prefix') on the model of the current worker.
+    Returns a tuple (kind, activities, status, result), status is one of 'ok', 'timeout' or 'memory'
+    """
+    net, im, fm, best_worst_cost = _WORKER_MODEL
+    trace = _variant_to_trace(activities)
+
+    # pm4py only checks the time budget of the fitness alignment cooperatively, a timer enforces it for both searches
+    global _ALARM_ARMED
+    use_timer = hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+    status, result = 'ok', None
+    try:
+        # an alarm firing at any point until the timer is disarmed, also in the finally, ends up in the outer except
+        try:
+            if use_timer:
+                previous_handler = signal.signal(signal.SIGALRM, _on_alarm)
+                _ALARM_ARMED = True
+                signal.setitimer(signal.ITIMER_REAL, _WORKER_MAX_TIME)
+            if kind == 'variant':
+                # same computation as pm4py's alignments.apply_trace, but with the best worst cost computed once per model
+                parameters = {alignments.Parameters.PARAM_MAX_ALIGN_TIME_TRACE: _WORKER_MAX_TIME}
+                result = exec_utils.get_variant(alignments.DEFAULT_VARIANT).apply(trace, net, im, fm, parameters=parameters)
+                if result is None:
+                    status = 'timeout'
+                else:
+                    trace_cost_function = exec_utils.get_param_value(alignments.Parameters.PARAM_TRACE_COST_FUNCTION,
+                                                                     parameters, [])
+                    ltrace_bwc = sum(trace_cost_function) + best_worst_cost
+                    fitness_den = ltrace_bwc // align_utils.STD_MODEL_LOG_MOVE_COST
+                    result['fitness'] = 1 - (result['cost'] // align_utils.STD_MODEL_LOG_MOVE_COST) / fitness_den if fitness_den > 0 else 0
+                    result['bwc'] = ltrace_bwc
+            else:
+                # markings of the sync net in which the prefix alignments stop, stored by place name for pickling
+                stop_markings = align_etconformance.__align_trace_stop_marking(trace, net, im, fm)
+                result = None if stop_markings is None else [{(pl.name[0], pl.name[1]): count for pl, count in m.items()}
+                                                              for m in stop_markings]
+        finally:
+            if use_timer:
+                _ALARM_ARMED = False
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous_handler)
+    except _BudgetExceeded:
+        status, result = 'timeout', None
+    except MemoryError:
+        status, result = 'memory', None
+
+    return kind, activities, status, result
+
+
+def _align_all(tasks, net, im, fm, processes, max_time, max_memory_mb):
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if not tasks:
+        return []
+
+    best_worst_cost = exec_utils.get_variant(alignments.DEFAULT_VARIANT).get_best_worst_cost(net, im, fm)
+
+    if processes <= 1 or len(tasks) <= 1:
+        # the memory budget is only enforced in worker processes, never on the calling process
+        _init_alignment_worker(net, im, fm, best_worst_cost, max_time, None)
+        return [_align(kind, activities) for kind, activities in tasks]
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_alignment_worker,
+                             initargs=(net, im, fm, best_worst_cost, max_time, max_memory_mb)) as executor:
+        futures = [executor.submit(_align, kind, activities) for kind, activities in tasks]
+        return [future.result() for future in futures]
+
+
+def evaluate_alignments(log, net, im, fm, processes=None, max_align_time_variant=MAX_ALIGN_TIME_VARIANT,
+                        max_align_memory_mb=MAX_ALIGN_MEMORY_MB):
+    """
+    Alignment-based fitness and precision of a log on a model, computing one alignment per distinct variant
+    (and per distinct prefix for precision) instead of one per trace.
+
+    Parameters
+    ----------
+    log : EventLog
+        The event log.
+    net, im, fm :
+        Petri net with initial and final marking.
+    processes : int, optional
+        Number of worker processes, defaults to the number of cores. 1 computes everything in this process.
+    max_align_time_variant : float
+        Time budget in seconds for the alignment of a single variant or prefix.
+    max_align_memory_mb : float, optional
+        Memory budget of a worker process, which bounds the explored state space of a single alignment.
+
+    Returns
+    -------
+    dict
+        'fitness' (same dictionary as pm4py.fitness_alignments), 'precision' (as pm4py.precision_alignments),
+        'timed_out_variants' and 'timed_out_prefixes' (lists of (activities, reason) whose alignment exceeded a budget),
+        'timed_out_traces' (share of the traces whose variant has no alignment) and 'timed_out_prefix_weight' (share
+        of the prefix occurrences without alignment).
+        Both metrics are partial if a budget was exceeded: variants without alignment are left out of the fitness and
+        prefixes without alignment out of the precision, which biases them towards the variants that align quickly.
+    """
+    if not check_soundness.check_easy_soundness_net_in_fin_marking(net, im, fm):
+        raise ValueError("alignment-based precision needs an easy sound Petri net")
+
+    names = get_canonical_names(net, im, fm)
+    cached = _model_alignments(get_model_fingerprint(net, im, fm, names))
+    # stop markings are cached by the canonical names of the places, or by their names if there are none
+    place_keys = {p.name: (p.name if names is None else names[p]) for p in net.places}
+    variants = get_variants(log)
+
+    # same prefixes as pm4py's Align-ETConformance, derived from the variants and weighted by their frequency
+    prefixes = {}
+    prefix_count = Counter()
+    for variant, count in variants.items():
+        for i in range(1, len(variant)):
+            prefixes.setdefault(variant[:i], set()).add(variant[i])
+            prefix_count[variant[:i]] += count
+
+    tasks = [('variant', v) for v in variants] + [('prefix', p) for p in prefixes]
+    tasks = [task for task in tasks if task not in cached]
+
+    timed_out = {'variant': [], 'prefix': []}
+    for kind, activities, status, result in _align_all(tasks, net, im, fm, processes, max_align_time_variant,
+                                                       max_align_memory_mb):
+        if status == 'ok':
+            if kind == 'prefix' and result is not None:
+                result = [{(trace_place, place_keys.get(model_place, model_place)): count
+                           for (trace_place, model_place), count in stop_marking.items()}
+                          for stop_marking in result]
+            cached[(kind, activities)] = result
+        else:
+            timed_out[kind].append((activities, status))
+
+    # fitness, every trace gets the alignment of its variant
+    aligned_traces = []
+    for variant, count in variants.items():
+        aligned_traces += [cached.get(('variant', variant))] * count
+    fitness = alignment_fitness.evaluate(aligned_traces)
+
+    # precision, escaping edges of the markings reached by the prefix alignments
+    places = {place_keys[p.name]: p for p in net.places}
+    sum_at = 0
+    sum_ee = 0
+    for prefix, next_activities in prefixes.items():
+        stop_markings = cached.get(('prefix', prefix))
+        if stop_markings is None:
+            continue
+        activated_transitions_labels = set()
+        for stop_marking in stop_markings:
+            marking = Marking()
+            for (trace_place, model_place), count in stop_marking.items():
+                if trace_place == align_utils.SKIP:
+                    marking[places[model_place]] = count
+            activated_transitions_labels |= set(x.label for x in get_visible_transitions_eventually_enabled_by_marking(net, marking)
+                                                if x.label is not None)
+        sum_at += len(activated_transitions_labels) * prefix_count[prefix]
+        sum_ee += len(activated_transitions_labels.difference(next_activities)) * prefix_count[prefix]
+
+    # the empty prefix is counted as well
+    start_activities = set(variant[0] for variant in variants if len(variant) > 0)
+    trans_en_ini_marking = set(x.label for x in get_visible_transitions_eventually_enabled_by_marking(net, im))
+    sum_at += len(log) * len(trans_en_ini_marking)
+    sum_ee += len(log) * len(trans_en_ini_marking.difference(start_activities))
+    precision = 1 - float(sum_ee) / float(sum_at) if sum_at > 0 else 1.0
+
+    timed_out_prefix_weight = sum(prefix_count[prefix] for prefix, _ in timed_out['prefix'])
+    return {'fitness': fitness,
+            'precision': precision,
+            'timed_out_variants': timed_out['variant'],
+            'timed_out_prefixes': timed_out['prefix'],
+            'timed_out_traces': sum(variants[variant] for variant, _ in timed_out['variant']) / len(log) if log else 0.0,
+            'timed_out_prefix_weight': timed_out_prefix_weight / sum(prefix_count.values()) if prefix_count else 0.0}
+
+
+def _split_variants(index, initial_sample_size):
+    """
+    Splits the variants of a LogIndex into the frequent ones, each of which would get at least one trace of a
+    proportional sample of initial_sample_size traces, and the rare ones. Returns ({frequent variant: count}, indices
+    of the traces of rare variants). There are at most initial_sample_size frequent variants.
+    """
+    threshold = len(index) / initial_sample_size
+    frequent = {variant: count for variant, count in index.variants.items() if count >= threshold}
+    rare_traces = [i for i, variant in enumerate(index.trace_variants) if variant not in frequent]
+    return frequent, rare_traces
+
+
+def _variant_terms(variant, index, compiled, prefix_terms):
+    """
+    What a trace of the variant contributes to the token-based metrics: (trace is fit, trace fitness, missing,
+    consumed, remaining, produced, Counter of the activated transitions, activated transitions and escaping edges of
+    its prefixes following pm4py's ET Conformance). The continuations observed after each prefix are taken from the
+    LogIndex of the whole log, prefix_terms caches the replayed prefixes.
+    """
+    is_fit, trace_fitness, activated, _, _, missing, consumed, remaining, produced = compiled.replay(
+        compiled.encode(variant))
+
+    # the empty prefix is counted for every trace
+    trans_en_ini_marking = set(x.label for x in compiled.enabled_visible_transitions(compiled.initial_marking))
+    at = len(trans_en_ini_marking)
+    ee = len(trans_en_ini_marking.difference(index.start_activities))
+    for i in range(1, len(variant)):
+        prefix = variant[:i]
+        if prefix not in prefix_terms:
+            prefix_terms[prefix] = (0, 0)
+            is_prefix_fit, _, _, _, reached_marking, _, _, _, _ = compiled.replay(
+                compiled.encode(prefix), consider_remaining_in_fitness=False,
+                try_to_reach_final_marking_through_hidden=False, stop_immediately_unfit=True)
+            if is_prefix_fit:
+                enabled = set(x.label for x in compiled.enabled_visible_transitions(reached_marking) if x.label is not None)
+                prefix_terms[prefix] = (len(enabled), len(enabled.difference(index.follow_set(prefix))))
+        at += prefix_terms[prefix][0]
+        ee += prefix_terms[prefix][1]
+    return is_fit, trace_fitness, missing, consumed, remaining, produced, Counter(activated), at, ee
+
+
+def _weighted_metrics(weights, terms, no_transitions):
+    """
+    Token-based fitness (dictionary as pm4py.fitness_token_based_replay), precision and generalization of traces
+    weighted by variant, as (fitness, precision, generalization, totals used for the linearized variances)
+    """
+    no_traces = sum(weights.values())
+    fit_traces = sum_of_fitness = total_m = total_c = total_r = total_p = sum_at = sum_ee = 0.0
+    trans_occ_map = Counter()
+    for variant, weight in weights.items():
+        is_fit, trace_fitness, missing, consumed, remaining, produced, activated, at, ee = terms[variant]
+        fit_traces += weight * is_fit
+        sum_of_fitness += weight * trace_fitness
+        total_m += weight * missing
+        total_c += weight * consumed
+        total_r += weight * remaining
+        total_p += weight * produced
+        sum_at += weight * at
+        sum_ee += weight * ee
+        for t, count in activated.items():
+            trans_occ_map[t] += weight * count
+
+    fitness = {"perc_fit_traces": 0.0, "average_trace_fitness": 0.0, "log_fitness": 0,
+               "percentage_of_fitting_traces": 0.0}
+    if no_traces > 0 and total_c > 0 and total_p > 0:
+        fitness["perc_fit_traces"] = fitness["percentage_of_fitting_traces"] = 100.0 * fit_traces / no_traces
+        fitness["average_trace_fitness"] = sum_of_fitness / no_traces
+        fitness["log_fitness"] = 0.5 * (1 - total_m / total_c) + 0.5 * (1 - total_r / total_p)
+    precision = 1 - sum_ee / sum_at if sum_at > 0 else 1.0
+    if no_transitions == 0:
+        generalization = 1.0
+    else:
+        inv_sq_occ_sum = sum(1.0 / math.sqrt(occ) for occ in trans_occ_map.values())
+        inv_sq_occ_sum += no_transitions - len(trans_occ_map)
+        generalization = 1.0 - inv_sq_occ_sum / no_transitions
+    return fitness, precision, generalization, (no_traces, sum_at, sum_ee, trans_occ_map)
+
+
+def _half_widths(sample_counts, sample_size, population_size, terms, totals, no_transitions, z):
+    """
+    Half-widths of the confidence intervals of the three metrics from the variance of the estimated totals over the
+    sampled stratum (simple random sampling without replacement), precision and generalization being linearized
+    around the estimates
+    """
+    no_traces, sum_at, sum_ee, trans_occ_map = totals
+    linearized = {}
+    for variant in sample_counts:
+        _, trace_fitness, _, _, _, _, activated, at, ee = terms[variant]
+        precision_value = (ee - sum_ee / sum_at * at) / sum_at if sum_at > 0 else 0.0
+        generalization_value = (sum(count * 0.5 * trans_occ_map[t] ** -1.5 for t, count in activated.items())
+                                / no_transitions if no_transitions > 0 else 0.0)
+        linearized[variant] = {'fitness': trace_fitness / no_traces, 'precision': precision_value,
+                               'generalization': generalization_value}
+
+    half_widths = {}
+    for metric in ['fitness', 'precision', 'generalization']:
+        if sample_size >= population_size or sample_size < 2:
+            half_widths[metric] = 0.0 if sample_size >= population_size else float('inf')
+            continue
+        mean = sum(count * linearized[variant][metric] for variant, count in sample_counts.items()) / sample_size
+        variance = sum(count * (linearized[variant][metric] - mean) ** 2
+                       for variant, count in sample_counts.items()) / (sample_size - 1)
+        total_variance = population_size ** 2 * (1 - sample_size / population_size) * variance / sample_size
+        half_widths[metric] = z * math.sqrt(total_variance)
+    return half_widths
+
+
+def evaluate_sampled(log, net, im, fm, target_error=SAMPLE_TARGET_ERROR, confidence=SAMPLE_CONFIDENCE,
+                     initial_sample_size=SAMPLE_INITIAL_SIZE, max_growth=SAMPLE_MAX_GROWTH,
+                     max_fraction=SAMPLE_MAX_FRACTION):
+    """
+    Token-based fitness, precision and generalization estimated from a sample of the log, stratified by variant.
+    Traces of the same variant replay the same, so the frequent variants (at most initial_sample_size of them) are
+    replayed once each and weighted exactly. Only the traces of the rare variants are sampled, as one stratum, and the
+    confidence intervals follow from the variance of that stratum. The sample grows, at most by max_growth per round,
+    until the intervals of all three metrics are narrower than +-target_error or it holds max_fraction of the traces
+    of the log, so the replay cost depends on the requested accuracy rather than on the size of the log.
+
+    Parameters
+    ----------
+    log : EventLog
+        The event log.
+    net, im, fm :
+        Petri net with initial and final marking.
+    target_error : float
+        Half-width of the confidence intervals to reach.
+    confidence : float
+        Confidence level of the intervals.
+    initial_sample_size : int
+        Number of traces of the first sample, also deciding which variants are frequent.
+    max_growth : float
+        Factor by which the sample may grow per round.
+    max_fraction : float
+        Fraction of the traces of the log at which the sample stops growing, even if the target is not reached.
+
+    Returns
+    -------
+    dict
+        'fitness' (same dictionary as pm4py.fitness_token_based_replay), 'precision', 'generalization',
+        'confidence_intervals' (metric -> (lower, upper), metric being 'fitness' (average trace fitness),
+        'precision' or 'generalization'), 'half_widths' (metric -> half-width of its interval), 'sample_size'
+        (sampled traces of rare variants), 'exact_variants' (frequent variants replayed once each) and
+        'target_reached'. If all rare traces are sampled, the metrics equal those of pm4py and the intervals have
+        width 0.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    compiled = get_compiled_net(net, im, fm)
+    index = token_replay_engine.get_log_index(log)
+    no_transitions = len(compiled.transitions)
+
+    frequent, rare_traces = _split_variants(index, initial_sample_size)
+    random.shuffle(rare_traces)
+    max_sample_size = min(len(rare_traces), max(initial_sample_size, math.ceil(max_fraction * len(index))))
+    sample_size = min(max_sample_size, initial_sample_size)
+
+    prefix_terms = {}
+    terms = {variant: _variant_terms(variant, index, compiled, prefix_terms) for variant in frequent}
+    while True:
+        # the samples of the rounds are nested, every round only replays the variants it adds
+        sample_counts = Counter(index.trace_variants[i] for i in rare_traces[:sample_size])
+        for variant in sample_counts:
+            if variant not in terms:
+                terms[variant] = _variant_terms(variant, index, compiled, prefix_terms)
+
+        weights = dict(frequent)
+        for variant, count in sample_counts.items():
+            weights[variant] = count * len(rare_traces) / sample_size
+        fitness, precision, generalization, totals = _weighted_metrics(weights, terms, no_transitions)
+        half_widths = _half_widths(sample_counts, sample_size, len(rare_traces), terms, totals, no_transitions, z)
+
+        worst = max(half_widths.values())
+        if worst <= target_error or sample_size >= max_sample_size:
+            break
+        # the width shrinks with the square root of the sample size
+        growth = max_growth if target_error <= 0 else min(max_growth, 1.1 * (worst / target_error) ** 2)
+        sample_size = min(max_sample_size, math.ceil(sample_size * growth))
+
+    estimates = {'fitness': fitness['average_trace_fitness'], 'precision': precision, 'generalization': generalization}
+    return {'fitness': fitness,
+            'precision': precision,
+            'generalization': generalization,
+            'confidence_intervals': {metric: (estimates[metric] - half_widths[metric],
+                                              estimates[metric] + half_widths[metric]) for metric in estimates},
+            'half_widths': half_widths,
+            'sample_size': sample_size,
+            'exact_variants': len(frequent),
+            'target_reached': worst <= target_error}
+
+
+def evaluate(log, net, im, fm, method="tbr", **parameters):
+    """
+    Fitness, precision and generalization of a log on a model with the given evaluation method.
+    Returns a tuple (fitness, precision, generalization), fitness being the dictionary returned by pm4py.
+    Generalization is always computed with token-based replay, as pm4py offers no alignment-based variant.
+    The log-side preprocessing of token-based replay is done once per log (see token_replay_engine.get_log_index), so
+    evaluating the same log object on many models only replays it.
+    The sampled method prints the sample size and the confidence intervals of its estimates.
+    The fitness dictionary also holds the DIAGNOSTICS of the method: for sampled, the sample size and the half-widths
+    of the confidence intervals; for alignments, the share of the traces and of the prefix occurrences whose alignment
+    exceeded the budget and is missing from the (then partial) metrics.
+    """
+    compiled = get_compiled_net(net, im, fm)
+    if method == "tbr":
+        # one replay for all three metrics
+        return token_replay_engine.evaluate(log, compiled)
+    elif method == "sampled":
+        result = evaluate_sampled(log, net, im, fm, **parameters)
+        print("> " + str(result['exact_variants']) + " frequent variants replayed, sampled " + str(result['sample_size'])
+              + " of " + str(len(log)) + " traces, confidence intervals: "
+              + ", ".join(metric + " [{:.4f}, {:.4f}]".format(*ci) for metric, ci in result['confidence_intervals'].items())
+              + ("" if result['target_reached'] else " (target error not reached)"))
+        fitness = result['fitness']
+        fitness['sample_size'] = result['sample_size']
+        fitness.update({'ci_' + metric: half_width for metric, half_width in result['half_widths'].items()})
+        return fitness, result['precision'], result['generalization']
+    elif method == "alignments":
+        result = evaluate_alignments(log, net, im, fm, **parameters)
+        if result['timed_out_variants'] or result['timed_out_prefixes']:
+            print("> WARNING: partial metrics, alignments exceeded the budget for "
+                  + str(len(result['timed_out_variants'])) + " variants ({:.1%} of the traces) and ".format(
+                      result['timed_out_traces']) + str(len(result['timed_out_prefixes']))
+                  + " prefixes ({:.1%} of the prefix occurrences)".format(result['timed_out_prefix_weight']))
+        fitness = result['fitness']
+        fitness.update({key: result[key] for key in DIAGNOSTICS[method]})
+        precision = result['precision']
+    else:
+        raise ValueError(f"Evaluation method '{method}' is not supported.")
+
+    generalization = token_replay_engine.generalization(log, compiled)
+    return fitness, precision, generalization
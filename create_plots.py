@@ -1,9 +1,17 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
 import pandas as pd
 import matplotlib.pyplot as plt
 from itertools import product
 
 from pathlib import Path
 
+import results_store
+
 # here we define some necessary input to generate the plots
 METRICS = ["fitness_tbr", "precision_tbr", "generalization_tbr"]#, "f1-score_tbr"] # metrics we want to plot
 LOG_MODEL_COMB = ['cl-bm', 'cl-cm', 'pl-cm', 'cl-pm', 'pl-pm'] # log-model combination we want to plot
@@ -12,6 +20,14 @@ IGNORE_COLS = ['alien_activity_nr', 'target_precision', 'distribution', 'paramet
                'precise_activity_labels', 'new_activity_label'] # columns in the scenario_results csv files that do not contain
                                                                 # values (typically, parameters of the polluters)
 
+# input of the plot build step and the directory it renders to
+AGGREGATED_RESULTS_PATH = Path('out/sensitivity_results/derived_results/aggregated_results.csv')
+PLOTS_PATH = Path('out/sensitivity_results/plots')
+PLOT_METRICS = METRICS + ['f1-score_tbr']
+PLOT_LOG_MODEL_COMB = ['cl-cm', 'pl-cm', 'cl-pm', 'pl-pm'] # the baseline model (cl-bm) is not plotted
+# file in the plots directory recording the hash of the data each figure was rendered from
+PLOT_HASHES_FILE = '.plot_hashes.json'
+
 # these dictionaries are defined to get clearer titles for the plots
 metrics_labels = {'fitness_tbr': 'fitness', 'precision_tbr': 'precision', 'generalization_tbr': 'generalisation', 'f1-score_tbr': 'f1-score'}
 log_model_comb_labels = {'cl-pm': 'clean log - polluted model', 'pl-cm': 'polluted log - clean model', 'cl-cm': 'clean log - clean model', 'pl-pm': 'polluted log - polluted model'}
@@ -30,150 +46,227 @@ def compute_average_across_dfs(results_path, to_ignore_columns):
     # Get list of all CSV files in the folder
     csv_files = list(results_path.glob("*.csv"))
 
-    # Read all CSVs into a list of DataFrames
-    dfs_list = [pd.read_csv(f) for f in csv_files]
+    # Read all CSVs into one DataFrame, the first index level telling the files apart
+    all_dfs = pd.concat([pd.read_csv(f) for f in csv_files], keys=range(len(csv_files)))
+    first_df = all_dfs.loc[0]
+
+    # numeric columns are averaged row by row across the files, a row missing a value in any file stays empty
+    # -> the behaviour is a bit weird as it also averages the percentage column but result is fine
+    numeric_cols = [col for col in first_df.columns
+                    if col not in to_ignore_columns and pd.api.types.is_numeric_dtype(first_df[col])]
+    averages = all_dfs[numeric_cols].groupby(level=1).sum(min_count=len(csv_files)) / len(csv_files)
 
     # Create an empty DataFrame to store scenario_results
-    result_df = pd.DataFrame()
-
-    # Loop through columns
-    for col in dfs_list[0].columns:
-        if col not in to_ignore_columns:
-            # If column is numeric
-            if pd.api.types.is_numeric_dtype(dfs_list[0][col]):
-                # Average the column across all dataframes
-                # -> the behaviour is a bit weird as it also averages the percentage column but result is fine
-                col_avg = sum(df[col] for df in dfs_list) / len(dfs_list)
-                result_df[col] = col_avg
-            else:
-                # Non-numeric: keep values from the first dataframe (assumes they are identical)
-
-                # unless the column is the pollution pattern, in which case I concatenate its value with the target
-                # precision to fix issues with AggregatedEventLogging /!\ dirty fix
-                if col == 'pollution_pattern':
-                    dfs_list[0]['target_precision'].fillna('', inplace=True)
-                    #dfs_list[0]['mean_delay'] = dfs_list[0]['mean_delay'].astype(str)
-                    dfs_list[0]['mean_delay'].fillna('', inplace=True)
-                    dfs_list[0]['mean_delay'] = dfs_list[0]['mean_delay'].astype(str)
-                    dfs_list[0]['mean_delay'] = dfs_list[0]['mean_delay'].str.replace('.', '_')
-                    result_df[col] = dfs_list[0][col] + dfs_list[0]['target_precision'] + dfs_list[0]['mean_delay']
-
-                else:
-                    result_df[col] = dfs_list[0][col]
+    result_df = pd.DataFrame(index=first_df.index)
+    for col in first_df.columns:
+        if col in to_ignore_columns:
+            continue
+        if col in numeric_cols:
+            result_df[col] = averages[col]
+        # Non-numeric: keep values from the first dataframe (assumes they are identical)
+
+        # unless the column is the pollution pattern, in which case I concatenate its value with the target
+        # precision to fix issues with AggregatedEventLogging /!\ dirty fix
+        elif col == 'pollution_pattern':
+            mean_delay = first_df['mean_delay'].fillna('').astype(str).str.replace('.', '_')
+            result_df[col] = first_df[col] + first_df['target_precision'].fillna('') + mean_delay
+        else:
+            result_df[col] = first_df[col]
 
     return result_df
 
 
-def plot_results(results, metrics=['fitness_tbr'], log_model_comb= ['cm-pl'], dqi_types=None, save_plots=True):
-    #scenario_results = pd.read_csv(results_path)
-
+# same as compute_average_across_dfs, but on the results store fed by noisy_log_evaluation (see results_store.py):
+# cells are matched by their key instead of their row position, and the averages are computed by an indexed query
+# filters: key columns and their values, e.g. setting=['cl-cm', 'cl-pm'] or log='Sepsis'
+# over: key columns averaged over; a DelayedEventLogging polluter without mean_delay derives it from each log, so
+# averaging it across logs needs over=('log', 'seed', 'parameters') together with a pollution_pattern filter
+def compute_average_from_store(store_path=results_store.DEFAULT_PATH, over=('log', 'seed'), **filters):
+    with results_store.ResultsStore(store_path) as store:
+        result_df = results_store.to_wide(store.average(over=over, **filters))
+
+    # polluters of the same class with different parameters are plotted apart, labelled as in the CSV-based averages
+    if 'parameters' not in result_df.columns:
+        return result_df
+    labels = []
+    for pattern, parameters in zip(result_df['pollution_pattern'], result_df['parameters']):
+        parameters = json.loads(parameters)
+        mean_delay = parameters.get('mean_delay')
+        labels.append(pattern + str(parameters.get('target_precision', ''))
+                      + ('' if mean_delay is None else str(float(mean_delay)).replace('.', '_')))
+    result_df['pollution_pattern'] = labels
+    return result_df.drop(columns=['parameters'])
+
+
+# values of a metric for a log-model combination, the f1-score being computed from fitness and precision
+def metric_values(results, metric, lm):
+    if metric == 'f1-score_tbr':
+        return compute_f1_score(results['fitness_tbr' + '_' + lm], results['precision_tbr' + '_' + lm])
+    return results[metric + '_' + lm]
+
+
+# collect the lines of every figure: a list of (file name, [(algorithm, x values, y values)])
+def collect_figures(results, metrics, log_model_comb, dqi_types=None):
     # gather the different pollution patterns and algorithms present in the scenario_results
     if dqi_types is None:
         dqi_types = list(results['pollution_pattern'].unique())
 
+    figures = []
     # loop over the DQIs, metrics and log-model combinations to access the scenario_results we want to plot
     for dqi in dqi_types:
         results_dqi = results.loc[(results['pollution_pattern'] == dqi)]
         for metric in metrics:
             for lm in log_model_comb:
-
-                # if f1-score metric is requested, compute it from fitness and precision
-                if metric == 'f1-score_tbr':
-                    results_dqi['f1-score_tbr'+'_'+lm] = compute_f1_score(results_dqi['fitness_tbr'+'_'+lm], results_dqi['precision_tbr'+'_'+lm])
-                    results_dqi['f1-score_tbr_cl-cm'] = compute_f1_score(results_dqi['fitness_tbr_cl-cm'], results_dqi['precision_tbr_cl-cm'])
-
                 # create string with human-readable title for the plot
                 plot_title = 'Sensitivity of ' + metrics_labels[metric] + ' to ' + dqi + ' in ' + log_model_comb_labels[lm] + '.pdf'
-                col = metric + '_' + lm
 
-                # create plot
+                lines = []
                 for var, group in results_dqi.groupby('algorithm'):
+                    # adaptive sweeps do not evaluate the percentages in increasing order
+                    group = group.sort_values('percentage')
                     # create lists with the values to plot to easily add the baseline value (without DQIs) at the beginning of the values list
                     plot_x = [0.0] + group['percentage'].to_list()
 
-                    baseline_value = group[metric + '_cl-cm'].iat[0]
-                    plot_y = [baseline_value] + group[col].to_list()
-                    plt.plot(plot_x, plot_y, label=var)
-
-                #plt.title(plot_title, wrap=True)
-                plt.legend()
-                if save_plots:
-                    plt.savefig('out/plots/' + plot_title, format='pdf')
-                plt.close()
-
-
-# call to the compute_average_across_dfs function to average the scenario_results over the four logs and save the resulting
-# dataframe for easy access later
-
-#scenario_results = compute_average_across_dfs(RESULTS_PATH, IGNORE_COLS)
-#scenario_results.loc[scenario_results['pollution_pattern'] == 'ImpreciseActivityPolluter', 'percentage'] = 1.0
-#scenario_results.to_csv('out/derived_results/aggregated_results.csv', index=False)
-
-# data cleaning code (to remove in final version)
-#scenario_results = pd.read_csv('out/derived_results/aggregated_results.csv')
-#scenario_results = scenario_results.loc[scenario_results['pollution_pattern'] != 'ImpreciseActivityPolluter']
-#sepsis_impr_act_results = pd.read_csv(
-#    'out/old_results/Sepsis_inductive_discovery_sensitivity_imprecise_activity_tryout.csv')
-#scenario_results = pd.concat([scenario_results, sepsis_impr_act_results], axis=0, ignore_index=True)
-#scenario_results.loc[scenario_results['pollution_pattern'] == 'ImpreciseActivityPolluter', 'percentage'] = 1.0
-
-#scenario_results.to_csv('out/aggregated_results.csv', index=False)
-
-# call to function to generate all plots
-#scenario_results = pd.read_csv('out/derived_results/aggregated_results.csv')
-
-#plot_results(scenario_results, metrics=METRICS, log_model_comb=LOG_MODEL_COMB, dqi_types=['ImpreciseActivityPolluter'], save_plots=True)
-
-# Create tables summarising the aggregated_results
-# take the average over four logs and difference between baseline and 90% pollution
-results = pd.read_csv('out/sensitivity_results/derived_results/aggregated_results.csv')
-results_dif = pd.DataFrame(columns=['algorithm', 'percentage', 'pollution_pattern'])
-results_dif[['algorithm', 'percentage', 'pollution_pattern']] = results.loc[:,['algorithm', 'percentage', 'pollution_pattern']]
-#results_dif.loc[:,'algorithm'] = scenario_results.loc[:,'algorithm']
-for metric in METRICS: # add baseline value
-    for log_model_comb in LOG_MODEL_COMB:
-        col_label = metric + '_' + log_model_comb
-        results_dif.loc[:,col_label] = results.loc[:,col_label].diff()
-print(results_dif.groupby(by=['pollution_pattern', 'algorithm']).sum())
-print(results_dif)
-#print(scenario_results.groupby(by=['pollution_pattern', 'algorithm']).diff())
-
-
-# or rather take the value for 50% pollution and compare across different log-model combinations
-results_0_5 = results.loc[results['percentage'] == 0.5]
-for col in IGNORE_COLS:
-    try:
-        results_0_5.drop(columns=[col], inplace=True)
-    except KeyError:
-        pass
-
- # script to compute value of metrics with ImpreciseActivityPolluter with percentage 0.5 as the average between the baseline values (with 0 DQI) and the value with percentage = 1
-
-results_0_5_impr_act = pd.DataFrame()
-for metric, log_model_comb in product(METRICS, LOG_MODEL_COMB):
-    column = metric + '_' + log_model_comb
-
-    # results with ground truth model should not be mixed with clean log - clean model results
-    if log_model_comb == 'cl-bm':
-        results_0_5_impr_act[column] = results.loc[results[
-                                                    'pollution_pattern'] == 'ImpreciseActivityPolluter', column]
-
-    # for other log-model combinations, we simply take the average between the clean value (with 0% pollution) and the polluted value (with 100% pollution) as proxy for 50% pollution
-    else:
-        results_0_5_impr_act[column] = (results.loc[results[
-                                                        'pollution_pattern'] == 'ImpreciseActivityPolluter', metric + '_cl-cm'] +
-                                        results.loc[
-                                            results['pollution_pattern'] == 'ImpreciseActivityPolluter', column]) / 2
+                    baseline_value = metric_values(group, metric, 'cl-cm').iat[0]
+                    plot_y = [baseline_value] + metric_values(group, metric, lm).to_list()
+                    lines.append((var, plot_x, plot_y))
+                figures.append((plot_title, lines))
+    return figures
+
+
+# hash of the data a figure is drawn from
+def figure_hash(lines):
+    return hashlib.sha1(json.dumps(lines).encode()).hexdigest()
 
-# we format the dataframe to fit with the other results dataframe and concatenate them to obtain a complete slice of the results for pollution level 0.5
-print(list(results['algorithm'].unique()))
-results_0_5_impr_act['algorithm'] = list(results['algorithm'].unique())
-results_0_5_impr_act['percentage'] = 0.5
-results_0_5_impr_act['pollution_pattern'] = 'ImpreciseActivityPolluter'
 
-results_0_5 = pd.concat([results_0_5, results_0_5_impr_act], axis=0)
+def _init_plot_worker():
+    # figures are only saved, never shown
+    matplotlib.use('Agg')
 
-print(results_0_5)
-results_0_5 = results_0_5.round(4)
-results_0_5.to_csv('out/derived_results/results_0_5.csv', index=False)
 
+def render_figure(path, lines):
+    for var, plot_x, plot_y in lines:
+        plt.plot(plot_x, plot_y, label=var)
+
+    #plt.title(plot_title, wrap=True)
+    plt.legend()
+    plt.savefig(path, format='pdf')
+    plt.close()
+
+
+# render the figures of the results into plots_path, skipping figures whose data did not change since they were last
+# rendered there; returns the paths of the rendered figures
+def build_plots(results, metrics=PLOT_METRICS, log_model_comb=PLOT_LOG_MODEL_COMB, dqi_types=None,
+                plots_path=PLOTS_PATH, processes=None, force=False):
+    plots_path = Path(plots_path)
+    plots_path.mkdir(parents=True, exist_ok=True)
+    hashes_path = plots_path / PLOT_HASHES_FILE
+    hashes = json.loads(hashes_path.read_text()) if hashes_path.exists() else {}
+
+    to_render = []
+    for plot_title, lines in collect_figures(results, metrics, log_model_comb, dqi_types):
+        data_hash = figure_hash(lines)
+        if force or hashes.get(plot_title) != data_hash or not (plots_path / plot_title).exists():
+            to_render.append((plot_title, lines))
+            hashes[plot_title] = data_hash
+
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(to_render) <= 1:
+        _init_plot_worker()
+        for plot_title, lines in to_render:
+            render_figure(plots_path / plot_title, lines)
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_plot_worker) as executor:
+            list(executor.map(render_figure, [plots_path / plot_title for plot_title, _ in to_render],
+                              [lines for _, lines in to_render], chunksize=8))
+
+    # written last, so that figures of an interrupted build are rendered again
+    hashes_path.write_text(json.dumps(hashes, indent=1, sort_keys=True))
+    return [plots_path / plot_title for plot_title, _ in to_render]
+
+
+def plot_results(results, metrics=['fitness_tbr'], log_model_comb= ['cm-pl'], dqi_types=None, save_plots=True):
+    #scenario_results = pd.read_csv(results_path)
+    if save_plots:
+        build_plots(results, metrics, log_model_comb, dqi_types, plots_path='out/plots')
+
+
+if __name__ == "__main__":
+    # call to the compute_average_across_dfs function to average the scenario_results over the four logs and save the resulting
+    # dataframe for easy access later
+
+    #scenario_results = compute_average_across_dfs(RESULTS_PATH, IGNORE_COLS)
+    #scenario_results.loc[scenario_results['pollution_pattern'] == 'ImpreciseActivityPolluter', 'percentage'] = 1.0
+    #scenario_results.to_csv('out/derived_results/aggregated_results.csv', index=False)
+
+    # data cleaning code (to remove in final version)
+    #scenario_results = pd.read_csv('out/derived_results/aggregated_results.csv')
+    #scenario_results = scenario_results.loc[scenario_results['pollution_pattern'] != 'ImpreciseActivityPolluter']
+    #sepsis_impr_act_results = pd.read_csv(
+    #    'out/old_results/Sepsis_inductive_discovery_sensitivity_imprecise_activity_tryout.csv')
+    #scenario_results = pd.concat([scenario_results, sepsis_impr_act_results], axis=0, ignore_index=True)
+    #scenario_results.loc[scenario_results['pollution_pattern'] == 'ImpreciseActivityPolluter', 'percentage'] = 1.0
+
+    #scenario_results.to_csv('out/aggregated_results.csv', index=False)
+
+    # call to function to generate all plots
+    #scenario_results = pd.read_csv('out/derived_results/aggregated_results.csv')
+
+    #plot_results(scenario_results, metrics=METRICS, log_model_comb=LOG_MODEL_COMB, dqi_types=['ImpreciseActivityPolluter'], save_plots=True)
+
+    # plot build step: only the figures whose data changed are rendered again
+    rendered = build_plots(pd.read_csv(AGGREGATED_RESULTS_PATH))
+    print('Rendered ' + str(len(rendered)) + ' plots to ' + str(PLOTS_PATH))
+
+    # Create tables summarising the aggregated_results
+    # take the average over four logs and difference between baseline and 90% pollution
+    results = pd.read_csv('out/sensitivity_results/derived_results/aggregated_results.csv')
+    results_dif = pd.DataFrame(columns=['algorithm', 'percentage', 'pollution_pattern'])
+    results_dif[['algorithm', 'percentage', 'pollution_pattern']] = results.loc[:,['algorithm', 'percentage', 'pollution_pattern']]
+    #results_dif.loc[:,'algorithm'] = scenario_results.loc[:,'algorithm']
+    for metric in METRICS: # add baseline value
+        for log_model_comb in LOG_MODEL_COMB:
+            col_label = metric + '_' + log_model_comb
+            results_dif.loc[:,col_label] = results.loc[:,col_label].diff()
+    print(results_dif.groupby(by=['pollution_pattern', 'algorithm']).sum())
+    print(results_dif)
+    #print(scenario_results.groupby(by=['pollution_pattern', 'algorithm']).diff())
+
+
+    # or rather take the value for 50% pollution and compare across different log-model combinations
+    results_0_5 = results.loc[results['percentage'] == 0.5]
+    for col in IGNORE_COLS:
+        try:
+            results_0_5.drop(columns=[col], inplace=True)
+        except KeyError:
+            pass
+
+     # script to compute value of metrics with ImpreciseActivityPolluter with percentage 0.5 as the average between the baseline values (with 0 DQI) and the value with percentage = 1
+
+    results_0_5_impr_act = pd.DataFrame()
+    for metric, log_model_comb in product(METRICS, LOG_MODEL_COMB):
+        column = metric + '_' + log_model_comb
+
+        # results with ground truth model should not be mixed with clean log - clean model results
+        if log_model_comb == 'cl-bm':
+            results_0_5_impr_act[column] = results.loc[results[
+                                                        'pollution_pattern'] == 'ImpreciseActivityPolluter', column]
+
+        # for other log-model combinations, we simply take the average between the clean value (with 0% pollution) and the polluted value (with 100% pollution) as proxy for 50% pollution
+        else:
+            results_0_5_impr_act[column] = (results.loc[results[
+                                                            'pollution_pattern'] == 'ImpreciseActivityPolluter', metric + '_cl-cm'] +
+                                            results.loc[
+                                                results['pollution_pattern'] == 'ImpreciseActivityPolluter', column]) / 2
+
+    # we format the dataframe to fit with the other results dataframe and concatenate them to obtain a complete slice of the results for pollution level 0.5
+    print(list(results['algorithm'].unique()))
+    results_0_5_impr_act['algorithm'] = list(results['algorithm'].unique())
+    results_0_5_impr_act['percentage'] = 0.5
+    results_0_5_impr_act['pollution_pattern'] = 'ImpreciseActivityPolluter'
+
+    results_0_5 = pd.concat([results_0_5, results_0_5_impr_act], axis=0)
+
+    print(results_0_5)
+    results_0_5 = results_0_5.round(4)
+    results_0_5.to_csv('out/derived_results/results_0_5.csv', index=False)
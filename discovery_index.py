@@ -0,0 +1,100 @@
+import pm4py
+from pm4py.algo.discovery.alpha.variants import classic as alpha_classic
+from pm4py.util.compression import util as comut
+
+import ilp_sweep
+import inductive_sweep
+
+
+"""
+Shared log abstractions for process discovery
+
+A DiscoveryIndex scans a log once and keeps the abstractions the discovery algorithms start from: the variants with
+their frequencies, the directly-follows graph with start and end activities, and the causal footprint. Every
+discovery call on the same log is then fed from the index instead of scanning the log again.
+
+    IM / IMf    the variants and their DFG, which are exactly what pm4py's inductive miner builds from the log (handing
+                it the DFG alone would switch it to the DFG-based IMd and change the models), and the cuts found for
+                the noise thresholds mined so far (see inductive_sweep)
+    alpha       the DFG with start and end activities
+    ILP         the alpha-independent part of the linear problem, shared by all alpha values (see ilp_sweep)
+
+The discovered models are the same as those of the corresponding pm4py.discover_petri_net_* calls.
+"""
+
+
+# indices of the most recently used logs, see get_index
+_INDICES = []
+INDEX_CACHE_SIZE = 4
+
+
+class DiscoveryIndex:
+
+    def __init__(self, log, activity_key="concept:name", timestamp_key="time:timestamp",
+                 case_id_key="case:concept:name"):
+        self.parameters = pm4py.utils.get_properties(log, activity_key=activity_key, timestamp_key=timestamp_key,
+                                                     case_id_key=case_id_key)
+        self.activity_key = activity_key
+        self.variants = comut.get_variants(comut.project_univariate(log, key=activity_key, df_glue=case_id_key,
+                                                                    df_sorting_criterion_key=timestamp_key))
+        self.dfg = comut.discover_dfg_uvcl(self.variants)
+        self.cut_cache = inductive_sweep.CutCache()
+        self._ilp_system = None
+
+    @property
+    def ilp_system(self):
+        """
+        Constraint system of the ILP miner built from the variants, solved for any alpha by discover_ilp
+        """
+        if self._ilp_system is None:
+            self._ilp_system = ilp_sweep.IlpConstraintSystem(self.variants)
+        return self._ilp_system
+
+    def discover_inductive(self, noise_threshold=0.0):
+        """
+        Same as pm4py.discover_petri_net_inductive(log, noise_threshold=noise_threshold)
+        """
+        return inductive_sweep.discover_inductive(self.variants, self.dfg, self.parameters, noise_threshold,
+                                                  self.cut_cache)
+
+    def discover_inductive_sweep(self, noise_thresholds):
+        """
+        Same as pm4py.discover_petri_net_inductive(log, noise_threshold=noise_threshold) for every noise threshold,
+        returns {noise_threshold: (net, im, fm)}
+        """
+        return inductive_sweep.sweep(self.variants, self.dfg, self.parameters, noise_thresholds, self.cut_cache)
+
+    def discover_alpha(self):
+        """
+        Same as pm4py.discover_petri_net_alpha(log)
+        """
+        return alpha_classic.apply_dfg_sa_ea(dict(self.dfg.graph), dict(self.dfg.start_activities),
+                                             dict(self.dfg.end_activities), parameters=dict(self.parameters))
+
+    def discover_ilp(self, alpha=1.0):
+        """
+        Same as pm4py.discover_petri_net_ilp(log, alpha)
+        """
+        return self.ilp_system.discover(alpha)
+
+    def discover_ilp_sweep(self, alphas):
+        """
+        Same as pm4py.discover_petri_net_ilp(log, alpha) for every alpha, returns {alpha: (net, im, fm)}
+        """
+        return self.ilp_system.sweep(alphas)
+
+
+def get_index(log):
+    """
+    Returns the discovery index of a log, reusing the index of one of the most recently indexed logs.
+    Logs are recognised by identity, so a log must not be modified after it has been indexed.
+    """
+    for i, (indexed_log, index) in enumerate(_INDICES):
+        if indexed_log is log:
+            _INDICES.append(_INDICES.pop(i))
+            return index
+    index = DiscoveryIndex(log)
+    _INDICES.append((log, index))
+    if len(_INDICES) > INDEX_CACHE_SIZE:
+        _INDICES.pop(0)
+    return index
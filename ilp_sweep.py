@@ -0,0 +1,195 @@
+import copy
+
+import numpy as np
+from pm4py.algo.discovery.causal import algorithm as causal_discovery
+from pm4py.objects.petri_net.obj import Marking, PetriNet
+from pm4py.objects.petri_net.utils import murata, petri_utils, reduction
+from pm4py.util import constants
+from pm4py.util.lp import solver as lp_solver
+
+
+"""
+Threshold sweep for the ILP miner
+
+pm4py's ILP miner (pm4py.algo.discovery.ilp.variants.classic) rebuilds the whole linear problem for every alpha value.
+Most of it does not depend on alpha: the prefix (Parikh vector) matrix of the variants, the sequence encoding graph,
+the causal relations to explore and the bounds of the place variables. Alpha only decides, per variant, how long a
+prefix survives the sequence encoding filter.
+
+An IlpConstraintSystem builds the alpha-independent part once per log. For every alpha it then only derives the kept
+prefix length of each variant; alpha values that keep the same prefixes share the same linear problems, which are
+solved once. The constraint matrices are converted to arrays once per problem instead of once per causal relation.
+The discovered nets are the same as those of pm4py.discover_petri_net_ilp.
+"""
+
+
+class IlpConstraintSystem:
+
+    def __init__(self, variants):
+        """
+        variants: Counter mapping each variant (tuple of activity labels) to its frequency, in order of first occurrence
+        """
+        start = constants.DEFAULT_ARTIFICIAL_START_ACTIVITY
+        end = constants.DEFAULT_ARTIFICIAL_END_ACTIVITY
+        traces = [(start,) + variant + (end,) for variant in variants]
+        occurrences = list(variants.values())
+
+        # causal relation of the DFG of the variants, in the order pm4py discovers it
+        dfg = {}
+        for trace in traces:
+            for pair in zip(trace, trace[1:]):
+                dfg[pair] = dfg.get(pair, 0) + 1
+        self.causal = causal_discovery.apply(dfg)
+
+        self.activities = sorted(set(a for trace in traces for a in trace))
+        activity_index = {a: i for i, a in enumerate(self.activities)}
+        n = len(self.activities)
+
+        # Parikh vector of every prefix of every variant
+        self.prefixes = []
+        for trace in traces:
+            vectors = np.zeros((len(trace), n), dtype=np.int64)
+            counts = np.zeros(n, dtype=np.int64)
+            for i, activity in enumerate(trace):
+                counts[activity_index[activity]] += 1
+                vectors[i] = counts
+            self.prefixes.append(vectors)
+
+        # sequence encoding graph, weighted by the frequency of the variants
+        seq_enc_graph = {}
+        for vectors, occurrence in zip(self.prefixes, occurrences):
+            for i in range(len(vectors)):
+                prev = tuple(vectors[i - 1]) if i > 0 else None
+                curr = tuple(vectors[i])
+                seq_enc_graph.setdefault(prev, {})
+                seq_enc_graph[prev][curr] = seq_enc_graph[prev].get(curr, 0) + occurrence
+        max_child = {prev: max(children.values()) for prev, children in seq_enc_graph.items()}
+        # per variant and prefix, (occurrences of the edge, largest sibling occurrence) deciding the filtering
+        self.edge_weights = [[(seq_enc_graph[tuple(vectors[i - 1]) if i > 0 else None][tuple(vectors[i])],
+                               max_child[tuple(vectors[i - 1]) if i > 0 else None]) for i in range(len(vectors))]
+                             for vectors in self.prefixes]
+
+        # rows that do not depend on alpha: at least one arc, binary variables, no initial tokens
+        self.base_Aub = [[-1] * (2 * n) + [0]]
+        self.base_bub = [-1]
+        for i in range(2 * n + 1):
+            row = [0] * (2 * n + 1)
+            row[i] = -1
+            self.base_Aub.append(row)
+            self.base_bub.append(0)
+            row = [0] * (2 * n + 1)
+            row[i] = 1
+            self.base_Aub.append(row)
+            self.base_bub.append(1)
+        self.base_Aub.append([0] * (2 * n) + [1])
+        self.base_bub.append(0)
+
+        # nets discovered so far, keyed by the kept prefix lengths
+        self._nets = {}
+
+    def kept_lengths(self, alpha):
+        """
+        Number of prefixes of each variant that pass the sequence encoding filter of the given alpha
+        """
+        lengths = []
+        for weights in self.edge_weights:
+            kept = 0
+            for occurrences, max_occurrences in weights:
+                if occurrences < (1 - alpha) * max_occurrences:
+                    break
+                kept += 1
+            lengths.append(kept)
+        return tuple(lengths)
+
+    def _linear_problem(self, kept_lengths):
+        n = len(self.activities)
+        c = np.zeros(2 * n)
+        Aub, Aeq = [], []
+        added_Aub, added_Aeq = set(), set()
+        for vectors, kept in zip(self.prefixes, kept_lengths):
+            for i in range(kept):
+                prev = -vectors[i - 1] if i > 0 else np.zeros(n, dtype=np.int64)
+                row = tuple(prev.tolist() + vectors[i].tolist() + [-1])
+                if i < len(vectors) - 1:
+                    if row not in added_Aub:
+                        added_Aub.add(row)
+                        Aub.append(row)
+                else:
+                    # the place is empty at the end of every trace
+                    if row not in added_Aeq:
+                        added_Aeq.add(row)
+                        Aeq.append(row)
+                c += np.concatenate([vectors[i], -vectors[i]])
+        Aub = np.array(Aub + self.base_Aub, dtype=float)
+        bub = np.array([0] * (len(Aub) - len(self.base_bub)) + self.base_bub, dtype=float)
+        Aeq = np.array(Aeq, dtype=float).reshape(-1, 2 * n + 1)
+        return np.append(c, 1), Aub, bub, Aeq
+
+    def _solve(self, kept_lengths):
+        n = len(self.activities)
+        c, Aub, bub, Aeq = self._linear_problem(kept_lengths)
+        integrality = [1] * (2 * n + 1)
+
+        net = PetriNet("ilp")
+        im = Marking()
+        fm = Marking()
+        source = PetriNet.Place("source")
+        sink = PetriNet.Place("sink")
+        net.places.add(source)
+        net.places.add(sink)
+        im[source] = 1
+        fm[sink] = 1
+        trans_map = {}
+        for act in self.activities:
+            label = act if act not in [constants.DEFAULT_ARTIFICIAL_START_ACTIVITY,
+                                       constants.DEFAULT_ARTIFICIAL_END_ACTIVITY] else None
+            trans_map[act] = PetriNet.Transition(act, label)
+            net.transitions.add(trans_map[act])
+            if act == constants.DEFAULT_ARTIFICIAL_START_ACTIVITY:
+                petri_utils.add_arc_from_to(source, trans_map[act], net)
+            elif act == constants.DEFAULT_ARTIFICIAL_END_ACTIVITY:
+                petri_utils.add_arc_from_to(trans_map[act], sink, net)
+
+        # one place per causal relation, each solution connects the two activities of the relation
+        added_places = set()
+        for ca in self.causal:
+            fix = np.zeros((2, 2 * n + 1))
+            fix[0, self.activities.index(ca[0])] = 1
+            fix[1, n + self.activities.index(ca[1])] = 1
+            sol = lp_solver.apply(c, Aub, bub, np.vstack([Aeq, fix]), np.append(np.zeros(len(Aeq)), [1, 1]),
+                                  variant=lp_solver.SCIPY, parameters={"integrality": integrality})
+            if not sol.success:
+                continue
+            sol = tuple(round(x) for x in lp_solver.get_points_from_sol(sol, variant=lp_solver.SCIPY))
+            if sol in added_places:
+                continue
+            added_places.add(sol)
+            if max(sol[:n]) > 0 and max(sol[n:2 * n]) > 0:
+                place = PetriNet.Place(str(len(net.places)))
+                net.places.add(place)
+                for i in range(n):
+                    if sol[i] == 1:
+                        petri_utils.add_arc_from_to(trans_map[self.activities[i]], place, net)
+                for i in range(n):
+                    if sol[n + i] == 1:
+                        petri_utils.add_arc_from_to(place, trans_map[self.activities[i]], net)
+
+        # implicit places and invisible transitions are reduced as in pm4py
+        net, im, fm = murata.apply_reduction(net, im, fm)
+        net = reduction.apply_simple_reduction(net)
+        return net, im, fm
+
+    def discover(self, alpha=1.0):
+        """
+        Same as pm4py.discover_petri_net_ilp(log, alpha), every call returns its own copy of the net
+        """
+        kept_lengths = self.kept_lengths(alpha)
+        if kept_lengths not in self._nets:
+            self._nets[kept_lengths] = self._solve(kept_lengths)
+        return copy.deepcopy(self._nets[kept_lengths])
+
+    def sweep(self, alphas):
+        """
+        Discovers a net for every alpha value. Returns {alpha: (net, im, fm)}
+        """
+        return {alpha: self.discover(alpha) for alpha in alphas}
@@ -0,0 +1,157 @@
+from collections import Counter
+
+import pm4py
+from pm4py.algo.discovery.alpha.variants import classic as alpha_classic
+from pm4py.algo.discovery.inductive.dtypes.im_dfg import InductiveDFG
+from pm4py.algo.discovery.inductive.dtypes.im_ds import IMDataStructureDFG
+from pm4py.algo.discovery.inductive.variants.imd import IMD
+from pm4py.objects.dfg.obj import DFG
+from pm4py.objects.process_tree.utils import generic as pt_util
+
+
+"""
+Directly-follows graph of a polluted log patched from the DFG of the clean log
+
+A polluter edits a small fraction of the traces, so the DFG of the polluted log differs from that of the clean log
+only by what those traces contribute. DfgCounts keeps the directly-follows, start, end and activity counts of a log;
+patched counts the clean versions of the edited traces and the traces replacing them, subtracts the former from the
+counts of the clean log and adds the latter, which takes time in the length of the edited traces only. The edits come
+from streaming_pollution.pollute_with_edits:
+
+    polluted_log, edits = streaming_pollution.pollute_with_edits(polluter, clean_log, statistics)
+    polluted_counts = clean_counts.patched(clean_log, edits)
+
+The patched counts are equal to DfgCounts.from_log(polluted_log). The DFG-based miners run on them directly:
+discover_inductive is the inductive miner on the DFG (IMd, as pm4py.discover_petri_net_inductive on a DFG), and
+discover_alpha is the same as pm4py.discover_petri_net_alpha on the log. IM and IMf on the log iterate over its
+variants in order and depend on it, so they keep starting from the DiscoveryIndex of the polluted log.
+
+In the sweeps, polluted_log_cache.get_polluted_log(..., with_edits=True) pollutes with pollute_with_edits and
+get_edits returns the edits of the polluted log; get_counts patches the counts of the clean log with them.
+"""
+
+
+# counts of the most recently counted logs, see get_counts
+_COUNTS = []
+COUNTS_CACHE_SIZE = 8
+
+
+class DfgCounts:
+
+    def __init__(self, activity_key="concept:name"):
+        self.activity_key = activity_key
+        self.graph = Counter()              # (activity, activity) -> directly-follows count
+        self.start_activities = Counter()
+        self.end_activities = Counter()
+        self.activities = Counter()
+        self.traces = 0
+        self.empty_traces = 0
+
+    @classmethod
+    def from_log(cls, log, activity_key="concept:name"):
+        """
+        Counts of a log, or of any iterable of traces
+        """
+        counts = cls(activity_key)
+        for trace in log:
+            variant = [event[activity_key] for event in trace]
+            counts.traces += 1
+            if not variant:
+                counts.empty_traces += 1
+                continue
+            counts.start_activities[variant[0]] += 1
+            counts.end_activities[variant[-1]] += 1
+            counts.activities.update(variant)
+            counts.graph.update(zip(variant, variant[1:]))
+        return counts
+
+    def _add(self, other, sign):
+        # adds (sign 1) or subtracts (sign -1) the counts of other, dropping counts that reach zero
+        for counter, other_counter in [(self.graph, other.graph), (self.start_activities, other.start_activities),
+                                       (self.end_activities, other.end_activities),
+                                       (self.activities, other.activities)]:
+            for key, count in other_counter.items():
+                count = counter[key] + sign * count
+                if count > 0:
+                    counter[key] = count
+                else:
+                    del counter[key]
+        self.traces += sign * other.traces
+        self.empty_traces += sign * other.empty_traces
+
+    def copy(self):
+        counts = DfgCounts(self.activity_key)
+        counts._add(self, 1)
+        return counts
+
+    def patched(self, log, edits):
+        """
+        Counts of the log with the given edits applied, as returned by streaming_pollution.pollute_with_edits: every
+        edit is (index of a trace of the log, list of the traces that replace it). The counts of the log (self) are
+        not changed; copying them takes time in the size of the DFG, not of the log.
+        """
+        # patching counts the edited clean events, counting anew the clean events that were not edited; both count
+        # the replacing traces
+        edited_events = sum(len(log[index]) for index, _ in edits)
+        if 2 * edited_events > sum(self.activities.values()):
+            # most events were edited (e.g. by a polluter relabelling every trace), counting them anew is faster
+            edited = set(index for index, _ in edits)
+            return DfgCounts.from_log([trace for index, trace in enumerate(log) if index not in edited]
+                                      + [trace for _, traces in edits for trace in traces], self.activity_key)
+        removed = DfgCounts.from_log([log[index] for index, _ in edits], self.activity_key)
+        added = DfgCounts.from_log([trace for _, traces in edits for trace in traces], self.activity_key)
+        counts = self.copy()
+        counts._add(added, 1)
+        counts._add(removed, -1)
+        return counts
+
+    def to_dfg(self):
+        """
+        The counts as a pm4py DFG
+        """
+        dfg = DFG()
+        dfg.graph.update(self.graph)
+        dfg.start_activities.update(self.start_activities)
+        dfg.end_activities.update(self.end_activities)
+        return dfg
+
+    def discover_inductive(self):
+        """
+        Inductive miner on the DFG (IMd), same as pm4py.discover_petri_net_inductive on the DFG of the log, knowing
+        whether the log has empty traces
+        """
+        parameters = {}
+        tree = IMD(parameters).apply(IMDataStructureDFG(InductiveDFG(dfg=self.to_dfg(), skip=self.empty_traces > 0)),
+                                     parameters)
+        tree = pt_util.fold(tree)
+        pt_util.tree_sort(tree)
+        return pm4py.convert_to_petri_net(tree)
+
+    def discover_alpha(self):
+        """
+        Same as pm4py.discover_petri_net_alpha on the log
+        """
+        return alpha_classic.apply_dfg_sa_ea(dict(self.graph), dict(self.start_activities), dict(self.end_activities),
+                                             parameters={alpha_classic.Parameters.ACTIVITY_KEY: self.activity_key})
+
+
+def get_counts(log, edits=None):
+    """
+    Returns the counts of a log, reusing those of one of the most recently counted logs. If edits (clean log, edits
+    as returned by polluted_log_cache.get_edits) are given, the log is the clean log with the edits applied and its
+    counts are patched from those of the clean log. Logs are recognised by identity, so a log must not be modified
+    after it has been counted.
+    """
+    for i, (counted_log, counts) in enumerate(_COUNTS):
+        if counted_log is log:
+            _COUNTS.append(_COUNTS.pop(i))
+            return counts
+    if edits is None:
+        counts = DfgCounts.from_log(log)
+    else:
+        clean_log, log_edits = edits
+        counts = get_counts(clean_log).patched(clean_log, log_edits)
+    _COUNTS.append((log, counts))
+    if len(_COUNTS) > COUNTS_CACHE_SIZE:
+        _COUNTS.pop(0)
+    return counts
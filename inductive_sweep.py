@@ -0,0 +1,127 @@
+import copy
+
+import pm4py
+from pm4py.algo.discovery.inductive.cuts.factory import CutFactory
+from pm4py.algo.discovery.inductive.dtypes.im_ds import IMDataStructureUVCL
+from pm4py.algo.discovery.inductive.variants.im import IMUVCL
+from pm4py.algo.discovery.inductive.variants.imf import IMFUVCL
+from pm4py.objects.process_tree.utils import generic as pt_util
+from pm4py.util import constants
+
+
+"""
+Noise threshold sweep for the inductive miner
+
+The inductive miner recursively splits the log by the first cut found on its DFG and falls through when there is none.
+Cut detection and fall-throughs only depend on the (sub-)log and its DFG, not on the noise threshold, and IM and IMf
+try the same cuts. The noise threshold only decides which DFG edges IMf filters out before a second cut detection and
+when empty traces are split off.
+
+A CutCache remembers the cut and fall-through results per (sub-)log and DFG. The miners of all thresholds of a sweep
+share one cache, so a subtree is only cut again where the filtered DFG of a threshold differs from what previous
+thresholds have seen. Even then, the projection of the (sub-)log on the cut, which builds the sub-logs and their DFGs
+and takes most of the time of IMf, only depends on the variants and the groups of the cut: thresholds whose filtered
+DFGs yield the same groups share the projected sub-logs. The discovered models are the same as those of
+pm4py.discover_petri_net_inductive.
+"""
+
+
+class CutCache:
+
+    def __init__(self):
+        self.cuts = {}
+        self.fall_throughs = {}
+        self.projections = {}
+        self.hits = 0
+
+    @staticmethod
+    def key(obj):
+        # the cuts iterate over the variants and edges in order, so the order is part of the key
+        dfg = obj.dfg
+        return (tuple(obj.data_structure.items()), tuple(dfg.graph.items()), tuple(dfg.start_activities.items()),
+                tuple(dfg.end_activities.items()))
+
+    def lookup(self, table, obj, compute):
+        key = CutCache.key(obj)
+        if key in table:
+            self.hits += 1
+        else:
+            result = compute()
+            # the miner adds the children to the returned tree, a clean copy of it is kept
+            table[key] = None if result is None else (copy.deepcopy(result[0]), result[1])
+        result = table[key]
+        return None if result is None else (copy.deepcopy(result[0]), result[1])
+
+
+    def project(self, cut, obj, groups, parameters):
+        """
+        Sub-logs of the (sub-)log on the groups of the cut, as cut.project, computed once per variants and groups
+        """
+        # the projections iterate over the variants in order and pick the sub-log by the position of the group
+        key = (cut, tuple(obj.data_structure.items()), tuple(frozenset(group) for group in groups))
+        if key in self.projections:
+            self.hits += 1
+        else:
+            self.projections[key] = cut.project(obj, groups, parameters)
+        return self.projections[key]
+
+
+class _SharedCuts:
+    """
+    Mixin for the pm4py miners that looks up cuts and fall-throughs in a CutCache
+    """
+
+    def __init__(self, parameters, cache):
+        super().__init__(parameters)
+        self._cache = cache
+
+    def find_cut(self, obj, parameters=None):
+        return self._cache.lookup(self._cache.cuts, obj, lambda: self._find_cut(obj, parameters))
+
+    def _find_cut(self, obj, parameters):
+        # same as CutFactory.find_cut, with the projection looked up in the cache
+        for cut in CutFactory.get_cuts(obj, self.instance(), parameters):
+            groups = cut.holds(obj, parameters)
+            if groups is not None:
+                return cut.operator(), self._cache.project(cut, obj, groups, parameters)
+        return None
+
+    def fall_through(self, obj, parameters=None):
+        return self._cache.lookup(self._cache.fall_throughs, obj,
+                                  lambda: super(_SharedCuts, self).fall_through(obj, parameters))
+
+
+class _SharedCutsIM(_SharedCuts, IMUVCL):
+    pass
+
+
+class _SharedCutsIMF(_SharedCuts, IMFUVCL):
+    pass
+
+
+def discover_inductive(variants, dfg, parameters, noise_threshold, cache):
+    """
+    Same as pm4py.discover_petri_net_inductive(log, noise_threshold=noise_threshold) on the log with the given variants
+    (UVCL) and DFG, with the cuts looked up in the given CutCache
+    """
+    parameters = dict(parameters)
+    parameters["noise_threshold"] = noise_threshold
+    parameters["multiprocessing"] = constants.ENABLE_MULTIPROCESSING_DEFAULT
+    parameters["disable_fallthroughs"] = False
+    miner = _SharedCutsIMF(parameters, cache) if noise_threshold > 0 else _SharedCutsIM(parameters, cache)
+    # the miners only read the DFG of the data structure and filter copies of it
+    tree = miner.apply(IMDataStructureUVCL(variants, dfg), parameters)
+    tree = pt_util.fold(tree)
+    pt_util.tree_sort(tree)
+    return pm4py.convert_to_petri_net(tree)
+
+
+def sweep(variants, dfg, parameters, noise_thresholds, cache=None):
+    """
+    Discovers a net for every noise threshold, sharing the cut detection between them. Returns
+    {noise_threshold: (net, im, fm)}
+    """
+    if cache is None:
+        cache = CutCache()
+    return {noise_threshold: discover_inductive(variants, dfg, parameters, noise_threshold, cache)
+            for noise_threshold in noise_thresholds}
@@ -11,10 +11,11 @@ from datetime import timedelta
 
 
 import pm4py
-from mako.util import to_list
 from pm4py.objects.log.obj import EventLog, Trace, Event
 from pm4py.statistics.attributes.log import get as attributes_get
 
+import pollution_ground_truth
+
 
 """
 Currently implemented Polluters
@@ -49,11 +50,67 @@ Irrelevant Data:
 # TODO remove deepcopy calls. we do these in noisy_log_evaluation now!
 
 
+def _shallow_copy_log(log):
+    """
+    Returns a new EventLog with the same log-level metadata that holds the very same trace objects as the given log.
+    Polluters that only rebuild a few traces use this instead of a deepcopy of the whole log.
+    """
+    return EventLog(list(log), attributes=dict(log.attributes), extensions=dict(log.extensions),
+                    omni_present=dict(log.omni_present), classifiers=dict(log.classifiers),
+                    properties=dict(log.properties))
+
+
+def _replace_labels(trace, edits, new_label):
+    """
+    Returns a copy of the trace in which randomly chosen events, one per edit, are relabelled with
+    new_label(trace, position). Only the relabelled events are copied.
+    """
+    tr = Trace(list(trace), attributes=dict(trace.attributes))
+    for _ in range(edits):
+        to_replace = random.randint(0, len(tr) - 1)
+        event = Event(tr[to_replace])
+        event["concept:name"] = new_label(tr, to_replace)
+        tr[to_replace] = event
+    return tr
+
+
 class LogPolluter(ABC):
+    # what the percentage counts when polluting a stream of traces (see streaming_pollution.py): 'events', 'traces', or
+    # None for polluters that treat every trace the same; with_replacement tells whether a trace can get several edits
+    streaming_unit = None
+    streaming_with_replacement = True
+
     @abstractmethod
     def pollute(self, log):
         pass
 
+    def pollute_with_ground_truth(self, log):
+        """
+        Same as pollute, also returning which events were inserted, relabelled, retimed, moved or deleted as a
+        GroundTruth (see pollution_ground_truth.py)
+        """
+        return pollution_ground_truth.pollute_with_ground_truth(self, log)
+
+    def stream_context(self, statistics):
+        """
+        Draws the log-wide choices of the polluter (e.g. alien labels) once for a stream, from the LogStatistics of the log
+        """
+        return {}
+
+    def pollute_trace(self, trace, edits, context):
+        """
+        Streaming counterpart of pollute: applies the given number of edits to a single trace and returns the resulting
+        traces (none if the trace is deleted, several if it is duplicated). The input trace is not modified.
+        """
+        raise NotImplementedError(self.__class__.__name__ + " does not support streaming pollution")
+
+    def unplaced_edits(self, trace, edits):
+        """
+        Number of the given edits pollute_trace cannot apply to the trace (e.g. deletions beyond its length), which the
+        stream places on other traces instead
+        """
+        return 0
+
     def get_properties(self):
         properties = {key: value for key, value in self.__dict__.items() if not key.startswith('__') and not callable(key)}
         properties["pollution_pattern"] = self.__class__.__name__
@@ -66,6 +123,8 @@ class InsertAlienActivityPolluter(LogPolluter):
 
     Example: A B C D E --> A B C D fchildsf3d1 E
     """
+    streaming_unit = 'events'
+
     def __init__(self, percentage, alien_activity_nr=None):
         self.percentage = percentage
         self.alien_activity_nr = alien_activity_nr
@@ -73,7 +132,6 @@ class InsertAlienActivityPolluter(LogPolluter):
     # I (Yannis) modified this polluter to take a number of alien activities instead of generating a different activity for each event (which really messed up the event log too much)
     # if you do not give in a number of alien activities, this number will be set to the number of events to insert and an activity label will be randomly drawn from this list (slightly different behaviour than original)
     def pollute(self, log):
-        log_copy = copy.deepcopy(log)
         number_of_events = sum([len(tr) for tr in log])
         unique_activities = set()
         for tr in log:
@@ -81,14 +139,7 @@ class InsertAlienActivityPolluter(LogPolluter):
                 unique_activities.add(e['concept:name'])
 
 
-        #TODO This mess of a fix will break so easily :(
-        no_alien_activities = 0
-        if self.alien_activity_nr is None:
-            no_alien_activities = math.ceil(math.sqrt(len(unique_activities)))
-        elif self.alien_activity_nr == "sqrt":
-            no_alien_activities = math.ceil(math.sqrt(len(unique_activities)))
-        elif 0.0 <= self.alien_activity_nr <= 1.0:
-            no_alien_activities = math.ceil(self.alien_activity_nr * len(unique_activities))
+        no_alien_activities = self._number_of_alien_activities(len(unique_activities))
 
         alien_activities = []
 
@@ -97,32 +148,68 @@ class InsertAlienActivityPolluter(LogPolluter):
         for _ in range(no_alien_activities):
             alien_activities.append(str(random.getrandbits(128)))
 
+        # plan all insertions up front on lightweight copies of the affected traces: every slot is (event, alien label
+        # or None), positions are drawn over the trace as it grows, so an alien activity may follow one inserted before
+        planned_traces = {}
         for _ in range (to_duplicate):
-            tr_idx = random.randint(0,len(log_copy)-1)
-            tr = log_copy[tr_idx]
+            tr_idx = random.randint(0,len(log)-1)
+            if tr_idx not in planned_traces:
+                planned_traces[tr_idx] = [(event, None) for event in log[tr_idx]]
+            self._plan_insert(planned_traces[tr_idx], alien_activities)
 
-            to_insert = 0 if len(tr) <= 1 else random.randint(0, len(tr)-1)
-            if len(tr) < to_insert:
-                print(len(tr)-1,to_insert)
-                print(tr)
-            #if len(tr) <= 1:
-            #    to_insert = 0
-            #else:
-            #    to_insert = random.randint(0, len(tr)-1)
-            #new_event = {}
-            #for x in tr[to_insert].keys():
-            #    new_event[x]=tr[to_insert][x]
-
-            new_event = copy.deepcopy(tr[to_insert])
-            new_event['concept:name'] = random.choice(alien_activities)
-            #new_event = Event(tr[to_insert])
-
-            #new_event['concept:name'] = random.choice(alien_activities)
-            tr.insert(to_insert+1, new_event) # the deep copy is there to solve an issue that duplicated the inserted activity
+        # rebuild every affected trace once, untouched traces and events are shared with the input log
+        log_copy = _shallow_copy_log(log)
+        for tr_idx, slots in planned_traces.items():
+            log_copy[tr_idx] = self._insert(log[tr_idx], slots)
 
         return log_copy
 
+    def _number_of_alien_activities(self, number_of_activities):
+        #TODO This mess of a fix will break so easily :(
+        no_alien_activities = 0
+        if self.alien_activity_nr is None:
+            no_alien_activities = math.ceil(math.sqrt(number_of_activities))
+        elif self.alien_activity_nr == "sqrt":
+            no_alien_activities = math.ceil(math.sqrt(number_of_activities))
+        elif 0.0 <= self.alien_activity_nr <= 1.0:
+            no_alien_activities = math.ceil(self.alien_activity_nr * number_of_activities)
+        return no_alien_activities
+
+    @staticmethod
+    def _plan_insert(slots, alien_activities):
+        to_insert = 0 if len(slots) <= 1 else random.randint(0, len(slots)-1)
+        alien_activity = random.choice(alien_activities)
+        if not slots:
+            # an empty trace has no event to copy, the alien event only has its label
+            slots.append((None, alien_activity))
+        else:
+            # the new event copies the event it follows, which may itself be an alien event inserted before
+            slots.insert(to_insert+1, (slots[to_insert][0], alien_activity))
+
+    @staticmethod
+    def _insert(tr, slots):
+        new_tr = []
+        for event, alien_activity in slots:
+            if alien_activity is None:
+                new_tr.append(event)
+                continue
+            # the new event shares the (immutable) attribute values of its neighbour and only gets its own label
+            new_event = Event(event) if event is not None else Event()
+            new_event['concept:name'] = alien_activity
+            new_tr.append(new_event)
+        return Trace(new_tr, attributes=dict(tr.attributes))
+
+    def stream_context(self, statistics):
+        no_alien_activities = self._number_of_alien_activities(len(statistics.activities))
+        return {'alien_activities': [str(random.getrandbits(128)) for _ in range(no_alien_activities)]}
 
+    def pollute_trace(self, trace, edits, context):
+        if edits == 0:
+            return [trace]
+        slots = [(event, None) for event in trace]
+        for _ in range(edits):
+            self._plan_insert(slots, context['alien_activities'])
+        return [self._insert(trace, slots)]
 
 
 class InsertDuplicateActivityPolluter(LogPolluter):
@@ -131,6 +218,8 @@ class InsertDuplicateActivityPolluter(LogPolluter):
 
     Example: A B C D E --> A B C D D E
     """
+    streaming_unit = 'events'
+
     def __init__(self, percentage):
         self.percentage = percentage
 
@@ -147,6 +236,13 @@ class InsertDuplicateActivityPolluter(LogPolluter):
 
         return log_copy
 
+    def pollute_trace(self, trace, edits, context):
+        tr = Trace(list(trace), attributes=dict(trace.attributes))
+        for _ in range(edits):
+            to_insert = random.randint(0, len(tr)-1)
+            tr.insert(to_insert+1, tr[to_insert])
+        return [tr]
+
 
 class InsertRandomActivityPolluter(LogPolluter):
     """
@@ -154,6 +250,8 @@ class InsertRandomActivityPolluter(LogPolluter):
 
     Example: A B C D E --> A B C D {A/B/C/E} E
     """
+    streaming_unit = 'events'
+
     def __init__(self, percentage):
         self.percentage = percentage
 
@@ -170,17 +268,34 @@ class InsertRandomActivityPolluter(LogPolluter):
         for _ in range (to_duplicate):
             tr = random.choice(log_copy)
             trace_to_duplicate = random.randint(0, len(tr)-1)
-            tr.insert(trace_to_duplicate+1, tr[trace_to_duplicate])
-            tr[trace_to_duplicate+1]["concept:name"] = random.choice(list(log_activities))
+            # the inserted event is a copy, the event it was copied from keeps its label (as in pollute_trace)
+            new_event = Event(tr[trace_to_duplicate])
+            new_event["concept:name"] = random.choice(list(log_activities))
+            tr.insert(trace_to_duplicate+1, new_event)
 
         return log_copy
 
+    def stream_context(self, statistics):
+        return {'activities': list(statistics.activities)}
+
+    def pollute_trace(self, trace, edits, context):
+        tr = Trace(list(trace), attributes=dict(trace.attributes))
+        for _ in range(edits):
+            trace_to_duplicate = random.randint(0, len(tr)-1)
+            # the inserted event is a copy, the event it was copied from keeps its label
+            new_event = Event(tr[trace_to_duplicate])
+            new_event["concept:name"] = random.choice(context['activities'])
+            tr.insert(trace_to_duplicate+1, new_event)
+        return [tr]
+
 
 class DeleteActivityPolluter(LogPolluter):
     """
     Deletes a selected percentage of activities in the log
     Example: A B C D E --> A B C E
     """
+    streaming_unit = 'events'
+
     def __init__(self, percentage):
         self.percentage = percentage
 
@@ -220,12 +335,29 @@ class DeleteActivityPolluter(LogPolluter):
 
         return log_copy
 
+    def pollute_trace(self, trace, edits, context):
+        # every edit deletes one event (pollute draws a position past the end one time in len(tr)+1 and then deletes
+        # nothing), the edit deleting the last event deletes the trace and the edits left go to other traces
+        if edits and edits >= len(trace):
+            return []
+        tr = list(trace)
+        for _ in range(edits):
+            deletion_position = random.randint(0, len(tr)-1)
+            tr = tr[:deletion_position] + tr[deletion_position+1:]
+        return [Trace(tr, attributes=dict(trace.attributes))]
+
+    def unplaced_edits(self, trace, edits):
+        return max(edits - len(trace), 0)
+
 
 class DeleteTracePolluter(LogPolluter):
     """
     Deletes a selected percentage of traces in the log
     Example: L={t_1, t_2, t_3, t_4} --> L={t_1, t_2, t_4}
     """
+    streaming_unit = 'traces'
+    streaming_with_replacement = False
+
     def __init__(self, percentage):
         self.percentage = percentage
 
@@ -247,12 +379,17 @@ class DeleteTracePolluter(LogPolluter):
 
         return log_copy
 
+    def pollute_trace(self, trace, edits, context):
+        return [] if edits else [trace]
+
 
 class InsertDuplicateTracePolluter(LogPolluter):
     """
     Insert a selected percentage of duplicate traces in the log
     Example: L={t_1, t_2, t_3, t_4} --> L={t_1, t_2, t_3, t_3, t_4}
     """
+    streaming_unit = 'traces'
+
     def __init__(self, percentage):
         self.percentage = percentage
 
@@ -267,6 +404,10 @@ class InsertDuplicateTracePolluter(LogPolluter):
 
         return log_copy
 
+    def pollute_trace(self, trace, edits, context):
+        # the duplicates directly follow their original instead of being appended to the end of the log
+        return [trace] * (edits + 1)
+
 
 class ReplaceAlienActivityPolluter(LogPolluter):
     """
@@ -274,6 +415,8 @@ class ReplaceAlienActivityPolluter(LogPolluter):
 
     Example: A B C D E --> A B C xhfuej32 E
     """
+    streaming_unit = 'events'
+
     def __init__(self, percentage, alien_activity_nr= None):
         self.percentage = percentage
         self.alien_activity_nr = alien_activity_nr
@@ -300,6 +443,15 @@ class ReplaceAlienActivityPolluter(LogPolluter):
 
         return log_copy
 
+    def stream_context(self, statistics):
+        alien_activity_nr = self.alien_activity_nr
+        if alien_activity_nr is None:
+            alien_activity_nr = math.ceil(math.sqrt(statistics.number_of_events))
+        return {'alien_activities': [str(random.getrandbits(128)) for _ in range(alien_activity_nr)]}
+
+    def pollute_trace(self, trace, edits, context):
+        return [_replace_labels(trace, edits, lambda tr, to_replace: random.choice(context['alien_activities']))]
+
 
 class ReplaceRandomActivityPolluter(LogPolluter):
     """
@@ -307,6 +459,7 @@ class ReplaceRandomActivityPolluter(LogPolluter):
 
     Example: A B C D E --> A B C {A/B/C/D/E} E
     """
+    streaming_unit = 'events'
 
     def __init__(self, percentage):
         self.percentage = percentage
@@ -329,6 +482,12 @@ class ReplaceRandomActivityPolluter(LogPolluter):
 
         return log_copy
 
+    def stream_context(self, statistics):
+        return {'activities': list(statistics.activities)}
+
+    def pollute_trace(self, trace, edits, context):
+        return [_replace_labels(trace, edits, lambda tr, to_replace: random.choice(context['activities']))]
+
 
 class ReplaceDuplicateActivityPolluter(LogPolluter):
     """
@@ -336,6 +495,7 @@ class ReplaceDuplicateActivityPolluter(LogPolluter):
 
     Example: A B C D E --> A B C C E
     """
+    streaming_unit = 'events'
 
     def __init__(self, percentage):
         self.percentage = percentage
@@ -353,6 +513,9 @@ class ReplaceDuplicateActivityPolluter(LogPolluter):
 
         return log_copy
 
+    def pollute_trace(self, trace, edits, context):
+        return [_replace_labels(trace, edits, lambda tr, to_replace: tr[to_replace - 1]["concept:name"])]
+
 
 class DelayedEventLoggingPolluter(LogPolluter):
     """
@@ -360,6 +523,7 @@ class DelayedEventLoggingPolluter(LogPolluter):
 
     Example: 12:34:56 -> 12:34:56 + 14 min = 12:48:56
     """
+    streaming_unit = 'events'
 
     def __init__(self, percentage=1.0, distribution='gamma', parameters={'shape': 2, 'scale': 2}, mean_delay= None):
         self.percentage = percentage
@@ -406,12 +570,27 @@ class DelayedEventLoggingPolluter(LogPolluter):
 
         return log_copy
 
+    def stream_context(self, statistics):
+        mean_delay = self.mean_delay if self.mean_delay is not None else statistics.mean_delay
+        return {'rescale_factor': mean_delay / (self.parameters['shape'] * self.parameters['scale'])}
+
+    def pollute_trace(self, trace, edits, context):
+        tr = list(trace)
+        for _ in range(edits):
+            to_replace = 0 if len(tr) <= 1 else random.randint(0, len(tr)-1)
+            event = Event(tr[to_replace])
+            event["time:timestamp"] += dt.timedelta(minutes=np.random.gamma(shape=self.parameters['shape']) * context['rescale_factor'])
+            tr[to_replace] = event
+        # Sort the trace by timestamp as order of events may have shifted
+        return [Trace(sorted(tr, key=lambda event: event['time:timestamp']), attributes=dict(trace.attributes))]
+
 class AggregatedEventLoggingPolluter(LogPolluter):
     """
     Replaces the timestamp of an event with a more coarse-grained timestamp
 
     Example: 12:34:56 -> 12:00:00
     """
+    streaming_unit = 'events'
 
     # supported values for target_precision: day, hour, quarter, minute, second
     def __init__(self, percentage=1.0, target_precision='hour'):
@@ -464,6 +643,38 @@ class AggregatedEventLoggingPolluter(LogPolluter):
 
         return log_copy
 
+    def _coarsen(self, timestamp):
+        if self.target_precision == 'second':
+            return timestamp.replace(microsecond=0)
+        elif self.target_precision == 'minute':
+            return timestamp.replace(second=0, microsecond=0)
+        elif self.target_precision == 'quarter':
+            return timestamp.replace(minute=(timestamp.minute//15)*15, second=0, microsecond=0)
+        elif self.target_precision == 'hour':
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        elif self.target_precision == 'day':
+            return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        return timestamp
+
+    def pollute_trace(self, trace, edits, context):
+        tr = list(trace)
+        for _ in range(edits):
+            to_replace = 0 if len(tr) <= 1 else random.randint(0, len(tr)-1)
+            event = Event(tr[to_replace])
+            event["time:timestamp"] = self._coarsen(event["time:timestamp"])
+            tr[to_replace] = event
+
+        # Group events by timestamp, events with the same timestamp end up in random order
+        timestamp_groups = defaultdict(list)
+        for event in tr:
+            timestamp_groups[event['time:timestamp']].append(event)
+        new_tr = []
+        for ts in sorted(timestamp_groups.keys()):
+            group = timestamp_groups[ts]
+            random.shuffle(group)
+            new_tr.extend(group)
+        return [Trace(new_tr, attributes=dict(trace.attributes))]
+
 
 class PreciseActivityPolluter(LogPolluter):
     """
@@ -497,6 +708,21 @@ class PreciseActivityPolluter(LogPolluter):
 
         return log_copy
 
+    def stream_context(self, statistics):
+        activities_list = list(statistics.activities)
+        number_of_activities = math.ceil(len(activities_list) * self.percentage)
+        return {'to_pollute': set(activities_list[:number_of_activities])}
+
+    def pollute_trace(self, trace, edits, context):
+        tr = []
+        for event in trace:
+            if event["concept:name"] in context['to_pollute']:
+                event = Event(event)
+                for _ in range(self.imprecision_levels):
+                    event["concept:name"] += '_' + str(random.randint(1,5))
+            tr.append(event)
+        return [Trace(tr, attributes=dict(trace.attributes))]
+
 # polluter taking a list of precise activity labels and merging them into one (e.g., discharge in Sepsis)
 class ImpreciseActivityPolluter(LogPolluter):
     """
@@ -523,6 +749,31 @@ class ImpreciseActivityPolluter(LogPolluter):
 
         return log_copy
 
+    def pollute_trace(self, trace, edits, context):
+        tr = []
+        for event in trace:
+            if event["concept:name"] in self.precise_activity_labels:
+                event = Event(event)
+                event["concept:name"] = self.new_activity_label
+            tr.append(event)
+        return [Trace(tr, attributes=dict(trace.attributes))]
+
+
+def create_pollution_factories():
+    """
+    Polluters of the sensitivity analysis as functions of the pollution percentage, for sweeps that choose the
+    percentages themselves (see adaptive_sweep.py)
+    """
+    return [lambda x: InsertAlienActivityPolluter(x, "sqrt"),
+            #lambda x: InsertRandomActivityPolluter(x),
+            #lambda x: InsertDuplicateActivityPolluter(x),
+            #lambda x: ReplaceRandomActivityPolluter(x),
+            #lambda x: ReplaceDuplicateActivityPolluter(x),
+            lambda x: DeleteActivityPolluter(x),
+            lambda x: DeleteTracePolluter(x),
+            lambda x: AggregatedEventLoggingPolluter(percentage=x, target_precision='hour'),
+            lambda x: AggregatedEventLoggingPolluter(percentage=x, target_precision='day')]
+
 
 def create_pollution_testbed():
     percentages = [0.10, 0.20, 0.30, 0.40, 0.50, 0.60, 0.70, 0.80, 0.90]
@@ -585,59 +836,135 @@ def create_pollution_testbed():
 
 #    print(polluted_fitness_tbr['average_trace_fitness'], polluted_precision_tbr, polluted_generalization_tbr)
 
-def run_pipeline(event_log_path, dqis, discovery_technique, evaluation_method):
+def pollute_log(log, dqis, percentage=0.2, ground_truth=False):
+    """
+    Applies the given DQIs (names of polluters, see polluter_registry.py) to the log one after another.
+    With ground_truth, returns the polluted log and the GroundTruth of all DQIs together.
+    """
+    import polluter_registry
+
+    truth = None
+    for dqi in dqis:
+        # instantiated with percentage if possible, else default
+        polluter = polluter_registry.create_polluter(dqi, percentage=percentage)
+        if ground_truth:
+            log, dqi_truth = polluter.pollute_with_ground_truth(log)
+            truth = dqi_truth if truth is None else truth.then(dqi_truth)
+        else:
+            log = polluter.pollute(log)
+    return (log, truth) if ground_truth else log
+
+
+def discover_model(log, discovery_technique):
+    """
+    Discovers a Petri net with the given technique ('IM', 'alpha', 'ILP')
+    """
+    import discovery_index
+
+    index = discovery_index.get_index(log)
+    if discovery_technique == 'IM':
+        return index.discover_inductive()
+    elif discovery_technique == 'alpha':
+        return index.discover_alpha()
+    elif discovery_technique == 'ILP':
+        return index.discover_ilp()
+    else:
+        raise ValueError(f"Discovery technique '{discovery_technique}' is not supported.")
+
+
+def evaluate_model(log, net, im, fm, evaluation_method, processes=None, max_align_time_variant=None,
+                   max_align_memory_mb=None, target_error=None):
+    """
+    Evaluates the model on the log with the given evaluation method and returns the report as a list of lines
+    """
+    import conformance
+    import token_replay_engine
+
+    report = []
+    if evaluation_method == 'token-based replay':
+        compiled = conformance.get_compiled_net(net, im, fm)
+        fitness, precision, _ = token_replay_engine.evaluate(log, compiled)
+        report.append(f"Token-based replay fitness: {fitness['average_trace_fitness']}")
+        report.append(f"Token-based replay precision: {precision}")
+    elif evaluation_method == 'sampled token-based replay':
+        if target_error is None:
+            target_error = conformance.SAMPLE_TARGET_ERROR
+        result = conformance.evaluate_sampled(log, net, im, fm, target_error=target_error)
+        ci = result['confidence_intervals']
+        report.append(f"Replayed {result['exact_variants']} frequent variants, sampled {result['sample_size']} of {len(log)} traces"
+                      + ("" if result['target_reached'] else " (target error not reached)"))
+        report.append(f"Token-based replay fitness: {result['fitness']['average_trace_fitness']} (CI {ci['fitness'][0]:.4f} - {ci['fitness'][1]:.4f})")
+        report.append(f"Token-based replay precision: {result['precision']} (CI {ci['precision'][0]:.4f} - {ci['precision'][1]:.4f})")
+    elif evaluation_method == 'alignments':
+        if max_align_time_variant is None:
+            max_align_time_variant = conformance.MAX_ALIGN_TIME_VARIANT
+        result = conformance.evaluate_alignments(log, net, im, fm, processes=processes,
+                                                 max_align_time_variant=max_align_time_variant,
+                                                 max_align_memory_mb=max_align_memory_mb)
+        report.append(f"Alignment-based fitness: {result['fitness']['average_trace_fitness']}")
+        report.append(f"Alignment-based precision: {result['precision']}")
+        if result['timed_out_variants'] or result['timed_out_prefixes']:
+            report.append(f"Alignments exceeded the budget for {len(result['timed_out_variants'])} variants "
+                          f"and {len(result['timed_out_prefixes'])} prefixes:")
+            for activities, reason in result['timed_out_variants']:
+                report.append(f"  [{reason}] {', '.join(activities)}")
+    else:
+        raise ValueError(f"Evaluation method '{evaluation_method}' is not supported.")
+    return report
+
+
+def save_model(net, im, fm, out_dir='out/pipeline_results'):
+    """
+    Writes the model to out_dir and returns the path of the PNML file
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, 'discovered_model.pnml')
+    pm4py.write_pnml(net, im, fm, path)
+    return path
+
+
+def run_pipeline(event_log_path, dqis, discovery_technique, evaluation_method, processes=None,
+                 max_align_time_variant=None, max_align_memory_mb=None, target_error=None, seed=None,
+                 ground_truth_path=None):
     """
     Main pipeline for event log pollution analysis.
     Args:
         event_log_path (str): Path to the original event log file.
         dqis (list of str): List of DQIs to apply.
         discovery_technique (str): Discovery technique to use ('IM', 'alpha', 'ILP').
-        evaluation_method (str): Model evaluation approach ('token-based replay', 'alignments').
+        evaluation_method (str): Model evaluation approach ('token-based replay', 'sampled token-based replay', 'alignments').
+        processes (int, optional): Worker processes for alignments, defaults to the number of cores.
+        max_align_time_variant (float, optional): Time budget in seconds for the alignment of a single variant.
+        max_align_memory_mb (float, optional): Memory budget of an alignment worker, bounding its state space.
+        target_error (float, optional): Half-width of the confidence intervals of the sampled token-based replay.
+        seed (int, optional): Seed of the random number generators used by the polluters.
+        ground_truth_path (str, optional): Where to save which events the DQIs changed (see pollution_ground_truth.py).
     """
-    import pm4py
-    import os
+    import replicates
+
+    if seed is not None:
+        replicates.seed_everything(seed)
 
     # Load the event log
     log = pm4py.read_xes(event_log_path, return_legacy_log_object=True)
 
     # Apply DQIs (polluters)
-    for dqi in dqis:
-        polluter_class = globals().get(dqi)
-        if polluter_class is None:
-            raise ValueError(f"DQI '{dqi}' is not a supported polluter.")
-        # Try to instantiate with percentage if possible, else default
-        try:
-            polluter = polluter_class(percentage=0.2)
-        except TypeError:
-            polluter = polluter_class()
-        log = polluter.pollute(log)
+    if ground_truth_path is not None:
+        log, ground_truth = pollute_log(log, dqis, ground_truth=True)
+        ground_truth.save(ground_truth_path)
+        print(f"Ground truth saved to {ground_truth_path}: {ground_truth.counts()}")
+    else:
+        log = pollute_log(log, dqis)
 
     # Discover process model
-    if discovery_technique == 'IM':
-        net, im, fm = pm4py.discover_petri_net_inductive(log)
-    elif discovery_technique == 'alpha':
-        net, im, fm = pm4py.discover_petri_net_alpha(log)
-    elif discovery_technique == 'ILP':
-        net, im, fm = pm4py.discover_petri_net_ilp(log)
-    else:
-        raise ValueError(f"Discovery technique '{discovery_technique}' is not supported.")
+    net, im, fm = discover_model(log, discovery_technique)
 
     # Evaluate model
-    if evaluation_method == 'token-based replay':
-        fitness = pm4py.conformance.fitness_token_based_replay(log, net, im, fm)
-        precision = pm4py.conformance.precision_token_based_replay(log, net, im, fm)
-        print(f"Token-based replay fitness: {fitness['average_trace_fitness']}")
-        print(f"Token-based replay precision: {precision}")
-    elif evaluation_method == 'alignments':
-        fitness = pm4py.conformance.fitness_alignments(log, net, im, fm)
-        precision = pm4py.conformance.precision_alignments(log, net, im, fm)
-        print(f"Alignment-based fitness: {fitness['average_trace_fitness']}")
-        print(f"Alignment-based precision: {precision}")
-    else:
-        raise ValueError(f"Evaluation method '{evaluation_method}' is not supported.")
+    for line in evaluate_model(log, net, im, fm, evaluation_method, processes=processes,
+                               max_align_time_variant=max_align_time_variant,
+                               max_align_memory_mb=max_align_memory_mb, target_error=target_error):
+        print(line)
 
     # Optionally, save results or model
-    out_dir = 'out/pipeline_results'
-    os.makedirs(out_dir, exist_ok=True)
-    pm4py.write_pnml(net, im, fm, os.path.join(out_dir, 'discovered_model.pnml'))
-    print(f"Model saved to {os.path.join(out_dir, 'discovered_model.pnml')}")
\ No newline at end of file
+    model_path = save_model(net, im, fm)
+    print(f"Model saved to {model_path}")
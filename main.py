@@ -1,21 +1,164 @@
 import argparse
-from log_pollution import run_pipeline  # Assuming your pipeline logic is in log_pollution.py
+import os
+import sys
 
-def main():
-    parser = argparse.ArgumentParser(description="Run the event log pollution analysis pipeline.")
-    parser.add_argument('--event_log', type=str, required=True, help='Path to the original event log file.')
-    parser.add_argument('--dqis', type=str, nargs='+', required=True, help='List of DQIs to apply (see log_pollution.py for supported values).')
-    parser.add_argument('--discovery', type=str, choices=['IM', 'alpha', 'ILP'], required=True, help='Discovery technique to use.')
-    parser.add_argument('--evaluation', type=str, choices=['token-based replay', 'alignments'], required=True, help='Model evaluation approach.')
+import polluter_registry
+import worker_service
+
+
+"""
+Command line interface of the pipeline
+
+Subcommands:
+    run             pollute an event log, discover a model from it and evaluate the model (see log_pollution.run_pipeline)
+    list-dqis       list the supported DQIs
+    describe-log    print basic statistics of an event log
+    serve           start a resident worker that keeps logs and models warm (see worker_service.py)
+    startup-time    measure the startup time of this CLI against STARTUP_BUDGET_SECONDS
+
+Heavy modules (pm4py, pandas, numpy) are only imported by the commands that need them, so --help and argument errors
+return immediately. run --worker hands the job to a running worker instead of executing it in this process.
+Calls without a subcommand (python main.py --event_log ...) are treated as run.
+"""
+
+
+COMMANDS = ['run', 'list-dqis', 'describe-log', 'serve', 'startup-time']
+# modules that must not be imported before a command needs them
+HEAVY_MODULES = ['pm4py', 'pandas', 'numpy', 'mako']
+# median wall-clock time of "python main.py --help" that startup-time accepts
+STARTUP_BUDGET_SECONDS = 0.3
+
+
+def run(args):
+    if args.worker:
+        if args.ground_truth:
+            sys.exit("--ground_truth is not supported with --worker.")
+        job = {'command': 'run', 'event_log': args.event_log, 'dqis': args.dqis, 'discovery': args.discovery,
+               'evaluation': args.evaluation, 'processes': args.processes, 'max_align_time': args.max_align_time,
+               'max_align_memory': args.max_align_memory, 'target_error': args.target_error, 'seed': args.seed,
+               'out_dir': os.path.abspath('out/pipeline_results')}
+        response = worker_service.submit(job, args.worker)
+        if not response['ok']:
+            sys.exit(f"Worker failed: {response['error']}")
+        for line in response['report']:
+            print(line)
+        return
 
-    args = parser.parse_args()
+    from log_pollution import run_pipeline
 
     run_pipeline(
         event_log_path=args.event_log,
         dqis=args.dqis,
         discovery_technique=args.discovery,
-        evaluation_method=args.evaluation
+        evaluation_method=args.evaluation,
+        processes=args.processes,
+        max_align_time_variant=args.max_align_time,
+        max_align_memory_mb=args.max_align_memory,
+        target_error=args.target_error,
+        seed=args.seed,
+        ground_truth_path=args.ground_truth
     )
 
+
+def list_dqis(args):
+    for name in polluter_registry.names():
+        category, description = polluter_registry.POLLUTERS[name]
+        print(f"{name:<36}{category:<12}{description}")
+
+
+def describe_log(args):
+    import pm4py
+
+    log = pm4py.read_xes(args.event_log)
+    variants = log.groupby('case:concept:name', sort=False)['concept:name'].agg(tuple)
+    print(f"Cases:      {len(variants)}")
+    print(f"Events:     {len(log)}")
+    print(f"Variants:   {variants.nunique()}")
+    print(f"Activities: {log['concept:name'].nunique()}")
+    if 'time:timestamp' in log.columns:
+        print(f"Period:     {log['time:timestamp'].min()} - {log['time:timestamp'].max()}")
+
+
+def serve(args):
+    if args.stop:
+        worker_service.submit({'command': 'shutdown'}, args.socket)
+    elif args.stats:
+        print(worker_service.submit({'command': 'stats'}, args.socket))
+    else:
+        worker_service.serve(args.socket, log_cache_size=args.log_cache_size, model_cache_size=args.model_cache_size)
+
+
+def startup_time(args):
+    import statistics
+    import subprocess
+    import time
+
+    durations = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--help'], stdout=subprocess.DEVNULL, check=True)
+        durations.append(time.perf_counter() - start)
+    median = statistics.median(durations)
+    # this process got here through the same imports and parser as any other command
+    loaded = [module for module in HEAVY_MODULES if module in sys.modules]
+
+    print(f"Startup time: {median:.3f}s median of {args.repeat} runs (budget {STARTUP_BUDGET_SECONDS}s)")
+    if loaded:
+        print(f"Heavy modules imported at startup: {', '.join(loaded)}")
+    if median > STARTUP_BUDGET_SECONDS or loaded:
+        sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the event log pollution analysis pipeline.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Pollute an event log, discover a model and evaluate it.')
+    run_parser.add_argument('--event_log', type=str, required=True, help='Path to the original event log file.')
+    run_parser.add_argument('--dqis', type=str, nargs='+', required=True, choices=polluter_registry.names(), metavar='DQI', help='List of DQIs to apply (see list-dqis for supported values).')
+    run_parser.add_argument('--discovery', type=str, choices=['IM', 'alpha', 'ILP'], required=True, help='Discovery technique to use.')
+    run_parser.add_argument('--evaluation', type=str, choices=['token-based replay', 'sampled token-based replay', 'alignments'], required=True, help='Model evaluation approach.')
+    run_parser.add_argument('--processes', type=int, default=None, help='Worker processes for alignments (default: number of cores).')
+    run_parser.add_argument('--max_align_time', type=float, default=None, help='Time budget in seconds for the alignment of a single variant.')
+    run_parser.add_argument('--max_align_memory', type=float, default=None, help='Memory budget in MB of an alignment worker process.')
+    run_parser.add_argument('--target_error', type=float, default=None, help='Half-width of the confidence intervals of the sampled token-based replay (default: 0.01).')
+    run_parser.add_argument('--seed', type=int, default=None, help='Seed of the polluters, makes runs reproducible and lets a worker cache the polluted log and its model.')
+    run_parser.add_argument('--ground_truth', type=str, default=None, metavar='PATH', help='Save which events the DQIs inserted, relabelled, retimed, moved or deleted to PATH (.npz).')
+    run_parser.add_argument('--worker', type=str, nargs='?', const=worker_service.DEFAULT_SOCKET, default=None, metavar='SOCKET', help='Run the job on a worker started with serve (default socket: %(const)s).')
+    run_parser.set_defaults(func=run)
+
+    list_parser = subparsers.add_parser('list-dqis', help='List the supported DQIs.')
+    list_parser.set_defaults(func=list_dqis)
+
+    describe_parser = subparsers.add_parser('describe-log', help='Print basic statistics of an event log.')
+    describe_parser.add_argument('event_log', type=str, help='Path to the event log file.')
+    describe_parser.set_defaults(func=describe_log)
+
+    serve_parser = subparsers.add_parser('serve', help='Start a worker that keeps logs and models in memory.')
+    serve_parser.add_argument('--socket', type=str, default=worker_service.DEFAULT_SOCKET, help='Unix socket to listen on (default: %(default)s).')
+    serve_parser.add_argument('--log_cache_size', type=int, default=worker_service.LOG_CACHE_SIZE, help='Number of (polluted) logs kept in memory (default: %(default)s).')
+    serve_parser.add_argument('--model_cache_size', type=int, default=worker_service.MODEL_CACHE_SIZE, help='Number of models kept in memory (default: %(default)s).')
+    serve_parser.add_argument('--stats', action='store_true', help='Print the cache statistics of the running worker.')
+    serve_parser.add_argument('--stop', action='store_true', help='Stop the running worker.')
+    serve_parser.set_defaults(func=serve)
+
+    startup_parser = subparsers.add_parser('startup-time', help='Measure the startup time of this command line interface.')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='Number of measured runs (default: 5).')
+    startup_parser.set_defaults(func=startup_time)
+
+    return parser
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    # calls from before the subcommands
+    if argv and argv[0] not in COMMANDS and argv[0] not in ['-h', '--help']:
+        argv = ['run'] + argv
+
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,355 @@
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+
+"""
+Memory-aware scheduling of sweep cells
+
+A sweep cell (one polluter applied to the clean log, discovered and evaluated with every algorithm) holds the polluted
+copy of the log, pm4py's internal conversions and the discovered models at the same time; ILP on a large polluted log
+alone can take several GB. Running cells in parallel therefore needs to know how much memory each one will take.
+
+Cells run in worker processes forked from the calling process, which inherit the clean log and models (as in
+replicates.py). Inside a cell, every stage wrapped in stage(name, algorithm) records the peak of the unique set size
+of the worker (Private_Clean + Private_Dirty in /proc/self/smaps_rollup) above its size when the cell started. The
+pages the worker inherited stay shared until it writes to them, so the unique set size is what the cell adds to the
+memory of the machine, including the inherited pages it copied (e.g. by touching the reference counts of the clean
+log), which the resident set size above the size at the fork misses. The kernel keeps no peak of the unique set size:
+a thread samples it every SAMPLE_INTERVAL seconds. Where smaps_rollup is not available, the peak resident set size
+(VmHWM) is recorded instead, reset at the start of every stage through /proc/self/clear_refs. Work a stage runs in a
+subprocess (see cell_budget.py) counts with the peak the subprocess reports through report_peak.
+
+A CostModel learns from these observations, per (algorithm, stage) key, a linear model of the peak memory in the size of
+the log (number of events). The projected memory of a cell is the largest prediction over its stages. run_batch
+starts the cells with the largest projection first and admits further cells only while the projections of the
+running cells stay within the memory budget. Cells whose stages have never been observed are projected to take the
+whole budget, so they run alone until the model has learned from them. A cell whose worker dies (e.g. killed by the
+out-of-memory killer) or whose run_cell raises is recorded through the on_died or on_error callback of run_batch, and
+the batch goes on.
+"""
+
+
+DEFAULT_MODEL_PATH = 'out/memory_model.json'
+# projections are multiplied by this factor to leave some headroom
+SAFETY_FACTOR = 1.2
+# observations kept per (algorithm, stage)
+MAX_OBSERVATIONS = 100
+# seconds between two samples of the unique set size of a cell
+SAMPLE_INTERVAL = 0.05
+
+# peak memory (MB) per (algorithm, stage) of the cell running in this process, None outside of a cell
+_STAGE_PEAKS = None
+_BASELINE_MB = 0.0
+# peak memory (MB) of the subprocesses the current stage ran, see report_peak
+_SUBPROCESS_PEAK = 0.0
+# _PeakSampler of the cell (or budgeted subprocess) running in this process, None without smaps_rollup
+_SAMPLER = None
+# (run_cell, shared) of the running batch, inherited by the forked workers
+_BATCH = None
+
+
+def _status_mb(field):
+    # VmRSS / VmHWM of this process in MB, None if /proc is not available
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _uss_mb():
+    # unique set size (private pages) of this process in MB, None if smaps_rollup is not available
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            fields = [line.split() for line in smaps if line.startswith(('Private_Clean:', 'Private_Dirty:'))]
+    except OSError:
+        return None
+    if not fields:
+        return None
+    return sum(int(field[1]) for field in fields) / 1024
+
+
+class _PeakSampler:
+    """
+    Peak of the unique set size of this process since the last reset, sampled by a daemon thread
+    """
+
+    def __init__(self):
+        self.peak = _uss_mb()
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            self.sample()
+
+    def sample(self):
+        uss = _uss_mb()
+        if uss is not None:
+            self.peak = max(self.peak, uss)
+        return self.peak
+
+    def reset(self):
+        self.peak = _uss_mb()
+
+
+def _reset_peak():
+    if _SAMPLER is not None:
+        _SAMPLER.reset()
+        return
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def _peak_mb():
+    if _SAMPLER is not None:
+        return _SAMPLER.sample()
+    peak = _status_mb('VmHWM')
+    if peak is None:
+        # ru_maxrss is in kB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+
+def _start_sampler():
+    # measures the memory of this process from here on, with a sampler of its own if smaps_rollup is available
+    global _SAMPLER, _BASELINE_MB
+    _SAMPLER = _PeakSampler() if _uss_mb() is not None else None
+    _BASELINE_MB = _SAMPLER.peak if _SAMPLER is not None else _status_mb('VmRSS') or _peak_mb()
+
+
+def _start_cell():
+    global _STAGE_PEAKS
+    _STAGE_PEAKS = {}
+    _start_sampler()
+
+
+@contextmanager
+def stage(name, algorithm=''):
+    """
+    Records the peak memory of the enclosed block as stage name of the algorithm, if running in a scheduled cell
+    """
+    global _SUBPROCESS_PEAK
+    if _STAGE_PEAKS is None:
+        yield
+        return
+    _reset_peak()
+    _SUBPROCESS_PEAK = 0.0
+    try:
+        yield
+    finally:
+        peak = max(0.0, _peak_mb() - _BASELINE_MB, _SUBPROCESS_PEAK)
+        key = (algorithm, name)
+        _STAGE_PEAKS[key] = max(peak, _STAGE_PEAKS.get(key, 0.0))
+
+
+def cell_peak_mb():
+    """
+    Peak memory (MB) of this process above the memory of the cell when it started, None outside of a cell. A
+    subprocess forked by a cell calls start_subprocess first, so this is what the subprocess added to the cell.
+    """
+    if _STAGE_PEAKS is None:
+        return None
+    return max(0.0, _peak_mb() - _BASELINE_MB)
+
+
+def start_subprocess():
+    """
+    Starts measuring the memory of a subprocess forked by a cell (see cell_peak_mb). The sampling thread of the cell
+    does not survive the fork, and the pages the subprocess shares with the cell are not its own.
+    """
+    if _STAGE_PEAKS is not None and _SAMPLER is not None:
+        _start_sampler()
+
+
+def report_peak(peak_mb):
+    """
+    Counts the peak memory of a subprocess (see cell_peak_mb) towards the current stage
+    """
+    global _SUBPROCESS_PEAK
+    if peak_mb is not None:
+        _SUBPROCESS_PEAK = max(_SUBPROCESS_PEAK, peak_mb)
+
+
+class CostModel:
+    """
+    Peak memory of the stages of a cell as a linear function of the log size, learned from observations
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        # (algorithm, stage) -> [(log size, peak MB)]
+        self.observations = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for key, points in json.load(f).items():
+                    algorithm, name = key.split('|', 1)
+                    self.observations[(algorithm, name)] = [tuple(point) for point in points]
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({algorithm + '|' + name: points for (algorithm, name), points in self.observations.items()},
+                      f, indent=1, sort_keys=True)
+
+    def record(self, stage_peaks, size):
+        for key, peak in stage_peaks.items():
+            points = self.observations.setdefault(key, [])
+            points.append((size, peak))
+            del points[:-MAX_OBSERVATIONS]
+
+    def predict(self, key, size):
+        """
+        Predicted peak memory (MB) of a stage on a log of the given size, None if the stage was never observed
+        """
+        points = self.observations.get(key)
+        if not points:
+            return None
+        mean_size = sum(s for s, _ in points) / len(points)
+        mean_peak = sum(p for _, p in points) / len(points)
+        variance = sum((s - mean_size) ** 2 for s, _ in points)
+        if variance == 0:
+            # a single log size: proportional to the size
+            return mean_peak * size / mean_size if mean_size > 0 else mean_peak
+        slope = sum((s - mean_size) * (p - mean_peak) for s, p in points) / variance
+        # memory does not shrink with the size of the log
+        slope = max(slope, 0.0)
+        return max(0.0, mean_peak + slope * (size - mean_size))
+
+    def project(self, keys, size, budget_mb):
+        """
+        Projected memory (MB) of a cell running the given stages, the whole budget if one of them was never observed
+        """
+        predictions = [self.predict(key, size) for key in keys]
+        if not predictions or any(p is None for p in predictions):
+            return budget_mb
+        return min(budget_mb, SAFETY_FACTOR * max(predictions))
+
+
+def _run_cell(index, cell, results):
+    run_cell, shared = _BATCH
+    _start_cell()
+    try:
+        rows = run_cell(shared, cell)
+        results.put((index, rows, _STAGE_PEAKS, None))
+    except Exception:
+        results.put((index, None, _STAGE_PEAKS, traceback.format_exc()))
+
+
+def run_batch(run_cell, shared, cells, sizes, stages, budget_mb, cost_model=None, processes=None, on_died=None,
+              on_error=None):
+    """
+    Runs the cells in forked worker processes within a memory budget.
+
+    Parameters
+    ----------
+    run_cell : callable
+        Called as run_cell(shared, cell) in a worker, returns a list of result rows. Its stages are wrapped in stage().
+    shared :
+        Artifacts needed by all cells (e.g. the clean log and models), inherited by the workers.
+    cells : list
+        The cells to run, e.g. polluters.
+    sizes : list of int
+        Size of the log each cell works on (number of events), the variable of the cost model.
+    stages : callable
+        Called as stages(cell), returns the (algorithm, stage) keys the cell goes through.
+    budget_mb : float
+        Memory the running cells may take together, on top of the memory of this process.
+    cost_model : CostModel, optional
+        Learned cost model, updated with the observations of this batch and saved at the end.
+    processes : int, optional
+        Maximum number of cells running at the same time, defaults to the number of cores.
+    on_died : callable, optional
+        Called as on_died(shared, cell) for a cell whose worker died without a result (e.g. killed by the
+        out-of-memory killer), returns the result rows recorded for it. Dead cells have no rows by default.
+    on_error : callable, optional
+        Called as on_error(shared, cell, traceback) for a cell whose run_cell raised an exception, returns the result
+        rows recorded for it. Failed cells have no rows by default.
+
+    Returns
+    -------
+    list of dict
+        Result rows of all cells, in the order of the cells.
+    """
+    global _BATCH
+    if cost_model is None:
+        cost_model = CostModel()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    _BATCH = (run_cell, shared)
+    cell_stages = [stages(cell) for cell in cells]
+
+    pending = list(range(len(cells)))
+    running = {}    # cell index -> (process, projected MB)
+    rows = [None] * len(cells)
+    try:
+        while pending or running:
+            # projections change as the model learns, the largest cells go first and smaller ones fill the budget
+            projected = {i: cost_model.project(cell_stages[i], sizes[i], budget_mb) for i in pending}
+            pending.sort(key=lambda i: projected[i], reverse=True)
+            used = sum(p for _, p in running.values())
+            for i in list(pending):
+                if len(running) >= processes:
+                    break
+                if running and used + projected[i] > budget_mb:
+                    continue
+                process = context.Process(target=_run_cell, args=(i, cells[i], results))
+                process.start()
+                running[i] = (process, projected[i])
+                used += projected[i]
+                pending.remove(i)
+
+            try:
+                finished = [results.get(timeout=1)]
+            except queue.Empty:
+                finished = []
+            dead = [i for i, (process, _) in running.items() if process.exitcode not in (None, 0)]
+            if dead:
+                # a cell may have sent its result before it died, the results already sent are taken first
+                while True:
+                    try:
+                        finished.append(results.get_nowait())
+                    except queue.Empty:
+                        break
+
+            # the other cells go on, a failed or dead cell keeps what on_error or on_died records for it
+            for index, cell_rows, stage_peaks, error in finished:
+                process, _ = running.pop(index)
+                process.join()
+                cost_model.record(stage_peaks, sizes[index])
+                if error is None:
+                    rows[index] = cell_rows
+                else:
+                    print(f"WARNING: cell {cells[index]} failed:\n{error}")
+                    rows[index] = [] if on_error is None else on_error(shared, cells[index], error)
+            for i in dead:
+                if i in running:
+                    process, _ = running.pop(i)
+                    print(f"WARNING: cell {cells[i]} died with exit code {process.exitcode} (out of memory?)")
+                    process.join()
+                    rows[i] = [] if on_died is None else on_died(shared, cells[i])
+    finally:
+        for process, _ in running.values():
+            process.terminate()
+        _BATCH = None
+        cost_model.save()
+
+    return [row for cell_rows in rows for row in cell_rows]
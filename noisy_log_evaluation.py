@@ -1,5 +1,19 @@
+import json
+import sys
+
 import pandas
 from log_pollution import *
+import adaptive_sweep
+import artifact_writer
+import cell_budget
+import conformance
+import discovery_index
+import incremental_dfg
+import memory_scheduler
+import polluted_log_cache
+import replicates
+import results_store
+import work_queue
 
 INPUTS = [
             #("RTFM_perfect_fitting_cases.xes", "RTFM_inductive.pnml"),
@@ -11,31 +25,241 @@ INPUTS = [
 
 ALGORITHMS = ["IM_0.0", "IM_0.2", "ALPHA", "ILP_0.8", "ILP_1.0"]
 
+# model evaluation method, one of conformance.EVALUATION_METHODS ("tbr", "sampled" or "alignments"), and its parameters
+EVALUATION = "tbr"
+EVALUATION_PARAMETERS = {}
+
+# fitness and precision result columns carry the evaluation method, generalization is always token-based
+METRIC_SUFFIX = conformance.METRIC_SUFFIXES[EVALUATION]
+
+# adaptive sweep over the pollution percentages of create_pollution_factories instead of create_pollution_testbed
+ADAPTIVE_SWEEP = False
+ADAPTIVE_COARSE_GRID = [0.1, 0.5, 0.9]
+ADAPTIVE_TOLERANCE = 0.02
+ADAPTIVE_MAX_CELLS = 300  # for the whole sweep, one cell = one algorithm at one percentage
+# metrics whose changes and rankings decide where the percentages are refined
+ADAPTIVE_METRICS = [metric + "_" + lm for metric in ["fitness_" + METRIC_SUFFIX, "precision_" + METRIC_SUFFIX]
+                    for lm in ["pl-pm", "pl-cm", "cl-pm"]]
+
+# replicates: every polluter of create_pollution_testbed is applied once per seed, an empty list runs the plain sweep
+REPLICATE_SEEDS = []    # e.g. list(range(10))
+REPLICATE_PROCESSES = None
+REPLICATE_METRICS = [metric + "_" + lm for metric in ["fitness_" + METRIC_SUFFIX, "precision_" + METRIC_SUFFIX,
+                                                      "generalization_tbr"]
+                     for lm in ["cl-bm", "cl-cm", "pl-pm", "pl-cm", "cl-pm"]]
+
+# memory budget (MB) of the sweep cells running in parallel, None runs the cells one after the other in this process
+MEMORY_BUDGET_MB = None
+MEMORY_PROCESSES = None
+# peak memory observed per algorithm and stage, from which the memory of the cells is projected
+MEMORY_MODEL = memory_scheduler.DEFAULT_MODEL_PATH
+
+# seed of the pollutions of the sweep: every algorithm works on the same polluted log, which is cached on disk (see
+# polluted_log_cache.py) and reused by later runs; None pollutes anew for every algorithm, without caching. Every
+# result row records the seed its log was polluted with in its seed column
+POLLUTION_SEED = 0
+# pollute trace by trace (streaming_pollution.pollute_with_edits), a different draw of the same pollution that keeps
+# the edits: the DFG ALPHA discovers from is then patched from that of the clean log (see incremental_dfg.py). False
+# keeps the polluted logs of LogPolluter.pollute
+POLLUTE_WITH_EDITS = False
+
+# model views are rendered in the background (see artifact_writer.py), False skips them, the sample rate is the
+# fraction of the cells whose view is rendered
+ARTIFACT_WRITES = True
+ARTIFACT_SAMPLE_RATE = 1.0
+
+# every result row is also stored in the results database (see results_store.py), None disables it
+RESULTS_DB = results_store.DEFAULT_PATH
+
+# shared directory of a sweep distributed over several machines (see work_queue.py), None runs the sweep here. The
+# coordinator (python noisy_log_evaluation.py) queues one task per algorithm, polluter and seed (REPLICATE_SEEDS, or
+# else POLLUTION_SEED) and works on them with QUEUE_LOCAL_WORKERS processes, the other machines run
+# python noisy_log_evaluation.py worker. The input paths have to be the same on every machine.
+QUEUE_DIR = None
+QUEUE_LOCAL_WORKERS = 1
+QUEUE_LEASE_SECONDS = work_queue.LEASE_SECONDS
+
+# wall-clock (seconds) and memory (MB) budget of a cell, the discovery of one algorithm on a polluted log and its three
+# evaluations, which then run in killable subprocesses (see cell_budget.py); None disables a budget. A cell exceeding
+# its budget gets a row with a status, its timings so far and no polluted metrics, and the sweep goes on. Budgeted
+# rows have the columns status ("ok" or e.g. "timeout:pl-cm"), discovery_coverage and seconds_<call>.
+CELL_TIME_BUDGET_SECONDS = None
+CELL_MEMORY_BUDGET_MB = None
+# a discovery exceeding the budget is retried once, with a fresh budget, on the most frequent variants covering this
+# fraction of the traces of the polluted log; None records the cell as exceeded instead
+BUDGET_RETRY_COVERAGE = None
+
+def patched_dfg_counts(l):
+    # DFG counts of a log polluted with edits, patched from those of its clean log; None for other logs, whose DFG is
+    # that of their discovery index (counted in the same scan as their variants)
+    edits = polluted_log_cache.get_edits(l)
+    if edits is None:
+        return None
+    return incremental_dfg.get_counts(l, edits)
+
 def run_algorithm(l ,alg_ID):
+    if alg_ID == "ALPHA":
+        counts = patched_dfg_counts(l)
+        if counts is not None:
+            return counts.discover_alpha()
+    # all algorithms on the same log share its variants and DFG
+    index = discovery_index.get_index(l)
     if alg_ID == "IM_0.0":
-        return  pm4py.discover_petri_net_inductive(l, noise_threshold=0.0)
+        return  index.discover_inductive(0.0)
     elif alg_ID == "IM_0.2":
-        return  pm4py.discover_petri_net_inductive(l, noise_threshold=0.2)
+        return  index.discover_inductive(0.2)
     elif alg_ID == "ALPHA":
-        return pm4py.discovery.discover_petri_net_alpha(l)
+        return index.discover_alpha()
     elif alg_ID == "ILP_1.0":
-        return pm4py.discovery.discover_petri_net_ilp(l, 1.0)
+        return index.discover_ilp(1.0)
     elif alg_ID == "ILP_0.8":
-        return pm4py.discovery.discover_petri_net_ilp(l, 0.8)
+        return index.discover_ilp(0.8)
     else:
         print("ERROR: provided algorithm unknown")
         return
 
+def discover_within_budget(polluted_log, algorithm, budget):
+    """
+    Discovers the model of the polluted log within the budget of the cell. If the budget is exceeded and
+    BUDGET_RETRY_COVERAGE is set, the discovery is retried once, with a fresh budget, on the most frequent variants
+    of the log. Returns (net, im, fm, fraction of the traces the model was discovered from).
+    """
+    if not budget.enabled:
+        return run_algorithm(polluted_log, algorithm) + (1.0,)
+    # the variants and DFG are computed here, so that the subprocess inherits them and the other algorithms share them
+    if algorithm != "ALPHA" or patched_dfg_counts(polluted_log) is None:
+        discovery_index.get_index(polluted_log)
+    try:
+        return budget.call('discover', run_algorithm, polluted_log, algorithm) + (1.0,)
+    except cell_budget.BudgetExceeded as exceeded:
+        if BUDGET_RETRY_COVERAGE is None:
+            raise
+        print("> Discovery exceeded the budget (" + exceeded.status + "), retrying on the most frequent variants")
+    reduced_log = cell_budget.reduce_to_frequent_variants(polluted_log, BUDGET_RETRY_COVERAGE)
+    budget.restart()
+    return budget.call('discover_reduced', run_algorithm, reduced_log, algorithm) + (len(reduced_log) / len(polluted_log),)
+
+
+def result_row(algorithm, polluter, metrics):
+    """
+    Result row of a cell, metrics maps every setting (cl-bm, cl-cm, pl-pm, pl-cm, cl-pm) to its (fitness, precision,
+    generalization), or to None if it was not evaluated
+    """
+    #algorithm properties
+    results = {"algorithm": algorithm}
+
+    #polluter properties
+    results.update(polluter.get_properties())
+
+    #sensitivity scenario_results
+    for setting in ["cl-bm", "cl-cm", "pl-pm", "pl-cm", "cl-pm"]:
+        if metrics[setting] is None:
+            fitness, precision, generalization = float("nan"), float("nan"), float("nan")
+        else:
+            fitness, precision, generalization = metrics[setting]
+            fitness, precision, generalization = (str(fitness['average_trace_fitness']), str(precision),
+                                                  str(generalization))
+        results["fitness_" + METRIC_SUFFIX + "_" + setting] = fitness
+        results["precision_" + METRIC_SUFFIX + "_" + setting] = precision
+        results["generalization_tbr_" + setting] = generalization
+        # how reliable the metrics are, e.g. the share of the traces whose alignment exceeded its budget
+        for diagnostic in conformance.DIAGNOSTICS[EVALUATION]:
+            results[diagnostic + "_" + setting] = (float("nan") if metrics[setting] is None
+                                                   else metrics[setting][0].get(diagnostic, float("nan")))
+
+    return results
+
+
+def evaluate_polluted_log(clean_log, polluted_log, polluter, algorithm, clean_model, clean_im, clean_fm,
+                          cl_bm_metrics, cl_cm_metrics, log_name):
+    fitness_tbr_cl_bm, precision_tbr_cl_bm, generalization_tbr_cl_bm = cl_bm_metrics
+    fitness_tbr_cl_cm, precision_tbr_cl_cm, generalization_tbr_cl_cm = cl_cm_metrics
+    budget = cell_budget.CellBudget(CELL_TIME_BUDGET_SECONDS, CELL_MEMORY_BUDGET_MB)
+    discovery_coverage = None
+
+    try:
+        #coduct analysis on polluted log and retrieve relevant metrics
+        with memory_scheduler.stage('discover', algorithm):
+            polluted_model, polluted_im, polluted_fm, discovery_coverage = discover_within_budget(polluted_log,
+                                                                                                  algorithm, budget)
+
+        artifact_writer.save_petri_net_view(polluted_model, polluted_im, polluted_fm,
+                                            'out/scenario_results/Sepsis Cases - Event Log_0_2_inductive_imprecise_activity.png')
+
+        with memory_scheduler.stage('evaluate', algorithm):
+            if budget.enabled:
+                # the log indices and compiled nets are built here, so that the subprocesses of the evaluations
+                # inherit them and the next cells on the same logs and clean model reuse them
+                conformance.prepare(polluted_log, polluted_model, polluted_im, polluted_fm)
+                conformance.prepare(polluted_log, clean_model, clean_im, clean_fm)
+                conformance.prepare(clean_log, polluted_model, polluted_im, polluted_fm)
+
+            #polluted log vs polluted model
+            print("> Polluted Log vs Polluted Model")
+            polluted_fitness_tbr_pl_pm, polluted_precision_tbr_pl_pm, polluted_generalization_tbr_pl_pm = budget.call(
+                'pl-pm', conformance.evaluate, polluted_log, polluted_model, polluted_im, polluted_fm, EVALUATION,
+                **EVALUATION_PARAMETERS)
+
+            #polluted log vs clean model
+            print("> Polluted Log vs Clean Model")
+            polluted_fitness_tbr_pl_cm, polluted_precision_tbr_pl_cm, polluted_generalization_tbr_pl_cm = budget.call(
+                'pl-cm', conformance.evaluate, polluted_log, clean_model, clean_im, clean_fm, EVALUATION,
+                **EVALUATION_PARAMETERS)
+
+            #clean log vs polluted model
+            print("> Clean Log vs Polluted Model")
+            polluted_fitness_tbr_cl_pm, polluted_precision_tbr_cl_pm, polluted_generalization_tbr_cl_pm = budget.call(
+                'cl-pm', conformance.evaluate, clean_log, polluted_model, polluted_im, polluted_fm, EVALUATION,
+                **EVALUATION_PARAMETERS)
+    except cell_budget.BudgetExceeded as exceeded:
+        # the cell is recorded with the metrics it has and the sweep goes on with the next one
+        print()
+        print(log_name+ " - POLLUTION: "+algorithm, str(polluter.get_properties()))
+        print("> Budget exceeded (" + exceeded.status + ") in " + exceeded.call + " after "
+              + ", ".join(name + " " + format(seconds, ".1f") + "s" for name, seconds in budget.seconds.items()))
+        print()
+        results = result_row(algorithm, polluter, {"cl-bm": cl_bm_metrics, "cl-cm": cl_cm_metrics, "pl-pm": None,
+                                                   "pl-cm": None, "cl-pm": None})
+        results["status"] = exceeded.status + ":" + exceeded.call
+        results["discovery_coverage"] = discovery_coverage
+        results.update({"seconds_" + name: seconds for name, seconds in budget.seconds.items()})
+        return results
+
+    print()
+    print(log_name+ " - POLLUTION: "+algorithm, str(polluter.get_properties()))
+
+    print("-" * 78)
+    print("     \t{:<24}{:<24}{:<24}".format("Fitness", "Precision", "Generalization"))
+    print("-" * 78)
+    print("cl-bm:\t{:<24}{:<24}{:<24}".format(str(fitness_tbr_cl_bm['log_fitness']), str(precision_tbr_cl_bm), str(generalization_tbr_cl_bm)))
+    print("cl-cm:\t{:<24}{:<24}{:<24}".format(str(fitness_tbr_cl_cm['log_fitness']),str(precision_tbr_cl_cm), str(generalization_tbr_cl_cm)))
+    print("pl-pm:\t{:<24}{:<24}{:<24}".format(str(polluted_fitness_tbr_pl_pm['log_fitness']),str(polluted_precision_tbr_pl_pm), str(polluted_generalization_tbr_pl_pm)))
+    print("pl-cm:\t{:<24}{:<24}{:<24}".format(str(polluted_fitness_tbr_pl_cm['log_fitness']),str(polluted_precision_tbr_pl_cm), str(polluted_generalization_tbr_pl_cm)))
+    print("cl-pm:\t{:<24}{:<24}{:<24}".format(str(polluted_fitness_tbr_cl_pm['log_fitness']), str(polluted_precision_tbr_cl_pm), str(polluted_generalization_tbr_cl_pm)))
+
+    print()
+    print()
+    results = result_row(algorithm, polluter, {
+        "cl-bm": cl_bm_metrics,
+        "cl-cm": cl_cm_metrics,
+        "pl-pm": (polluted_fitness_tbr_pl_pm, polluted_precision_tbr_pl_pm, polluted_generalization_tbr_pl_pm),
+        "pl-cm": (polluted_fitness_tbr_pl_cm, polluted_precision_tbr_pl_cm, polluted_generalization_tbr_pl_cm),
+        "cl-pm": (polluted_fitness_tbr_cl_pm, polluted_precision_tbr_cl_pm, polluted_generalization_tbr_cl_pm)})
+    if budget.enabled:
+        results["status"] = "ok"
+        results["discovery_coverage"] = discovery_coverage
+        results.update({"seconds_" + name: seconds for name, seconds in budget.seconds.items()})
+    return results
+
+
 def sensitivity_analysis_discovery(clean_log, baseline_model, baseline_im, baseline_fm, log_name):
     sensitivity_results = []
 
     print(log_name+ " - Baseline Analysis")
     print("> Clean Log vs Baseline Model")
 
-    fitness_tbr_cl_bm = pm4py.conformance.fitness_token_based_replay(clean_log, baseline_model, baseline_im, baseline_fm)
-    precision_tbr_cl_bm = pm4py.conformance.precision_token_based_replay(clean_log, baseline_model, baseline_im,
-                                                                   baseline_fm)
-    generalization_tbr_cl_bm = pm4py.conformance.generalization_tbr(clean_log, baseline_model, baseline_im, baseline_fm)
+    cl_bm_metrics = conformance.evaluate(clean_log, baseline_model, baseline_im, baseline_fm, EVALUATION,
+                                         **EVALUATION_PARAMETERS)
 
     for algorithm in ALGORITHMS:
 
@@ -45,105 +269,283 @@ def sensitivity_analysis_discovery(clean_log, baseline_model, baseline_im, basel
         #clean log - token-based replay metrics
         print("> Clean Log vs Clean Model")
 
-        fitness_tbr_cl_cm = pm4py.conformance.fitness_token_based_replay(clean_log, clean_model, clean_im, clean_fm)
-        precision_tbr_cl_cm = pm4py.conformance.precision_token_based_replay(clean_log, clean_model, clean_im, clean_fm)
-        generalization_tbr_cl_cm = pm4py.conformance.generalization_tbr(clean_log, clean_model, clean_im, clean_fm)
+        cl_cm_metrics = conformance.evaluate(clean_log, clean_model, clean_im, clean_fm, EVALUATION,
+                                             **EVALUATION_PARAMETERS)
 
 
     #sensitivity analysis
         for polluter in create_pollution_testbed():
             print(log_name+ " - POLLUTION: "+algorithm, str(polluter.get_properties()))
 
-            #apply pollution pattern
-            #TODO copy the log here already and remove from each of the function calls
-            polluted_log = polluter.pollute(clean_log)
+            #apply pollution pattern, shared by all algorithms
+            polluted_log = polluted_log_cache.get_polluted_log(clean_log, polluter, POLLUTION_SEED,
+                                                               with_edits=POLLUTE_WITH_EDITS)
 
-            #coduct analysis on polluted log and retrieve relevant metrics
-            polluted_model, polluted_im, polluted_fm = run_algorithm(polluted_log, algorithm)
+            results = evaluate_polluted_log(clean_log, polluted_log, polluter, algorithm, clean_model, clean_im,
+                                            clean_fm, cl_bm_metrics, cl_cm_metrics, log_name)
+            # the seed the log was polluted with, None if it was polluted unseeded
+            results["seed"] = POLLUTION_SEED
+            sensitivity_results.append(results)
 
-            pm4py.vis.save_vis_petri_net(polluted_model, polluted_im, polluted_fm,
-                                         'out/scenario_results/Sepsis Cases - Event Log_0_2_inductive_imprecise_activity.png')
 
-            #polluted log vs polluted model
-            print("> Polluted Log vs Polluted Model")
-            polluted_fitness_tbr_pl_pm = pm4py.conformance.fitness_token_based_replay(polluted_log, polluted_model, polluted_im, polluted_fm)
-            polluted_precision_tbr_pl_pm = pm4py.conformance.precision_token_based_replay(polluted_log, polluted_model, polluted_im, polluted_fm)
-            polluted_generalization_tbr_pl_pm = pm4py.conformance.generalization_tbr(polluted_log, polluted_model, polluted_im, polluted_fm)
+    return sensitivity_results
 
-            #polluted log vs clean model
-            print("> Polluted Log vs Clean Model")
-            polluted_fitness_tbr_pl_cm = pm4py.conformance.fitness_token_based_replay(polluted_log, clean_model, clean_im, clean_fm)
-            polluted_precision_tbr_pl_cm = pm4py.conformance.precision_token_based_replay(polluted_log, clean_model, clean_im, clean_fm)
-            polluted_generalization_tbr_pl_cm = pm4py.conformance.generalization_tbr(polluted_log, clean_model, clean_im, clean_fm)
 
-            #clean log vs polluted model
-            print("> Clean Log vs Polluted Model")
-            polluted_fitness_tbr_cl_pm = pm4py.conformance.fitness_token_based_replay(clean_log, polluted_model, polluted_im, polluted_fm)
-            polluted_precision_tbr_cl_pm = pm4py.conformance.precision_token_based_replay(clean_log, polluted_model, polluted_im, polluted_fm)
-            polluted_generalization_tbr_cl_pm = pm4py.conformance.generalization_tbr(clean_log, polluted_model, polluted_im, polluted_fm)
-            print()
-            print(log_name+ " - POLLUTION: "+algorithm, str(polluter.get_properties()))
+def evaluate_clean_side(clean_log, baseline_model, baseline_im, baseline_fm, log_name):
+    """
+    Clean-log artifacts that do not depend on the pollution: the baseline metrics (cl-bm), and the clean model and
+    its metrics (cl-cm) per algorithm. Returns (cl_bm_metrics, clean_models, cl_cm_metrics).
+    """
+    print(log_name+ " - Baseline Analysis")
+    cl_bm_metrics = conformance.evaluate(clean_log, baseline_model, baseline_im, baseline_fm, EVALUATION,
+                                         **EVALUATION_PARAMETERS)
+
+    clean_models = {}
+    cl_cm_metrics = {}
+    for algorithm in ALGORITHMS:
+        print(log_name+ " - Clean Log Analysis: "+algorithm)
+        clean_models[algorithm] = run_algorithm(clean_log, algorithm)
+        cl_cm_metrics[algorithm] = conformance.evaluate(clean_log, *clean_models[algorithm], EVALUATION,
+                                                        **EVALUATION_PARAMETERS)
 
-            print("-" * 78)
-            print("     \t{:<24}{:<24}{:<24}".format("Fitness", "Precision", "Generalization"))
-            print("-" * 78)
-            print("cl-bm:\t{:<24}{:<24}{:<24}".format(str(fitness_tbr_cl_bm['log_fitness']), str(precision_tbr_cl_bm), str(generalization_tbr_cl_bm)))
-            print("cl-cm:\t{:<24}{:<24}{:<24}".format(str(fitness_tbr_cl_cm['log_fitness']),str(precision_tbr_cl_cm), str(generalization_tbr_cl_cm)))
-            print("pl-pm:\t{:<24}{:<24}{:<24}".format(str(polluted_fitness_tbr_pl_pm['log_fitness']),str(polluted_precision_tbr_pl_pm), str(polluted_generalization_tbr_pl_pm)))
-            print("pl-cm:\t{:<24}{:<24}{:<24}".format(str(polluted_fitness_tbr_pl_cm['log_fitness']),str(polluted_precision_tbr_pl_cm), str(polluted_generalization_tbr_pl_cm)))
-            print("cl-pm:\t{:<24}{:<24}{:<24}".format(str(polluted_fitness_tbr_cl_pm['log_fitness']), str(polluted_precision_tbr_cl_pm), str(polluted_generalization_tbr_cl_pm)))
-
-            print()
-            print()
-            #algorithm properties
-            results = {"algorithm": algorithm}
-
-            #polluter properties
-            results.update(polluter.get_properties())
-
-            #sensitivity scenario_results
-
-            # Clean Log vs. Baseline Model
-            results["fitness_tbr_cl-bm"] = str(fitness_tbr_cl_bm['average_trace_fitness'])
-            results["precision_tbr_cl-bm"] = str(precision_tbr_cl_bm)
-            results["generalization_tbr_cl-bm"] = str(generalization_tbr_cl_bm)
-
-            # Clean Log vs. Clean Model
-            results["fitness_tbr_cl-cm"] = str(fitness_tbr_cl_cm['average_trace_fitness'])
-            results["precision_tbr_cl-cm"] = str(precision_tbr_cl_cm)
-            results["generalization_tbr_cl-cm"] = str(generalization_tbr_cl_cm)
-
-            # Polluted Log vs. Polluted Model
-            results["fitness_tbr_pl-pm"] = str(polluted_fitness_tbr_pl_pm['average_trace_fitness'])
-            results["precision_tbr_pl-pm"] = str(polluted_precision_tbr_pl_pm)
-            results["generalization_tbr_pl-pm"] = str(polluted_generalization_tbr_pl_pm)
-
-            # Polluted Log vs. Clean Model
-            results["fitness_tbr_pl-cm"] = str(polluted_fitness_tbr_pl_cm['average_trace_fitness'])
-            results["precision_tbr_pl-cm"] = str(polluted_precision_tbr_pl_cm)
-            results["generalization_tbr_pl-cm"] = str(polluted_generalization_tbr_pl_cm)
-
-            #Clean Log vs. Polluted Model
-            results["fitness_tbr_cl-pm"] = str(polluted_fitness_tbr_cl_pm['average_trace_fitness'])
-            results["precision_tbr_cl-pm"] = str(polluted_precision_tbr_cl_pm)
-            results["generalization_tbr_cl-pm"] = str(polluted_generalization_tbr_cl_pm)
+    return cl_bm_metrics, clean_models, cl_cm_metrics
 
-            sensitivity_results.append(results)
 
+def adaptive_sensitivity_analysis_discovery(clean_log, baseline_model, baseline_im, baseline_fm, log_name):
+    """
+    Same analysis as sensitivity_analysis_discovery, but each polluter of create_pollution_factories is swept over
+    adaptively refined pollution percentages (see adaptive_sweep.py) instead of a fixed grid.
+    All algorithms are evaluated on the same polluted log of a percentage, which keeps their rankings comparable.
+    """
+    sensitivity_results = []
+    cl_bm_metrics, clean_models, cl_cm_metrics = evaluate_clean_side(clean_log, baseline_model, baseline_im,
+                                                                     baseline_fm, log_name)
+
+    # rows of every polluter (by its position among the factories) and percentage
+    rows = {}
+
+    def percentage_evaluator(sweep, create_polluter):
+        rows[sweep] = {}
+
+        def evaluate_percentage(percentage):
+            polluter = create_polluter(percentage)
+            print(log_name+ " - POLLUTION: ", str(polluter.get_properties()))
+            polluted_log = polluted_log_cache.get_polluted_log(clean_log, polluter, POLLUTION_SEED,
+                                                               with_edits=POLLUTE_WITH_EDITS)
+            rows[sweep][percentage] = {algorithm: dict(evaluate_polluted_log(clean_log, polluted_log, polluter,
+                                                                             algorithm, *clean_models[algorithm],
+                                                                             cl_bm_metrics, cl_cm_metrics[algorithm],
+                                                                             log_name), seed=POLLUTION_SEED)
+                                       for algorithm in ALGORITHMS}
+            return {algorithm: {metric: float(row[metric]) for metric in ADAPTIVE_METRICS}
+                    for algorithm, row in rows[sweep][percentage].items()}
+        return evaluate_percentage
+
+    # all polluters share the cell budget, the intervals in which the metrics change most are refined first
+    adaptive_sweep.refine_sweep({sweep: percentage_evaluator(sweep, create_polluter)
+                                 for sweep, create_polluter in enumerate(create_pollution_factories())},
+                                ALGORITHMS, ADAPTIVE_METRICS, coarse_grid=ADAPTIVE_COARSE_GRID,
+                                tolerance=ADAPTIVE_TOLERANCE, max_cells=ADAPTIVE_MAX_CELLS)
+
+    # rows ordered by polluter, algorithm and percentage, as create_plots draws them in this order
+    for sweep in sorted(rows):
+        for algorithm in ALGORITHMS:
+            for percentage in sorted(rows[sweep]):
+                sensitivity_results.append(rows[sweep][percentage][algorithm])
 
     return sensitivity_results
 
 
-#Load inputs
-for (in_log, in_model) in INPUTS:
+def run_cell(shared, polluter):
+    clean_log, clean_models, cl_bm_metrics, cl_cm_metrics, log_name = shared
+    print(log_name+ " - POLLUTION: ", str(polluter.get_properties()))
+    with memory_scheduler.stage('pollute:' + polluter.__class__.__name__):
+        polluted_log = polluted_log_cache.get_polluted_log(clean_log, polluter, POLLUTION_SEED,
+                                                           with_edits=POLLUTE_WITH_EDITS)
+
+    return [dict(evaluate_polluted_log(clean_log, polluted_log, polluter, algorithm, *clean_models[algorithm],
+                                       cl_bm_metrics, cl_cm_metrics[algorithm], log_name), seed=POLLUTION_SEED)
+            for algorithm in ALGORITHMS]
+
+
+def failed_cell_rows(shared, polluter, status):
+    # rows of a cell that did not run through, with the metrics of the clean side
+    clean_log, clean_models, cl_bm_metrics, cl_cm_metrics, log_name = shared
+    rows = []
+    for algorithm in ALGORITHMS:
+        results = result_row(algorithm, polluter, {"cl-bm": cl_bm_metrics, "cl-cm": cl_cm_metrics[algorithm],
+                                                   "pl-pm": None, "pl-cm": None, "cl-pm": None})
+        results["status"] = status
+        results["discovery_coverage"] = None
+        results["seed"] = POLLUTION_SEED
+        rows.append(results)
+    return rows
+
 
-    #Load ground truth log
-    log = pm4py.read_xes('GT_log_creation/cleaned_event_logs/Sepsis Cases - Event Log_0_2_perfect_fitting_cases.xes', return_legacy_log_object=True)
-    #Load ground truth model
-    net, im, fm = pm4py.read_pnml('GT_log_creation/process_models/Sepsis Cases - Event Log_0_2_inductive.pnml')
+def died_cell_rows(shared, polluter):
+    # the worker of the cell died, e.g. killed by the out-of-memory killer
+    return failed_cell_rows(shared, polluter, "died:cell")
 
-    results = sensitivity_analysis_discovery(log, net, im, fm, in_log)
 
-    #save scenario_results as csv
-    polluted_df = pandas.DataFrame(results)
-    polluted_df.to_csv(os.path.join("out", in_model+"discovery_sensitivity_impr_act_tryout.csv"), index = False)
\ No newline at end of file
+def error_cell_rows(shared, polluter, error):
+    # the cell raised an exception, printed by memory_scheduler.run_batch
+    return failed_cell_rows(shared, polluter, "error:cell")
+
+
+def cell_stages(polluter):
+    return [('', 'pollute:' + polluter.__class__.__name__)] + [(algorithm, stage) for algorithm in ALGORITHMS
+                                                               for stage in ['discover', 'evaluate']]
+
+
+def scheduled_sensitivity_analysis_discovery(clean_log, baseline_model, baseline_im, baseline_fm, log_name, budget_mb):
+    """
+    Same analysis as sensitivity_analysis_discovery, with the polluters run in parallel within a memory budget
+    (see memory_scheduler.py). All algorithms of a polluter share its polluted log.
+    """
+    cl_bm_metrics, clean_models, cl_cm_metrics = evaluate_clean_side(clean_log, baseline_model, baseline_im,
+                                                                     baseline_fm, log_name)
+    shared = (clean_log, clean_models, cl_bm_metrics, cl_cm_metrics, log_name)
+    polluters = create_pollution_testbed()
+    size = sum(len(trace) for trace in clean_log)
+    rows = memory_scheduler.run_batch(run_cell, shared, polluters, [size] * len(polluters), cell_stages, budget_mb,
+                                      cost_model=memory_scheduler.CostModel(MEMORY_MODEL), processes=MEMORY_PROCESSES,
+                                      on_died=died_cell_rows, on_error=error_cell_rows)
+    # rows ordered by algorithm, then polluter, as in sensitivity_analysis_discovery
+    return sorted(rows, key=lambda row: ALGORITHMS.index(row["algorithm"]))
+
+
+def run_replicate(shared, polluter, seed):
+    clean_log, clean_models, cl_bm_metrics, cl_cm_metrics, log_name = shared
+    print(log_name+ " - POLLUTION (seed " + str(seed) + "): ", str(polluter.get_properties()))
+    polluted_log = polluted_log_cache.get_polluted_log(clean_log, polluter, seed, with_edits=POLLUTE_WITH_EDITS)
+
+    rows = []
+    for algorithm in ALGORITHMS:
+        results = evaluate_polluted_log(clean_log, polluted_log, polluter, algorithm, *clean_models[algorithm],
+                                        cl_bm_metrics, cl_cm_metrics[algorithm], log_name)
+        results["seed"] = seed
+        rows.append(results)
+    return rows
+
+
+def replicate_sensitivity_analysis_discovery(clean_log, baseline_model, baseline_im, baseline_fm, log_name, seeds):
+    """
+    Same analysis as sensitivity_analysis_discovery, repeated for every seed in seeds. The clean side is computed once,
+    the polluted replicates run as one batch (see replicates.py) and all algorithms of a replicate share its polluted log.
+    Returns the result rows of all replicates, with a 'seed' column.
+    """
+    cl_bm_metrics, clean_models, cl_cm_metrics = evaluate_clean_side(clean_log, baseline_model, baseline_im,
+                                                                     baseline_fm, log_name)
+    shared = (clean_log, clean_models, cl_bm_metrics, cl_cm_metrics, log_name)
+    return replicates.run_batch(run_replicate, shared, create_pollution_testbed(), seeds,
+                                processes=REPLICATE_PROCESSES)
+
+
+
+# inputs and clean side of the logs a queue worker has worked on, by input paths; the local workers inherit those
+# the coordinator computed before forking them
+_QUEUE_INPUTS = {}
+
+
+def _queue_clean_side(log_path, model_path, algorithm):
+    if (log_path, model_path) not in _QUEUE_INPUTS:
+        clean_log = pm4py.read_xes(log_path, return_legacy_log_object=True)
+        baseline_model, baseline_im, baseline_fm = pm4py.read_pnml(model_path)
+        cl_bm_metrics = conformance.evaluate(clean_log, baseline_model, baseline_im, baseline_fm, EVALUATION,
+                                             **EVALUATION_PARAMETERS)
+        _QUEUE_INPUTS[(log_path, model_path)] = (clean_log, cl_bm_metrics, {})
+    clean_log, cl_bm_metrics, clean_sides = _QUEUE_INPUTS[(log_path, model_path)]
+    if algorithm not in clean_sides:
+        clean_model = run_algorithm(clean_log, algorithm)
+        clean_sides[algorithm] = (clean_model, conformance.evaluate(clean_log, *clean_model, EVALUATION,
+                                                                    **EVALUATION_PARAMETERS))
+    clean_model, cl_cm_metrics = clean_sides[algorithm]
+    return clean_log, clean_model, cl_bm_metrics, cl_cm_metrics
+
+
+def run_queue_task(task):
+    """
+    Runs a task of distributed_sensitivity_analysis_discovery: one algorithm on one polluted log. The clean side of
+    the log is computed by the first task of the worker that needs it.
+    """
+    clean_log, clean_model, cl_bm_metrics, cl_cm_metrics = _queue_clean_side(task["log_path"], task["model_path"],
+                                                                             task["algorithm"])
+    polluter, seed = task["polluter"], task["seed"]
+    print(task["log_name"]+ " - POLLUTION (seed " + str(seed) + "): ", str(polluter.get_properties()))
+    # the polluted logs are cached in the shared directory, so that the algorithms of a cell share them across machines
+    cache = polluted_log_cache.PollutedLogCache(os.path.join(QUEUE_DIR, "polluted_log_cache"))
+    polluted_log = polluted_log_cache.get_polluted_log(clean_log, polluter, seed, cache,
+                                                      with_edits=POLLUTE_WITH_EDITS)
+
+    results = evaluate_polluted_log(clean_log, polluted_log, polluter, task["algorithm"], *clean_model,
+                                    cl_bm_metrics, cl_cm_metrics, task["log_name"])
+    results["seed"] = seed
+    return results
+
+
+def distributed_sensitivity_analysis_discovery(log_path, model_path, log_name):
+    """
+    Same analysis as sensitivity_analysis_discovery (or replicate_sensitivity_analysis_discovery if REPLICATE_SEEDS
+    are given), run as tasks of the work queue in QUEUE_DIR by the workers of all machines. Tasks finished by an
+    earlier run of the same grid are not run again.
+    """
+    queue = work_queue.WorkQueue(QUEUE_DIR, lease_seconds=QUEUE_LEASE_SECONDS)
+    tasks = []
+    for algorithm in ALGORITHMS:
+        for polluter in create_pollution_testbed():
+            for seed in REPLICATE_SEEDS or [POLLUTION_SEED]:
+                key = json.dumps(polluter.get_properties(), sort_keys=True, default=str)
+                tasks.append((work_queue.task_id(log_path, model_path, algorithm, key, str(seed)),
+                              {"log_name": log_name, "log_path": log_path, "model_path": model_path,
+                               "algorithm": algorithm, "polluter": polluter, "seed": seed}))
+    ids = queue.submit(tasks)
+    print(log_name + " - queued " + str(len(ids)) + " tasks in " + QUEUE_DIR + ": " + str(queue.status()))
+
+    if QUEUE_LOCAL_WORKERS:
+        # the clean side is computed once here and the forked local workers inherit it (sharing its pages until they
+        # write to them), instead of each of them parsing the log and discovering the clean models
+        for algorithm in ALGORITHMS:
+            _queue_clean_side(log_path, model_path, algorithm)
+        work_queue.run_local_workers(queue, run_queue_task, QUEUE_LOCAL_WORKERS)
+    # rows ordered by algorithm, polluter and seed, as in the other sweeps
+    return queue.wait(ids)
+
+
+if __name__ == "__main__":
+    artifact_writer.configure(enabled=ARTIFACT_WRITES, sample_rate=ARTIFACT_SAMPLE_RATE)
+
+    if sys.argv[1:] == ["worker"]:
+        work_queue.work(work_queue.WorkQueue(QUEUE_DIR, lease_seconds=QUEUE_LEASE_SECONDS), run_queue_task)
+        sys.exit()
+
+    #Load inputs
+    for (in_log, in_model) in INPUTS:
+        log_path = 'GT_log_creation/cleaned_event_logs/Sepsis Cases - Event Log_0_2_perfect_fitting_cases.xes'
+        model_path = 'GT_log_creation/process_models/Sepsis Cases - Event Log_0_2_inductive.pnml'
+
+        if QUEUE_DIR is not None:
+            results = distributed_sensitivity_analysis_discovery(log_path, model_path, in_log)
+        else:
+            #Load ground truth log
+            log = pm4py.read_xes(log_path, return_legacy_log_object=True)
+            #Load ground truth model
+            net, im, fm = pm4py.read_pnml(model_path)
+
+            if REPLICATE_SEEDS:
+                results = replicate_sensitivity_analysis_discovery(log, net, im, fm, in_log, REPLICATE_SEEDS)
+                aggregated_df = replicates.aggregate_replicates(results, REPLICATE_METRICS)
+                aggregated_df.to_csv(os.path.join("out", in_model+"discovery_sensitivity_replicates_aggregated.csv"), index=False)
+            elif ADAPTIVE_SWEEP:
+                results = adaptive_sensitivity_analysis_discovery(log, net, im, fm, in_log)
+            elif MEMORY_BUDGET_MB is not None:
+                results = scheduled_sensitivity_analysis_discovery(log, net, im, fm, in_log, MEMORY_BUDGET_MB)
+            else:
+                results = sensitivity_analysis_discovery(log, net, im, fm, in_log)
+
+        if RESULTS_DB is not None:
+            with results_store.ResultsStore(RESULTS_DB) as store:
+                store.add_results(in_log, results)
+
+        #save scenario_results as csv
+        polluted_df = pandas.DataFrame(results)
+        polluted_df.to_csv(os.path.join("out", in_model+"discovery_sensitivity_impr_act_tryout.csv"), index = False)
\ No newline at end of file
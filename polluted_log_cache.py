@@ -0,0 +1,270 @@
+import copy
+import hashlib
+import json
+import os
+import pickle
+import zlib
+from collections import OrderedDict
+
+from pm4py.objects.log.obj import Event, EventLog, Trace
+
+import replicates
+import streaming_pollution
+
+
+"""
+Cache of polluted logs
+
+A seeded pollution is deterministic, so the polluted log is identified by
+
+    (fingerprint of the clean log, hash of POLLUTION_VERSION and the canonical polluter properties, seed)
+
+where the properties are those of LogPolluter.get_properties before polluting, serialized as JSON with sorted keys.
+get_polluted_log returns the cached polluted log if there is one, and otherwise pollutes the clean log with the
+random number generators seeded and stores the result. All algorithms of a sweep then work on the same pollution.
+
+Polluted logs are kept in memory (the most recently used MEMORY_CACHE_SIZE ones, returned as the same object, so the
+discovery and evaluation indices built on them are reused too; callers must not modify them) and on disk. On disk, a
+polluted log is stored as a delta to its clean log: traces equal to the clean trace of the same case are stored as
+the index of that trace, only the others are stored in full, and the whole entry is compressed. When the entries in the cache directory exceed
+DISK_CACHE_SIZE_MB, the least recently used ones are deleted.
+
+The state of the polluter after polluting (e.g. the mean delay DelayedEventLoggingPolluter derives from the log) is
+stored with the log and restored on a cache hit, so the polluter reports the same properties either way.
+
+With with_edits, the log is polluted trace by trace by streaming_pollution.pollute_with_edits instead of by
+LogPolluter.pollute (a different draw of the same pollution, cached under a key of its own). Its unchanged traces are
+the traces of the clean log, and its edits are stored instead of the delta. get_edits returns the edits of such a log,
+from which incremental_dfg patches the directly-follows graph of the clean log.
+"""
+
+
+DEFAULT_CACHE_DIR = 'out/polluted_log_cache'
+DISK_CACHE_SIZE_MB = 2048
+MEMORY_CACHE_SIZE = 4
+# part of every key, raised whenever a polluter changes what it produces for a seed, so that entries polluted by the
+# earlier code are no longer returned
+POLLUTION_VERSION = 2
+
+# fingerprints of the most recently fingerprinted logs, by identity
+_FINGERPRINTS = []
+FINGERPRINT_CACHE_SIZE = 8
+# streaming_pollution.LogStatistics of the most recently polluted clean logs, by identity
+_STATISTICS = []
+# key -> (polluted log, polluter state, (clean log, edits) or None), most recently used last
+_MEMORY_CACHE = OrderedDict()
+
+
+def log_fingerprint(log):
+    """
+    Hash of the traces of a log with all their attributes. Logs are recognised by identity, so a log must not be
+    modified after it has been fingerprinted.
+    """
+    for i, (fingerprinted_log, fingerprint) in enumerate(_FINGERPRINTS):
+        if fingerprinted_log is log:
+            _FINGERPRINTS.append(_FINGERPRINTS.pop(i))
+            return fingerprint
+    digest = hashlib.sha1()
+    for trace in log:
+        digest.update(repr(sorted((str(k), str(v)) for k, v in trace.attributes.items())).encode())
+        for event in trace:
+            digest.update(repr(sorted((str(k), str(v)) for k, v in event.items())).encode())
+    fingerprint = digest.hexdigest()
+    _FINGERPRINTS.append((log, fingerprint))
+    if len(_FINGERPRINTS) > FINGERPRINT_CACHE_SIZE:
+        _FINGERPRINTS.pop(0)
+    return fingerprint
+
+
+def polluter_key(polluter):
+    """
+    Hash of POLLUTION_VERSION and the canonical properties of a polluter
+    """
+    properties = json.dumps(polluter.get_properties(), sort_keys=True, default=str)
+    return hashlib.sha1((str(POLLUTION_VERSION) + properties).encode()).hexdigest()
+
+
+def _encode(polluted_log, clean_log):
+    # delta of the polluted log to the clean log: the index of the clean trace of the same case if the trace is
+    # unchanged, else its attributes and events
+    case_index = {trace.attributes.get('concept:name'): i for i, trace in enumerate(clean_log)}
+    traces = []
+    for trace in polluted_log:
+        i = case_index.get(trace.attributes.get('concept:name'))
+        if i is not None and clean_log[i] == trace:
+            traces.append(i)
+        else:
+            traces.append((dict(trace.attributes), [dict(event) for event in trace]))
+    log_attributes = (polluted_log.attributes, polluted_log.extensions, polluted_log.omni_present,
+                      polluted_log.classifiers, polluted_log.properties)
+    return traces, log_attributes
+
+
+def _encode_edits(polluted_log, edits):
+    # edits of a log polluted by pollute_with_edits: the index of every edited clean trace with the attributes and
+    # events of the traces replacing it
+    traces = [(i, [(dict(trace.attributes), [dict(event) for event in trace]) for trace in replacement])
+              for i, replacement in edits]
+    log_attributes = (polluted_log.attributes, polluted_log.extensions, polluted_log.omni_present,
+                      polluted_log.classifiers, polluted_log.properties)
+    return traces, log_attributes
+
+
+def _decode_edits(entry, clean_log):
+    # the polluted log (sharing the unchanged traces with the clean log) and its edits
+    traces, (attributes, extensions, omni_present, classifiers, properties) = entry
+    edits = [(i, [Trace([Event(dict(event)) for event in events], attributes=dict(trace_attributes))
+                  for trace_attributes, events in replacement]) for i, replacement in traces]
+    polluted_traces = []
+    start = 0
+    for i, replacement in edits:
+        polluted_traces.extend(clean_log[start:i])
+        polluted_traces.extend(replacement)
+        start = i + 1
+    polluted_traces.extend(clean_log[start:])
+    log = EventLog(polluted_traces, attributes=copy.deepcopy(attributes), extensions=copy.deepcopy(extensions),
+                   omni_present=copy.deepcopy(omni_present), classifiers=copy.deepcopy(classifiers),
+                   properties=copy.deepcopy(properties))
+    return log, edits
+
+
+def _decode(entry, clean_log):
+    traces, (attributes, extensions, omni_present, classifiers, properties) = entry
+    log = EventLog(attributes=copy.deepcopy(attributes), extensions=copy.deepcopy(extensions),
+                   omni_present=copy.deepcopy(omni_present), classifiers=copy.deepcopy(classifiers),
+                   properties=copy.deepcopy(properties))
+    for trace in traces:
+        if isinstance(trace, int):
+            trace_attributes, events = clean_log[trace].attributes, clean_log[trace]
+        else:
+            trace_attributes, events = trace
+        log.append(Trace([Event(dict(event)) for event in events], attributes=dict(trace_attributes)))
+    return log
+
+
+class PollutedLogCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size_mb=DISK_CACHE_SIZE_MB):
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '_'.join(key) + '.bin')
+
+    def load(self, key, clean_log):
+        """
+        Returns (polluted log, polluter state, edits) stored under the key, or None. The edits are None unless the log
+        was stored with them.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry, state, with_edits = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        # the modification time orders the entries for eviction
+        os.utime(path)
+        if with_edits:
+            polluted_log, edits = _decode_edits(entry, clean_log)
+            return polluted_log, state, edits
+        return _decode(entry, clean_log), state, None
+
+    def store(self, key, polluted_log, state, clean_log, edits=None):
+        """
+        Stores the polluted log under the key, as its edits if given (see pollute_with_edits) or else as its delta to
+        the clean log
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = _encode(polluted_log, clean_log) if edits is None else _encode_edits(polluted_log, edits)
+        data = zlib.compress(pickle.dumps((entry, state, edits is not None), pickle.HIGHEST_PROTOCOL))
+        # written under a temporary name, so that concurrent readers never see a partial entry
+        temporary_path = self._path(key) + '.' + str(os.getpid())
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits into max_size_mb
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.bin'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size_mb * 1024 * 1024:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def _log_statistics(log):
+    # statistics pollute_with_edits needs of a clean log, collected once per log
+    for i, (counted_log, statistics) in enumerate(_STATISTICS):
+        if counted_log is log:
+            _STATISTICS.append(_STATISTICS.pop(i))
+            return statistics
+    statistics = streaming_pollution.LogStatistics.from_traces(log)
+    _STATISTICS.append((log, statistics))
+    if len(_STATISTICS) > FINGERPRINT_CACHE_SIZE:
+        _STATISTICS.pop(0)
+    return statistics
+
+
+def get_polluted_log(clean_log, polluter, seed, cache=None, with_edits=False):
+    """
+    Returns the clean log polluted by the polluter with the random number generators seeded with seed, from the cache
+    if it was polluted before. A seed of None pollutes without seeding and caching. with_edits pollutes with
+    streaming_pollution.pollute_with_edits, whose edits get_edits then returns.
+    """
+    if seed is None:
+        if with_edits:
+            return streaming_pollution.pollute_with_edits(polluter, clean_log, _log_statistics(clean_log))[0]
+        return polluter.pollute(clean_log)
+    if cache is None:
+        cache = PollutedLogCache()
+
+    key = (log_fingerprint(clean_log), polluter_key(polluter), str(seed)) + (('edits',) if with_edits else ())
+    if key in _MEMORY_CACHE:
+        _MEMORY_CACHE.move_to_end(key)
+        polluted_log, state, _ = _MEMORY_CACHE[key]
+    else:
+        cached = cache.load(key, clean_log)
+        if cached is not None:
+            polluted_log, state, edits = cached
+        else:
+            replicates.seed_everything(seed)
+            if with_edits:
+                polluted_log, edits = streaming_pollution.pollute_with_edits(polluter, clean_log,
+                                                                             _log_statistics(clean_log))
+            else:
+                polluted_log, edits = polluter.pollute(clean_log), None
+            state = copy.deepcopy(polluter.__dict__)
+            cache.store(key, polluted_log, state, clean_log, edits)
+        _MEMORY_CACHE[key] = (polluted_log, state, None if edits is None else (clean_log, edits))
+        if len(_MEMORY_CACHE) > MEMORY_CACHE_SIZE:
+            _MEMORY_CACHE.popitem(last=False)
+
+    polluter.__dict__.update(copy.deepcopy(state))
+    return polluted_log
+
+
+def get_edits(polluted_log):
+    """
+    Returns (clean log, edits) of a log returned by get_polluted_log with with_edits and still in the memory cache,
+    or None
+    """
+    for cached_log, _, edits in _MEMORY_CACHE.values():
+        if cached_log is polluted_log:
+            return edits
+    return None
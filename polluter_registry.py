@@ -0,0 +1,65 @@
+import importlib
+
+
+"""
+Registry of the supported DQIs (polluters)
+
+Maps the name of every polluter class of log_pollution.py to its data quality category and a short description.
+The registry itself imports nothing heavy, so the command line can list and validate DQIs without loading pm4py;
+log_pollution is only imported once a polluter is actually created. A polluter added to log_pollution.py has to be
+registered here as well to be usable from main.py. Polluters whose constructor needs more than a percentage are
+registered in NOT_BY_NAME: they are described here but cannot be created from their name, and so are not offered on
+the command line.
+"""
+
+
+POLLUTER_MODULE = "log_pollution"
+
+# name of the polluter class: (data quality category, description)
+POLLUTERS = {
+    "DeleteActivityPolluter": ("incomplete", "deletes random activities"),
+    "DeleteTracePolluter": ("incomplete", "deletes random traces"),
+    "InsertAlienActivityPolluter": ("incorrect", "inserts alien activities"),
+    "InsertRandomActivityPolluter": ("incorrect", "inserts known activities"),
+    "InsertDuplicateActivityPolluter": ("incorrect", "duplicates activities"),
+    "InsertDuplicateTracePolluter": ("incorrect", "duplicates traces"),
+    "ReplaceAlienActivityPolluter": ("incorrect", "replaces activities with alien activities"),
+    "ReplaceRandomActivityPolluter": ("incorrect", "replaces activities with known activities"),
+    "ReplaceDuplicateActivityPolluter": ("incorrect", "replaces activities with their predecessor"),
+    "DelayedEventLoggingPolluter": ("incorrect", "delays event timestamps"),
+    "AggregatedEventLoggingPolluter": ("imprecise", "coarsens event timestamps"),
+    "PreciseActivityPolluter": ("imprecise", "refines activity labels"),
+    "ImpreciseActivityPolluter": ("imprecise", "merges activity labels"),
+}
+
+# polluters that need arguments create_polluter cannot give them (the labels to merge)
+NOT_BY_NAME = {"ImpreciseActivityPolluter"}
+
+
+def names():
+    """
+    Names of the polluters that can be created from their name
+    """
+    return [name for name in POLLUTERS if name not in NOT_BY_NAME]
+
+
+def get_polluter_class(name):
+    """
+    Returns the polluter class registered under the given name, importing log_pollution on first use
+    """
+    if name not in POLLUTERS:
+        raise ValueError(f"DQI '{name}' is not a supported polluter.")
+    return getattr(importlib.import_module(POLLUTER_MODULE), name)
+
+
+def create_polluter(name, percentage=0.2):
+    """
+    Instantiates the polluter with the given percentage if it takes one, else with its defaults
+    """
+    polluter_class = get_polluter_class(name)
+    if name in NOT_BY_NAME:
+        raise ValueError(f"DQI '{name}' needs arguments and cannot be created from its name.")
+    try:
+        return polluter_class(percentage=percentage)
+    except TypeError:
+        return polluter_class()
@@ -0,0 +1,176 @@
+import bisect
+
+import numpy as np
+
+
+"""
+Ground truth of a pollution
+
+Which events a polluter inserted, relabelled, retimed or moved, and which it deleted, is recorded while it runs: every
+event of the clean log is tagged with its index (in log order) under ORIGIN_KEY before polluting. The polluters copy
+events with all their attributes, so every event of the polluted log carries the index of the clean event it
+stems from. The tags are removed again once the GroundTruth has been read off, and the random draws of the polluters
+are not affected, so the polluted log is the same as that of LogPolluter.pollute with the same seed.
+
+A GroundTruth holds, aligned to the events of the polluted log in log order:
+
+    codes       uint8 bit set of every event, a combination of INSERTED, RELABELED, RETIMED and MOVED (0 if unchanged)
+    origins     index of the clean event every event stems from
+
+and the indices of the clean events without counterpart in the polluted log (deleted). An event counts as inserted if
+it is a copy of a clean event that already occurs earlier in the polluted log (inserted alien or known activities
+are copies of their neighbour, duplicated traces copies of the whole trace), as relabelled or retimed if its activity
+or timestamp differs from that of its clean event, and as moved if it is not part of a longest subsequence of its
+trace that keeps the order of the clean log (inserted events are only marked as inserted). save writes codes and
+deleted as a compressed NumPy archive, a few bytes per thousand events instead of a second copy of the log; join adds
+the codes to the DataFrame of the polluted log.
+"""
+
+
+INSERTED = 1
+RELABELED = 2
+RETIMED = 4
+MOVED = 8
+CODE_NAMES = {INSERTED: 'inserted', RELABELED: 'relabeled', RETIMED: 'retimed', MOVED: 'moved'}
+
+ORIGIN_KEY = '__pollution_origin__'
+
+
+class GroundTruth:
+
+    def __init__(self, codes, deleted, clean_events, origins=None):
+        self.codes = np.asarray(codes, dtype=np.uint8)
+        self.deleted = np.asarray(deleted, dtype=np.int64)
+        self.clean_events = clean_events
+        self.origins = None if origins is None else np.asarray(origins, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def counts(self):
+        """
+        Number of events per pollution type (an event can have several), and of deleted events
+        """
+        counts = {name: int(np.count_nonzero(self.codes & code)) for code, name in CODE_NAMES.items()}
+        counts['deleted'] = len(self.deleted)
+        return counts
+
+    def labels(self):
+        """
+        Pollution types of every event of the polluted log, joined by '|', '' for unchanged events
+        """
+        names = {}
+        for code in np.unique(self.codes).tolist():
+            names[code] = '|'.join(name for bit, name in CODE_NAMES.items() if code & bit)
+        return [names[code] for code in self.codes.tolist()]
+
+    def join(self, df, column='pollution:type'):
+        """
+        Adds the codes to the DataFrame of the polluted log (one row per event, in log order, e.g. from
+        pm4py.convert_to_dataframe) and returns it
+        """
+        if len(df) != len(self.codes):
+            raise ValueError(f"The DataFrame has {len(df)} events, the ground truth {len(self.codes)}.")
+        df[column] = self.codes
+        return df
+
+    def then(self, following):
+        """
+        Ground truth of polluting the polluted log once more, given the ground truth of that second pollution
+        """
+        if self.origins is None:
+            raise ValueError("Chaining ground truths needs the origins, which are not saved.")
+        codes = following.codes | self.codes[following.origins]
+        # events inserted by the first pollution and deleted by the second never were in the clean log
+        deleted_again = following.deleted[(self.codes[following.deleted] & INSERTED) == 0]
+        deleted = np.concatenate([self.deleted, self.origins[deleted_again]])
+        return GroundTruth(codes, np.sort(deleted), self.clean_events, self.origins[following.origins])
+
+    def save(self, path):
+        np.savez_compressed(path, codes=self.codes, deleted=self.deleted, clean_events=self.clean_events)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['codes'], data['deleted'], int(data['clean_events']))
+
+
+def _read_ground_truth(clean_log, polluted_log):
+    clean_events = []
+    for trace in clean_log:
+        clean_events.extend(trace)
+    codes = []
+    origins = []
+    seen = np.zeros(len(clean_events), dtype=bool)
+    for trace in polluted_log:
+        trace_codes = []
+        trace_origins = []
+        for event in trace:
+            origin = event[ORIGIN_KEY]
+            clean_event = clean_events[origin]
+            code = 0
+            if seen[origin]:
+                # an inserted event is compared to nothing, the event it was copied from is not its clean counterpart
+                code = INSERTED
+            else:
+                if event.get('concept:name') != clean_event.get('concept:name'):
+                    code |= RELABELED
+                if event.get('time:timestamp') != clean_event.get('time:timestamp'):
+                    code |= RETIMED
+            seen[origin] = True
+            trace_codes.append(code)
+            trace_origins.append(origin)
+        # of the events that are not inserted, those outside of a longest subsequence in clean order were moved
+        kept = [k for k, code in enumerate(trace_codes) if not code & INSERTED]
+        for k in set(kept) - _longest_increasing([trace_origins[k] for k in kept], kept):
+            trace_codes[k] |= MOVED
+        codes.extend(trace_codes)
+        origins.extend(trace_origins)
+    return GroundTruth(codes, np.flatnonzero(~seen), len(clean_events), origins)
+
+
+def _longest_increasing(values, keys):
+    # keys of a longest strictly increasing subsequence of values
+    tails = []          # smallest last value of an increasing subsequence of every length
+    tail_positions = []
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        length = bisect.bisect_left(tails, value)
+        if length == len(tails):
+            tails.append(value)
+            tail_positions.append(i)
+        else:
+            tails[length] = value
+            tail_positions[length] = i
+        previous[i] = tail_positions[length - 1] if length > 0 else None
+    subsequence = set()
+    i = tail_positions[-1] if tail_positions else None
+    while i is not None:
+        subsequence.add(keys[i])
+        i = previous[i]
+    return subsequence
+
+
+def _untag(log):
+    for trace in log:
+        for event in trace:
+            if ORIGIN_KEY in event:
+                del event[ORIGIN_KEY]
+
+
+def pollute_with_ground_truth(polluter, log):
+    """
+    Pollutes the log with the polluter, returns the polluted log and its GroundTruth
+    """
+    index = 0
+    for trace in log:
+        for event in trace:
+            event[ORIGIN_KEY] = index
+            index += 1
+    try:
+        polluted_log = polluter.pollute(log)
+        ground_truth = _read_ground_truth(log, polluted_log)
+        _untag(polluted_log)
+    finally:
+        _untag(log)
+    return polluted_log, ground_truth
@@ -0,0 +1,156 @@
+import numpy as np
+
+import token_replay_engine
+
+
+"""
+Reachability acceptor for perfect-fit checks
+
+Whether a trace fits a model perfectly is a yes/no question that does not need the diagnostics of token replay. For a
+bounded net (the models of the inductive miner are safe), the reachability graph is finite and the question is
+answered by a finite automaton: its states are sets of reachable markings closed under invisible transitions, its
+edges are labelled with the activities. A ReachabilityAcceptor explores the reachability graph of a compiled net once
+and determinizes it lazily, every state and edge being computed the first time a variant needs it, so checking a
+variant takes one dictionary lookup per activity.
+
+A trace is accepted if the final marking can be reached from the initial marking by firing transitions with the
+labels of the trace, in order, and any invisible transitions in between; activities without a transition in the net
+are skipped, as token replay does. Token replay reports a trace as fit only if it found such a firing sequence, so
+every trace fit by token replay is accepted. The converse holds unless token replay's heuristic misses the invisible
+transitions to fire (which does not happen on the process models of GT_log_creation, where both give the same flags).
+
+Exploration stops with UnboundedNetError once the graph has more than max_markings markings, as an unbounded net
+has infinitely many. fit_flags then falls back to token replay. The determinized automaton can have exponentially
+many states in the number of markings; once a variant needs more than max_states of them, accepts raises
+StateLimitError and fit_flags checks the variants left by token replay.
+"""
+
+
+MAX_MARKINGS = 100000
+MAX_STATES = 10000
+# acceptors of the most recently compiled nets, see get_acceptor
+_ACCEPTORS = []
+ACCEPTOR_CACHE_SIZE = 8
+
+
+class UnboundedNetError(Exception):
+    pass
+
+
+class StateLimitError(Exception):
+    pass
+
+
+class ReachabilityAcceptor:
+
+    def __init__(self, compiled, max_markings=MAX_MARKINGS, max_states=MAX_STATES):
+        self.activities = compiled.activities
+        self.max_states = max_states
+        labels = np.array([compiled.activities[t.label] if t.label is not None else -1
+                           for t in compiled.transitions], dtype=np.int64)
+
+        # reachability graph, markings are numbered in the order of their discovery
+        markings = {compiled.initial_marking.tobytes(): 0}
+        visible = [[]]      # marking -> [(activity, marking)]
+        invisible = [[]]    # marking -> [marking]
+        stack = [compiled.initial_marking]
+        while stack:
+            m = stack.pop()
+            source = markings[m.tobytes()]
+            for t in np.flatnonzero((m >= compiled.pre).all(axis=1)):
+                successor = m + compiled.change[t]
+                key = successor.tobytes()
+                if key not in markings:
+                    if len(markings) >= max_markings:
+                        raise UnboundedNetError(f"The net has more than {max_markings} reachable markings.")
+                    markings[key] = len(markings)
+                    visible.append([])
+                    invisible.append([])
+                    stack.append(successor)
+                if labels[t] < 0:
+                    invisible[source].append(markings[key])
+                else:
+                    visible[source].append((int(labels[t]), markings[key]))
+        self.number_of_markings = len(markings)
+        self.final = markings.get(compiled.final_marking.tobytes())
+
+        self._visible = visible
+        self._invisible = invisible
+        # determinized automaton: state (frozenset of markings) -> {activity: state}
+        self.initial_state = self._closure([0])
+        self._edges = {}
+
+    def _closure(self, seeds):
+        # markings reachable from the seeds through invisible transitions
+        closed = set()
+        stack = list(seeds)
+        while stack:
+            marking = stack.pop()
+            if marking not in closed:
+                closed.add(marking)
+                stack.extend(self._invisible[marking])
+        return frozenset(closed)
+
+    def _next(self, state, activity):
+        if state not in self._edges and len(self._edges) >= self.max_states:
+            raise StateLimitError(f"The determinized net has more than {self.max_states} states.")
+        edges = self._edges.setdefault(state, {})
+        if activity not in edges:
+            successors = [target for marking in state for a, target in self._visible[marking] if a == activity]
+            edges[activity] = self._closure(successors) if successors else None
+        return edges[activity]
+
+    def accepts(self, variant):
+        """
+        True if the variant (sequence of activity labels) fits the net perfectly
+        """
+        if self.final is None:
+            return False
+        state = self.initial_state
+        for label in variant:
+            activity = self.activities.get(label)
+            if activity is None:
+                # as in token replay, activities that are not in the model are skipped
+                continue
+            state = self._next(state, activity)
+            if state is None:
+                return False
+        return self.final in state
+
+
+def get_acceptor(compiled, max_markings=MAX_MARKINGS, max_states=MAX_STATES):
+    """
+    Returns the acceptor of a compiled net, reusing the one of a recently used net, or None if the net is unbounded
+    (or exceeds max_markings)
+    """
+    for i, (accepted_net, acceptor) in enumerate(_ACCEPTORS):
+        if accepted_net is compiled:
+            _ACCEPTORS.append(_ACCEPTORS.pop(i))
+            return acceptor
+    try:
+        acceptor = ReachabilityAcceptor(compiled, max_markings, max_states)
+    except UnboundedNetError:
+        acceptor = None
+    _ACCEPTORS.append((compiled, acceptor))
+    if len(_ACCEPTORS) > ACCEPTOR_CACHE_SIZE:
+        _ACCEPTORS.pop(0)
+    return acceptor
+
+
+def fit_flags(variants, compiled, max_markings=MAX_MARKINGS, max_states=MAX_STATES):
+    """
+    Returns {variant: fits perfectly} for the given variants (tuples of activity labels), checked by the acceptor of
+    the net, or by token replay if the net is unbounded or its determinization exceeds max_states
+    """
+    acceptor = get_acceptor(compiled, max_markings, max_states)
+    if acceptor is None:
+        return token_replay_engine.fit_flags(variants, compiled)
+    variants = list(variants)
+    flags = {}
+    for variant in variants:
+        try:
+            flags[variant] = acceptor.accepts(variant)
+        except StateLimitError:
+            flags.update(token_replay_engine.fit_flags([v for v in variants if v not in flags], compiled))
+            break
+    return flags
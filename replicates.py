@@ -0,0 +1,100 @@
+import multiprocessing
+import random
+
+import numpy as np
+import pandas as pd
+
+import results_store
+
+
+"""
+Batched execution of pollution replicates
+
+A replicate is one polluter applied with one random seed. The clean side of a sweep (clean models and their metrics)
+does not depend on the seed, so it is computed once and handed to every replicate. Replicates run in a process pool
+whose workers are forked from the calling process: they inherit the clean log and models instead of receiving
+pickled copies.
+"""
+
+
+# (run_replicate, shared) of the running batch, inherited by the forked workers
+_BATCH = None
+
+
+def seed_everything(seed):
+    """
+    Seeds both random number generators used by the polluters
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def _run_task(task):
+    run_replicate, shared = _BATCH
+    polluter, seed = task
+    seed_everything(seed)
+    return run_replicate(shared, polluter, seed)
+
+
+def run_batch(run_replicate, shared, polluters, seeds, processes=None):
+    """
+    Runs every polluter with every seed.
+
+    Parameters
+    ----------
+    run_replicate : callable
+        Called as run_replicate(shared, polluter, seed) after seeding, returns a list of result rows.
+    shared :
+        Clean-side artifacts needed by all replicates, computed once by the caller.
+    polluters : list of LogPolluter
+        Polluters to replicate.
+    seeds : list of int
+        Seeds, one replicate per seed and polluter.
+    processes : int, optional
+        Number of worker processes, defaults to the number of cores. 1 runs the replicates in this process.
+
+    Returns
+    -------
+    list of dict
+        Result rows of all replicates, ordered by polluter and seed.
+    """
+    global _BATCH
+    tasks = [(polluter, seed) for polluter in polluters for seed in seeds]
+    _BATCH = (run_replicate, shared)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or len(tasks) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        rows = [_run_task(task) for task in tasks]
+    else:
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            rows = pool.map(_run_task, tasks, chunksize=1)
+
+    _BATCH = None
+    return [row for replicate_rows in rows for row in replicate_rows]
+
+
+def aggregate_replicates(rows, metric_columns, seed_column='seed'):
+    """
+    Mean and standard deviation of the metric columns over the seeds of each (algorithm, polluter) combination.
+    Returns a DataFrame with the identifying columns, the number of replicates, the number of them that did not run
+    through (status other than ok, see cell_budget.py) and <metric>_mean / <metric>_std columns.
+    """
+    df = pd.DataFrame(rows)
+    df[metric_columns] = df[metric_columns].apply(pd.to_numeric)
+
+    # how a replicate ran (status, budget times, diagnostics) differs between seeds and does not identify it
+    group_columns = [col for col in df.columns
+                     if col not in metric_columns and col != seed_column and not results_store.is_run_column(col)]
+    # polluter parameters can be lists or dictionaries, which cannot be grouped on
+    for col in group_columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype(str)
+    failed = df['status'].notna() & (df['status'] != 'ok') if 'status' in df.columns else pd.Series(False, df.index)
+
+    grouped = df.groupby(group_columns, dropna=False, sort=False)
+    aggregated = grouped[metric_columns].agg(['mean', 'std'])
+    aggregated.columns = [metric + '_' + statistic for metric, statistic in aggregated.columns]
+    aggregated.insert(0, 'replicates', grouped[seed_column].count())
+    aggregated.insert(1, 'failed', failed.groupby([df[col] for col in group_columns], dropna=False, sort=False).sum())
+    return aggregated.reset_index()
@@ -0,0 +1,217 @@
+import json
+import math
+import re
+import sqlite3
+
+import pandas as pd
+
+
+"""
+Indexed results store of the sweeps
+
+The result rows of noisy_log_evaluation (one row per algorithm and polluter, with fitness, precision and
+generalization columns per log-model setting) are stored in an SQLite database, one record per
+
+    (log, algorithm, pollution_pattern, parameters, percentage, seed, setting, evaluation)
+
+holding fitness, precision and generalization. parameters is the JSON of the polluter properties other than the
+percentage, so polluters of the same class with different settings (e.g. hourly and daily AggregatedEventLogging) are
+kept apart without building labels from them. Runs without seed are stored with seed NO_SEED, polluters without a
+percentage (ImpreciseActivityPolluter) with percentage 1.0, as they pollute every event they apply to.
+
+Storing a cell again replaces its previous record. Aggregations over logs and seeds, joins with the clean-side
+baselines and slices at a percentage are answered by indexed queries; to_wide turns their results back into the
+column layout of the CSV files.
+"""
+
+
+DEFAULT_PATH = 'out/results.sqlite'
+NO_SEED = -1
+SETTINGS = ['cl-bm', 'cl-cm', 'pl-pm', 'pl-cm', 'cl-pm']
+KEY_COLUMNS = ['log', 'algorithm', 'pollution_pattern', 'parameters', 'percentage', 'seed', 'setting', 'evaluation']
+METRIC_COLUMNS = ['fitness', 'precision', 'generalization']
+
+# result row column -> (metric, evaluation method suffix, setting)
+_METRIC_COLUMN = re.compile(r'^(fitness|precision|generalization)_(\w+)_(' + '|'.join(SETTINGS) + r')$')
+# columns describing how the cell ran, not the polluter: budgets (see cell_budget.py) and evaluation diagnostics (see
+# conformance.DIAGNOSTICS)
+_RUN_COLUMN = re.compile(r'^(status|discovery_coverage|seconds_.*|sample_size_.*|ci_.*|timed_out_.*)$')
+
+
+def is_run_column(column):
+    """
+    True if the result row column describes how the cell ran (its status, budget times or evaluation diagnostics)
+    rather than the algorithm and polluter
+    """
+    return _RUN_COLUMN.match(column) is not None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    log TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    pollution_pattern TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    percentage REAL NOT NULL,
+    seed INTEGER NOT NULL,
+    setting TEXT NOT NULL,
+    evaluation TEXT NOT NULL,
+    fitness REAL,
+    precision REAL,
+    generalization REAL,
+    PRIMARY KEY (log, algorithm, pollution_pattern, parameters, percentage, seed, setting, evaluation)
+);
+CREATE INDEX IF NOT EXISTS results_by_pollution ON results (pollution_pattern, parameters, percentage, algorithm, setting);
+CREATE INDEX IF NOT EXISTS results_by_setting ON results (setting, percentage);
+"""
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def split_row(row):
+    """
+    Splits a result row into its polluter properties and its metrics.
+    Returns (pollution_pattern, parameters JSON, percentage, seed, {(setting, evaluation): {metric: value}})
+    """
+    properties = {}
+    metrics = {}
+    for column, value in row.items():
+        match = _METRIC_COLUMN.match(column)
+        if match:
+            metric, suffix, setting = match.groups()
+            # generalization is always token-based, the evaluation method is the one of fitness and precision
+            metrics.setdefault(setting, {})[metric] = None if _is_missing(value) else float(value)
+            if metric != 'generalization':
+                metrics[setting]['evaluation'] = suffix
+        elif column not in ['algorithm', 'seed'] and not is_run_column(column) and not _is_missing(value):
+            properties[column] = value
+
+    pollution_pattern = properties.pop('pollution_pattern')
+    percentage = float(properties.pop('percentage', 1.0))
+    parameters = json.dumps(properties, sort_keys=True, default=str)
+    seed = row.get('seed')
+    seed = NO_SEED if _is_missing(seed) else int(seed)
+    metrics = {(setting, values.pop('evaluation', 'tbr')): values for setting, values in metrics.items()}
+    return pollution_pattern, parameters, percentage, seed, metrics
+
+
+def to_wide(df):
+    """
+    Pivots records (as returned by the queries of ResultsStore) into one row per cell with a
+    <metric>_<evaluation>_<setting> column per metric, as in the CSV files (generalization is always _tbr_)
+    """
+    index_columns = [c for c in df.columns if c not in METRIC_COLUMNS + ['setting', 'evaluation', 'logs', 'runs']]
+    wide = None
+    for (setting, evaluation), group in df.groupby(['setting', 'evaluation'], sort=False):
+        columns = {metric: metric + '_' + (evaluation if metric != 'generalization' else 'tbr') + '_' + setting
+                   for metric in METRIC_COLUMNS}
+        part = group[index_columns + METRIC_COLUMNS].rename(columns=columns)
+        wide = part if wide is None else wide.merge(part, on=index_columns, how='outer')
+    return wide if wide is not None else pd.DataFrame(columns=index_columns)
+
+
+class ResultsStore:
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add_results(self, log, rows, seed=None):
+        """
+        Stores result rows of noisy_log_evaluation obtained on the given log. The seed of a row is taken from its
+        'seed' column, or else from the seed argument.
+        """
+        records = []
+        for row in rows:
+            if seed is not None and 'seed' not in row:
+                row = dict(row, seed=seed)
+            pollution_pattern, parameters, percentage, row_seed, metrics = split_row(row)
+            for (setting, evaluation), values in metrics.items():
+                records.append((log, row['algorithm'], pollution_pattern, parameters, percentage, row_seed, setting,
+                                evaluation, values.get('fitness'), values.get('precision'),
+                                values.get('generalization')))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        records)
+        return len(records)
+
+    def import_csv(self, csv_path, log):
+        """
+        Stores the rows of a results CSV file written by noisy_log_evaluation
+        """
+        df = pd.read_csv(csv_path)
+        df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+        return self.add_results(log, df.to_dict('records'))
+
+    def query(self, sql, parameters=()):
+        """
+        Runs an SQL query on the results table and returns a DataFrame
+        """
+        return pd.read_sql_query(sql, self.connection, params=parameters)
+
+    @staticmethod
+    def _where(filters, table=''):
+        # equality filters on key columns, list values match any of their elements
+        clauses = []
+        values = []
+        for column, value in filters.items():
+            if column not in KEY_COLUMNS:
+                raise ValueError(f"Cannot filter on '{column}', filters are key columns: {KEY_COLUMNS}.")
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                clauses.append(table + column + ' IN (' + ', '.join('?' * len(value)) + ')')
+                values += list(value)
+            else:
+                clauses.append(table + column + ' = ?')
+                values.append(value)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), values
+
+    def records(self, **filters):
+        """
+        Stored records matching the filters (key column = value or list of values)
+        """
+        where, values = self._where(filters)
+        return self.query('SELECT * FROM results' + where + ' ORDER BY ' + ', '.join(KEY_COLUMNS), values)
+
+    def average(self, over=('log', 'seed'), **filters):
+        """
+        Metrics averaged over the given key columns (by default over the logs and the seeds) for the records matching
+        the filters, with the number of logs and of averaged records in 'logs' and 'runs'
+        """
+        group = [c for c in KEY_COLUMNS if c not in over]
+        where, values = self._where(filters)
+        return self.query('SELECT ' + ', '.join(group) + ', '
+                          + ', '.join('AVG(' + m + ') AS ' + m for m in METRIC_COLUMNS)
+                          + ', COUNT(DISTINCT log) AS logs, COUNT(*) AS runs FROM results' + where
+                          + ' GROUP BY ' + ', '.join(group) + ' ORDER BY ' + ', '.join(group), values)
+
+    def with_baseline(self, baseline_setting='cl-cm', **filters):
+        """
+        Records matching the filters joined with the record of the baseline setting of the same cell, adding
+        <metric>_baseline and <metric>_change (record minus baseline) columns
+        """
+        where, values = self._where(filters, table='r.')
+        join = ' AND '.join('b.' + c + ' = r.' + c for c in KEY_COLUMNS if c != 'setting')
+        return self.query('SELECT r.*, '
+                          + ', '.join('b.' + m + ' AS ' + m + '_baseline, r.' + m + ' - b.' + m + ' AS ' + m + '_change'
+                                      for m in METRIC_COLUMNS)
+                          + ' FROM results r JOIN results b ON ' + join + ' AND b.setting = ?' + where
+                          + ' ORDER BY ' + ', '.join('r.' + c for c in KEY_COLUMNS), [baseline_setting] + values)
+
+    def slice_at(self, percentage, over=('log', 'seed'), **filters):
+        """
+        Averaged metrics of all cells at a pollution percentage, in the column layout of the CSV files
+        """
+        return to_wide(self.average(over=over, percentage=percentage, **filters))
@@ -6,6 +6,9 @@ import pandas as pd
 import pm4py
 
 from log_pollution import *
+import artifact_writer
+import conformance
+import discovery_index
 #from special4pm.simulation.simulation import simulate_model
 #from tqdm import tqdm
 
@@ -20,41 +23,51 @@ INPUTS = [#("Sepsis Cases - Event Log_0_1_perfect_fitting_cases.xes", "Sepsis Ca
 
 ALGORITHMS = ["IM_0.0", "IM_0.1", "IM_0.2", "IM_0.3", "IM_0.4", "IM_0.5", "ILP_1.0", "ILP_0.9", "ILP_0.8", "ILP_0.7", "ILP_0.6", "ILP_0.5"]
 
+# model evaluation method, one of conformance.EVALUATION_METHODS ("tbr", "sampled" or "alignments"), and its parameters
+EVALUATION = "tbr"
+EVALUATION_PARAMETERS = {}
+
+# result columns of fitness and precision carry the evaluation method, generalization is always token-based
+FITNESS_COL = "fitness_" + conformance.METRIC_SUFFIXES[EVALUATION]
+PRECISION_COL = "precision_" + conformance.METRIC_SUFFIXES[EVALUATION]
+
 def run_algorithm(alg_ID, log):
+    # all algorithms on the same log share its variants and DFG
+    index = discovery_index.get_index(log)
     if alg_ID == "IM_0.0":
-        return  pm4py.discover_petri_net_inductive(log, noise_threshold=0.0)
+        return  index.discover_inductive(0.0)
     elif alg_ID == "IM_0.1":
-        return  pm4py.discover_petri_net_inductive(log, noise_threshold=0.1)
+        return  index.discover_inductive(0.1)
     elif alg_ID == "IM_0.2":
-        return  pm4py.discover_petri_net_inductive(log, noise_threshold=0.2)
+        return  index.discover_inductive(0.2)
     elif alg_ID == "IM_0.3":
-        return  pm4py.discover_petri_net_inductive(log, noise_threshold=0.3)
+        return  index.discover_inductive(0.3)
     elif alg_ID == "IM_0.4":
-        return pm4py.discover_petri_net_inductive(log, noise_threshold=0.4)
+        return index.discover_inductive(0.4)
     elif alg_ID == "IM_0.5":
-        return  pm4py.discover_petri_net_inductive(log, noise_threshold=0.5)
+        return  index.discover_inductive(0.5)
     elif alg_ID == "IM_0.6":
-        return pm4py.discover_petri_net_inductive(log, noise_threshold=0.6)
+        return index.discover_inductive(0.6)
     elif alg_ID == "IM_0.8":
-        return pm4py.discover_petri_net_inductive(log, noise_threshold=0.8)
+        return index.discover_inductive(0.8)
     elif alg_ID == "ALPHA":
-        return pm4py.discovery.discover_petri_net_alpha(log)
+        return index.discover_alpha()
     elif alg_ID == "ILP_1.0":
-        return pm4py.discovery.discover_petri_net_ilp(log, 1.0)
+        return index.discover_ilp(1.0)
     elif alg_ID == "ILP_0.9":
-        return pm4py.discovery.discover_petri_net_ilp(log, 0.9)
+        return index.discover_ilp(0.9)
     elif alg_ID == "ILP_0.8":
-        return pm4py.discovery.discover_petri_net_ilp(log, 0.8)
+        return index.discover_ilp(0.8)
     elif alg_ID == "ILP_0.7":
-        return pm4py.discovery.discover_petri_net_ilp(log, 0.7)
+        return index.discover_ilp(0.7)
     elif alg_ID == "ILP_0.6":
-        return pm4py.discovery.discover_petri_net_ilp(log, 0.6)
+        return index.discover_ilp(0.6)
     elif alg_ID == "ILP_0.5":
-        return pm4py.discovery.discover_petri_net_ilp(log, 0.5)
+        return index.discover_ilp(0.5)
     elif alg_ID == "ILP_0.4":
-        return pm4py.discovery.discover_petri_net_ilp(log, 0.4)
+        return index.discover_ilp(0.4)
     elif alg_ID == "ILP_0.2":
-        return pm4py.discovery.discover_petri_net_ilp(log, 0.2)
+        return index.discover_ilp(0.2)
     else:
         raise ValueError("ERROR: provided algorithm " + alg_ID + " unknown")
 
@@ -67,15 +80,13 @@ def scenario_analysis_discovery(clean_log, baseline_model, baseline_im, baseline
 
     # Comparing Baseline Model vs Cleaned Log
     print("Baseline Analysis")
-    fitness_tbr = pm4py.conformance.fitness_token_based_replay(clean_log, baseline_model, baseline_im, baseline_fm)
-    precision_tbr = pm4py.conformance.precision_token_based_replay(clean_log, baseline_model, baseline_im,
-                                                                   baseline_fm)
-    generalization_tbr = pm4py.conformance.generalization_tbr(clean_log, baseline_model, baseline_im, baseline_fm)
+    fitness_tbr, precision_tbr, generalization_tbr = conformance.evaluate(clean_log, baseline_model, baseline_im,
+                                                                          baseline_fm, EVALUATION, **EVALUATION_PARAMETERS)
 
     scenario_results.append({"algorithm": "None",
                                 "pollution_type": "None",
-                                "fitness_tbr": fitness_tbr['average_trace_fitness'],
-                                "precision_tbr": precision_tbr,
+                                FITNESS_COL: fitness_tbr['average_trace_fitness'],
+                                PRECISION_COL: precision_tbr,
                                 "generalization_tbr": generalization_tbr})
 
     for algorithm in ALGORITHMS:
@@ -89,9 +100,8 @@ def scenario_analysis_discovery(clean_log, baseline_model, baseline_im, baseline
         clean_model, clean_im, clean_fm = run_algorithm(algorithm, clean_log)
 
         # clean log - token-based replay metrics
-        fitness_tbr = pm4py.conformance.fitness_token_based_replay(clean_log, clean_model, clean_im, clean_fm)
-        precision_tbr = pm4py.conformance.precision_token_based_replay(clean_log, clean_model, clean_im, clean_fm)
-        generalization_tbr = pm4py.conformance.generalization_tbr(clean_log, clean_model, clean_im, clean_fm)
+        fitness_tbr, precision_tbr, generalization_tbr = conformance.evaluate(clean_log, clean_model, clean_im, clean_fm,
+                                                                              EVALUATION, **EVALUATION_PARAMETERS)
 
         # clean log - alignment-based metrics
         # fitness_alignment = pm4py.conformance.fitness_alignments(log, model, im, fm)
@@ -102,8 +112,8 @@ def scenario_analysis_discovery(clean_log, baseline_model, baseline_im, baseline
         scenario_results.append({"algorithm": algorithm,
                                     "pollution_type": "None",
                                     "setting": 'cl-cm',
-                                    "fitness_tbr": fitness_tbr['average_trace_fitness'],
-                                    "precision_tbr": precision_tbr,
+                                    FITNESS_COL: fitness_tbr['average_trace_fitness'],
+                                    PRECISION_COL: precision_tbr,
                                     "generalization_tbr": generalization_tbr})
 
         # initialise the polluted log as identical to the clean log
@@ -120,31 +130,23 @@ def scenario_analysis_discovery(clean_log, baseline_model, baseline_im, baseline
 
         # conduct analysis on polluted log and retrieve relevant metrics
         polluted_model, polluted_im, polluted_fm = run_algorithm(algorithm, polluted_log)
-        pm4py.vis.view_petri_net(polluted_model, polluted_im, polluted_fm)
+        artifact_writer.save_petri_net_view(polluted_model, polluted_im, polluted_fm,
+                                            os.path.join('out/scenario_results', algorithm + '_polluted_view.png'))
 
         # polluted log - token-based replay metrics
-        polluted_fitness_tbr = pm4py.conformance.fitness_token_based_replay(polluted_log, polluted_model,
-                                                                            polluted_im, polluted_fm)
-        polluted_precision_tbr = pm4py.conformance.precision_token_based_replay(polluted_log,
-                                                                                polluted_model, polluted_im,
-                                                                                polluted_fm)
-        polluted_generalization_tbr = pm4py.conformance.generalization_tbr(polluted_log, polluted_model,
-                                                                           polluted_im, polluted_fm)
+        polluted_fitness_tbr, polluted_precision_tbr, polluted_generalization_tbr = conformance.evaluate(
+            polluted_log, polluted_model, polluted_im, polluted_fm, EVALUATION, **EVALUATION_PARAMETERS)
 
         scenario_results.append({"algorithm": algorithm,
                                     "pollution_type": pollution_types,
                                     "setting": 'pl-pm',
                                     "percentage": pollution_percentages,
-                                    "fitness_tbr": polluted_fitness_tbr['average_trace_fitness'],
-                                    "precision_tbr": polluted_precision_tbr,
+                                    FITNESS_COL: polluted_fitness_tbr['average_trace_fitness'],
+                                    PRECISION_COL: polluted_precision_tbr,
                                     "generalization_tbr": polluted_generalization_tbr})
 
-        polluted_fitness_tbr_cl_pm = pm4py.conformance.fitness_token_based_replay(clean_log, polluted_model,
-                                                                                  polluted_im, polluted_fm)
-        polluted_precision_tbr_cl_pm = pm4py.conformance.precision_token_based_replay(clean_log, polluted_model,
-                                                                                      polluted_im, polluted_fm)
-        polluted_generalization_tbr_cl_pm = pm4py.conformance.generalization_tbr(clean_log, polluted_model, polluted_im,
-                                                                                 polluted_fm)
+        polluted_fitness_tbr_cl_pm, polluted_precision_tbr_cl_pm, polluted_generalization_tbr_cl_pm = conformance.evaluate(
+            clean_log, polluted_model, polluted_im, polluted_fm, EVALUATION, **EVALUATION_PARAMETERS)
 
 
 
@@ -157,8 +159,8 @@ def scenario_analysis_discovery(clean_log, baseline_model, baseline_im, baseline
                                  "pollution_type": pollution_types,
                                  "setting": 'cl-pm',
                                  "percentage": pollution_percentages,
-                                 "fitness_tbr": polluted_fitness_tbr_cl_pm['average_trace_fitness'],
-                                 "precision_tbr": polluted_precision_tbr_cl_pm,
+                                 FITNESS_COL: polluted_fitness_tbr_cl_pm['average_trace_fitness'],
+                                 PRECISION_COL: polluted_precision_tbr_cl_pm,
                                  "generalization_tbr": polluted_generalization_tbr_cl_pm})
 
     return scenario_results
@@ -172,7 +174,7 @@ def apply_optimised_discovery(results_path, original_log):
     for row in results.index:
         if results.loc[row, 'setting'] == 'cl-pm': #(results.loc[row, 'pollution_type'] is not None) and (results.loc[row, 'pollution_type'] not in ['nan', np.nan]):
             model = results.loc[row,:]
-            f1_score = 2/(1/(model['fitness_tbr']) + 1/(model['precision_tbr']))
+            f1_score = 2/(1/(model[FITNESS_COL]) + 1/(model[PRECISION_COL]))
             if f1_score > best_f1:
                 best_algorithm = model['algorithm']
                 best_f1 = f1_score
@@ -182,22 +184,18 @@ def apply_optimised_discovery(results_path, original_log):
     opt_model, opt_im, opt_fm = run_algorithm(best_algorithm, original_log)
 
     # Save the process model
-    pm4py.write_pnml(opt_model, opt_im, opt_fm, results_path + '_optimised_' + best_algorithm + '.pnml')
-    pm4py.save_vis_petri_net(opt_model, opt_im, opt_fm, file_path=results_path + '_optimised_' + best_algorithm +'_inductive_view.png')  # This will save a view for the Petri net
+    artifact_writer.write_pnml(opt_model, opt_im, opt_fm, results_path + '_optimised_' + best_algorithm + '.pnml')
+    artifact_writer.save_petri_net_view(opt_model, opt_im, opt_fm, results_path + '_optimised_' + best_algorithm +'_inductive_view.png')  # This will save a view for the Petri net
 
     # compute model quality metrics and return the scenario_results in a dataframe
-    opt_fitness_tbr = pm4py.conformance.fitness_token_based_replay(original_log, opt_model,
-                                                                        opt_im, opt_fm)
-    opt_precision_tbr = pm4py.conformance.precision_token_based_replay(original_log,
-                                                                            opt_model, opt_im,
-                                                                            opt_fm)
-    opt_generalization_tbr = pm4py.conformance.generalization_tbr(original_log, opt_model,
-                                                                       opt_im, opt_fm)
+    opt_fitness_tbr, opt_precision_tbr, opt_generalization_tbr = conformance.evaluate(original_log, opt_model, opt_im,
+                                                                                      opt_fm, EVALUATION,
+                                                                                      **EVALUATION_PARAMETERS)
 
     opt_results = pd.DataFrame.from_dict({"algorithm": [best_algorithm],
                              "scenario": [results_path],
-                             "fitness_tbr": [opt_fitness_tbr['average_trace_fitness']],
-                             "precision_tbr": [opt_precision_tbr],
+                             FITNESS_COL: [opt_fitness_tbr['average_trace_fitness']],
+                             PRECISION_COL: [opt_precision_tbr],
                              "generalization_tbr": [opt_generalization_tbr]})
 
     return opt_results
@@ -226,7 +224,7 @@ for (in_log, in_model) in INPUTS:
     out_path = in_model.removesuffix('.pnml')
 
     polluted_df = pandas.DataFrame(scenario_results)
-    polluted_df['f1-score'] = 2/((1/polluted_df['fitness_tbr']) + (1/polluted_df['precision_tbr']))
+    polluted_df['f1-score'] = 2/((1/polluted_df[FITNESS_COL]) + (1/polluted_df[PRECISION_COL]))
     polluted_df = polluted_df.round(4)
     polluted_df.to_csv(os.path.join("out/scenario_results", out_path + "_scenario_results.csv"), index = False)
 
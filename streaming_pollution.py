@@ -0,0 +1,281 @@
+import gzip
+import io
+import itertools
+import math
+import random
+from collections import Counter
+
+import numpy as np
+from pm4py.objects.log.exporter.xes.variants import line_by_line as xes_line_by_line
+from pm4py.objects.log.importer.xes.variants import iterparse as xes_iterparse
+from pm4py.objects.log.obj import EventLog
+from pm4py.streaming.importer.xes.variants.xes_trace_stream import StreamingTraceXesReader
+
+
+"""
+Streaming pollution of event logs that do not fit into memory
+
+LogPolluter.pollute samples global event positions and random traces of the whole log, so it needs the log in memory.
+The streaming variant splits this into two passes over a trace iterator:
+
+    1. LogStatistics collects the global counts a polluter needs (traces, events, activities, mean delay between
+       events), or they are provided directly if already known.
+    2. pollute_stream decides the edits of each trace locally while iterating the traces once more, and yields the
+       polluted traces in chunks of bounded size.
+
+The in-memory polluters draw ceil(percentage * events) (or traces) edits, each on a uniformly chosen trace. The stream
+draws the number of edits of every trace from a binomial distribution conditioned on the edits still to place and
+the traces still to come, which gives the same multinomial distribution and exactly the same total. Trace deletions
+are drawn without replacement by selection sampling. The edits within a trace are then applied as by the in-memory
+polluter (see LogPolluter.pollute_trace). Edits a trace cannot take (deletions beyond its length, see
+LogPolluter.unplaced_edits) fall on uniformly chosen traces still to come; the stream loses those left at its last
+trace, which at high deletion rates can be a noticeable share of them.
+
+Only the trace being polluted and the current chunk are held in memory.
+
+pollute_with_edits applies the same per-trace pollution to a log in memory, drawing the traces to edit directly
+(one uniform draw per edit, as pollute does) instead of going through all of them, and reports which traces it
+replaced. Edits a trace cannot take fall on uniformly chosen traces left anywhere in the log, as in pollute. The polluted log shares all other traces with the input log, and the edits are what incremental_dfg.py
+patches the DFG of the clean log with.
+"""
+
+
+CHUNK_SIZE = 1000
+
+
+class LogStatistics:
+
+    def __init__(self, number_of_traces, number_of_events, activities, mean_delay=None):
+        """
+        activities: activity labels in order of first occurrence (dict mapping label to frequency, or list)
+        mean_delay: mean time between consecutive events of a trace in minutes
+        """
+        self.number_of_traces = number_of_traces
+        self.number_of_events = number_of_events
+        self.activities = activities
+        self.mean_delay = mean_delay
+
+    @classmethod
+    def from_traces(cls, traces):
+        """
+        Collects the statistics in one pass over the traces
+        """
+        number_of_traces = 0
+        number_of_events = 0
+        activities = {}
+        total_delay = 0.0
+        transitions = 0
+        for trace in traces:
+            number_of_traces += 1
+            number_of_events += len(trace)
+            for event in trace:
+                activities[event['concept:name']] = activities.get(event['concept:name'], 0) + 1
+            timestamps = sorted(event['time:timestamp'] for event in trace if 'time:timestamp' in event)
+            for previous, current in zip(timestamps, timestamps[1:]):
+                total_delay += (current - previous).total_seconds() / 60
+                transitions += 1
+        return cls(number_of_traces, number_of_events, activities, total_delay / transitions if transitions else None)
+
+
+def number_of_edits(polluter, statistics):
+    """
+    Total number of edits the polluter makes on a log with the given statistics, as in its pollute method
+    """
+    if polluter.streaming_unit == 'events':
+        return math.ceil(statistics.number_of_events * polluter.percentage)
+    elif polluter.streaming_unit == 'traces':
+        return math.ceil(statistics.number_of_traces * polluter.percentage)
+    return None
+
+
+def allocate_edits(number_of_traces, edits, with_replacement=True):
+    """
+    Yields the number of edits of each of the traces, summing up to exactly the given number of edits. With replacement,
+    every edit falls on a uniformly chosen trace, without replacement every trace gets at most one edit.
+    """
+    remaining = edits
+    for i in range(number_of_traces):
+        traces_left = number_of_traces - i
+        if remaining == 0:
+            trace_edits = 0
+        elif with_replacement:
+            trace_edits = int(np.random.binomial(remaining, 1 / traces_left))
+        else:
+            trace_edits = 1 if random.random() * traces_left < remaining else 0
+        remaining -= trace_edits
+        yield trace_edits
+
+
+def pollute_stream(polluter, traces, statistics, chunk_size=CHUNK_SIZE):
+    """
+    Pollutes a stream of traces.
+
+    Parameters
+    ----------
+    polluter : LogPolluter
+        Polluter implementing pollute_trace.
+    traces : iterable of Trace
+        The traces of the log, in the same number as given by the statistics. They are not modified.
+    statistics : LogStatistics
+        Global counts of the log.
+    chunk_size : int
+        Number of traces per yielded chunk.
+
+    Yields
+    ------
+    list of Trace
+        Polluted traces, in chunks of at most chunk_size traces (a duplicated trace can exceed it slightly).
+    """
+    if polluter.streaming_unit is None:
+        allocation = itertools.repeat(None)
+    else:
+        edits = number_of_edits(polluter, statistics)
+        if not polluter.streaming_with_replacement and edits > statistics.number_of_traces:
+            raise ValueError(f"Cannot make {edits} edits without replacement on {statistics.number_of_traces} traces.")
+        allocation = allocate_edits(statistics.number_of_traces, edits, polluter.streaming_with_replacement)
+    context = polluter.stream_context(statistics)
+
+    chunk = []
+    number_of_traces = 0
+    unplaced = 0
+    for trace in traces:
+        number_of_traces += 1
+        trace_edits = next(allocation, 0)
+        if unplaced:
+            traces_left = max(statistics.number_of_traces - number_of_traces + 1, 1)
+            moved = int(np.random.binomial(unplaced, 1 / traces_left))
+            unplaced -= moved
+            trace_edits += moved
+        chunk.extend(polluter.pollute_trace(trace, trace_edits, context))
+        unplaced += polluter.unplaced_edits(trace, trace_edits)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if number_of_traces != statistics.number_of_traces:
+        raise ValueError(f"The stream has {number_of_traces} traces, the statistics {statistics.number_of_traces}.")
+    if chunk:
+        yield chunk
+
+
+def plan_edits(polluter, statistics):
+    """
+    Draws the traces the polluter edits on a log with the given statistics, returns {trace index: number of edits} or
+    None for polluters that treat every trace the same
+    """
+    if polluter.streaming_unit is None:
+        return None
+    edits = number_of_edits(polluter, statistics)
+    if polluter.streaming_with_replacement:
+        return Counter(random.randrange(statistics.number_of_traces) for _ in range(edits))
+    if edits > statistics.number_of_traces:
+        raise ValueError(f"Cannot make {edits} edits without replacement on {statistics.number_of_traces} traces.")
+    return dict.fromkeys(random.sample(range(statistics.number_of_traces), edits), 1)
+
+
+def pollute_with_edits(polluter, log, statistics=None):
+    """
+    Pollutes a log in memory trace by trace (see LogPolluter.pollute_trace), rebuilding only the traces that get edits.
+
+    Parameters
+    ----------
+    polluter : LogPolluter
+        Polluter implementing pollute_trace.
+    log : EventLog
+        The log, which is not modified.
+    statistics : LogStatistics, optional
+        Global counts of the log, collected from it if not given (pass them when polluting the same log repeatedly).
+
+    Returns
+    -------
+    tuple
+        The polluted log and its edits, a list of (index of a trace of the log, list of the traces that replace it) in
+        the order of the traces. Traces without edits are the same objects in both logs.
+    """
+    if statistics is None:
+        statistics = LogStatistics.from_traces(log)
+    context = polluter.stream_context(statistics)
+    plan = plan_edits(polluter, statistics)
+
+    edits = {}
+    unplaced = 0
+    for i in range(len(log)) if plan is None else sorted(plan):
+        trace_edits = None if plan is None else plan[i]
+        traces = polluter.pollute_trace(log[i], trace_edits, context)
+        if len(traces) != 1 or traces[0] is not log[i]:
+            edits[i] = traces
+        if plan is not None:
+            unplaced += polluter.unplaced_edits(log[i], trace_edits)
+    # edits a trace cannot take fall on uniformly chosen traces left in the log, one at a time as in pollute
+    left = [i for i in range(len(log)) if edits.get(i) != []] if unplaced else []
+    while unplaced and left:
+        k = random.randrange(len(left))
+        trace = edits[left[k]][0] if left[k] in edits else log[left[k]]
+        edits[left[k]] = polluter.pollute_trace(trace, 1, context)
+        unplaced += polluter.unplaced_edits(trace, 1) - 1
+        if not edits[left[k]]:
+            left[k] = left[-1]
+            left.pop()
+    edits = sorted(edits.items())
+
+    traces = []
+    start = 0
+    for i, replacement in edits:
+        traces.extend(log[start:i])
+        traces.extend(replacement)
+        start = i + 1
+    traces.extend(log[start:])
+    polluted_log = EventLog(traces, attributes=dict(log.attributes), extensions=dict(log.extensions),
+                            omni_present=dict(log.omni_present), classifiers=dict(log.classifiers),
+                            properties=dict(log.properties))
+    return polluted_log, edits
+
+
+def read_xes_traces(path):
+    """
+    Iterates over the traces of a (gzipped) XES file without loading the log into memory
+    """
+    with (gzip.open(path, 'rb') if path.lower().endswith('.gz') else open(path, 'rb')) as f:
+        for trace in StreamingTraceXesReader(f):
+            if trace is not None:
+                yield trace
+
+
+def read_xes_header(path):
+    """
+    Reads the log-level attributes, extensions, globals and classifiers of a (gzipped) XES file into an EventLog
+    without traces, stopping at the first trace
+    """
+    return xes_iterparse.import_log(path, parameters={xes_iterparse.Parameters.MAX_TRACES: 0,
+                                                      xes_iterparse.Parameters.SHOW_PROGRESS_BAR: False})
+
+
+def write_xes_chunks(chunks, path, header=None, encoding='utf-8'):
+    """
+    Writes chunks of traces to a XES file as they come in, gzipped if the path ends with .gz. The log-level attributes,
+    extensions, globals and classifiers are those of header (an EventLog, e.g. read by read_xes_header), the same
+    as pm4py's line-by-line exporter writes them.
+    """
+    # the exporter writes the header of a log without traces, followed by the closing tag
+    closing_tag = "</log>\n".encode(encoding)
+    header_buffer = io.BytesIO()
+    xes_line_by_line.export_log_line_by_line(EventLog() if header is None else header, header_buffer, encoding,
+                                             parameters={xes_line_by_line.Parameters.SHOW_PROGRESS_BAR: False})
+    with (gzip.open(path, 'wb') if path.lower().endswith('.gz') else open(path, 'wb')) as f:
+        f.write(header_buffer.getvalue()[:-len(closing_tag)])
+        for chunk in chunks:
+            for trace in chunk:
+                xes_line_by_line.export_trace_line_by_line(trace, f, encoding)
+        f.write(closing_tag)
+
+
+def pollute_xes(polluter, input_path, output_path, chunk_size=CHUNK_SIZE, statistics=None):
+    """
+    Pollutes the XES file at input_path into output_path, reading it twice if no statistics are given. The output
+    keeps the log-level attributes, extensions, globals and classifiers of the input.
+    Returns the statistics of the input log.
+    """
+    if statistics is None:
+        statistics = LogStatistics.from_traces(read_xes_traces(input_path))
+    write_xes_chunks(pollute_stream(polluter, read_xes_traces(input_path), statistics, chunk_size), output_path,
+                     header=read_xes_header(input_path))
+    return statistics
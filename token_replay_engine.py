@@ -0,0 +1,585 @@
+import math
+from collections import Counter
+
+import numpy as np
+from pm4py.algo.conformance.tokenreplay.variants.token_replay import TechnicalParameters
+from pm4py.objects.petri_net.obj import Marking
+from pm4py.objects.petri_net.utils import petri_utils
+from pm4py.util import pandas_utils
+
+
+"""
+Compiled token-based replay
+
+A (net, im, fm) triple is compiled once into NumPy pre/post incidence matrices, a label -> transition index and the
+shortest paths over invisible transitions between places. Variants are encoded as integer arrays and replayed on
+integer markings, following pm4py's token replay (pm4py.algo.conformance.tokenreplay.variants.token_replay) step by
+step, including its heuristics for walking through invisible transitions and for reaching the final marking.
+Replay results, fitness, trace_is_fit flags, precision and generalization are the same as pm4py's.
+
+The outcome of replaying an activity only depends on the marking it is replayed in, so every step is computed once per
+(marking, activity) and shared by all variants of all logs replayed on the same compiled net. evaluate derives all
+three metrics from a single replay of the log along a prefix trie of its variants.
+
+The log side (variants, their frequencies and the prefix trie with the follow-set of every prefix) is kept in a
+LogIndex, built once per log and reused for every model the log is evaluated on (see get_log_index).
+"""
+
+
+# indices of the most recently evaluated logs, see get_log_index
+_LOG_INDICES = []
+LOG_INDEX_CACHE_SIZE = 8
+
+
+class CompiledNet:
+    """
+    Petri net with initial and final marking compiled for replay.
+    Places are indexed in the order of their names, which is the order in which pm4py visits marked places.
+    Transitions are indexed in the iteration order of net.transitions, which pm4py uses to pick among transitions
+    sharing a label.
+    """
+
+    def __init__(self, net, im, fm):
+        self.net = net
+        self.places = sorted(net.places, key=lambda p: p.name)
+        self.transitions = list(net.transitions)
+        place_index = {p: i for i, p in enumerate(self.places)}
+        transition_index = {t: i for i, t in enumerate(self.transitions)}
+
+        self.pre = np.zeros((len(self.transitions), len(self.places)), dtype=np.int64)
+        self.post = np.zeros((len(self.transitions), len(self.places)), dtype=np.int64)
+        for t, i in transition_index.items():
+            for a in t.in_arcs:
+                self.pre[i, place_index[a.source]] = a.weight
+            for a in t.out_arcs:
+                self.post[i, place_index[a.target]] = a.weight
+        self.change = self.post - self.pre
+        self.consumed = self.pre.sum(axis=1)
+        self.produced = self.post.sum(axis=1)
+
+        self.initial_marking = self._to_array(im, place_index)
+        self.final_marking = self._to_array(fm, place_index)
+        self.final_places = np.flatnonzero(self.final_marking > 0)
+
+        # activity label -> index, and per label the candidate transitions and the one pm4py falls back to
+        self.activities = {}
+        self.label_transitions = []
+        self.fallback_transition = []
+        for i, t in enumerate(self.transitions):
+            if t.label is None:
+                continue
+            if t.label not in self.activities:
+                self.activities[t.label] = len(self.activities)
+                self.label_transitions.append([])
+                self.fallback_transition.append(None)
+            a = self.activities[t.label]
+            self.label_transitions[a].append(i)
+            self.fallback_transition[a] = i
+
+        # invisible-transition closure, place -> place -> transitions to fire
+        self.shortest_paths = {}
+        spaths = petri_utils.get_places_shortest_path_by_hidden(net, TechnicalParameters.MAX_REC_DEPTH.value)
+        for p1, targets in spaths.items():
+            self.shortest_paths[place_index[p1]] = {place_index[p2]: tuple(transition_index[t] for t in path)
+                                                    for p2, path in targets.items()}
+
+        # pm4py explores the enabled transitions in this order and tells visited (transition, marking) pairs apart by
+        # the representation of the transition
+        self.exploration_order = np.array(sorted(range(len(self.transitions)), key=lambda i: (
+            str(self.transitions[i].name), id(self.transitions[i]))), dtype=np.int64)
+        self.transition_keys = [repr(t) for t in self.transitions]
+
+        self._step_cache = {}
+        self._final_cache = {}
+        self._enabled_cache = {}
+
+    @staticmethod
+    def _to_array(marking, place_index):
+        array = np.zeros(len(place_index), dtype=np.int64)
+        for p, count in marking.items():
+            array[place_index[p]] = count
+        return array
+
+    def to_marking(self, m):
+        """
+        Converts an integer marking back into a pm4py Marking
+        """
+        marking = Marking()
+        for i in np.flatnonzero(m > 0):
+            marking[self.places[i]] = int(m[i])
+        return marking
+
+    def encode(self, activities):
+        """
+        Encodes a sequence of activity labels as an integer array, activities not in the model become -1
+        """
+        return np.array([self.activities.get(a, -1) for a in activities], dtype=np.int64)
+
+    def enabled_visible_transitions(self, m):
+        """
+        Visible transitions eventually enabled in an integer marking (pm4py's enabled_transitions_in_marking)
+        """
+        key = m.tobytes()
+        if key not in self._enabled_cache:
+            self._enabled_cache[key] = set(self.transitions[t] for t in self._eventually_enabled_visible(m))
+        return self._enabled_cache[key]
+
+    def _enabled_in_order(self, m):
+        return self.exploration_order[(m >= self.pre[self.exploration_order]).all(axis=1)].tolist()
+
+    def _eventually_enabled_visible(self, m):
+        # pm4py's get_visible_transitions_eventually_enabled_by_marking on integer markings: every enabled transition
+        # is queued with the latest marking it was found enabled in, invisible ones are fired and their successors
+        # queued in turn
+        queue = self._enabled_in_order(m)
+        marking_of = {t: m for t in queue}
+        visible = set()
+        visited = set()
+        i = 0
+        while i < len(queue):
+            t = queue[i]
+            m_t = marking_of[t]
+            key = (self.transition_keys[t], m_t.tobytes())
+            if key not in visited:
+                if self.transitions[t].label is not None:
+                    visible.add(t)
+                elif self._is_enabled(t, m_t):
+                    new_marking = m_t + self.change[t]
+                    for t2 in self._enabled_in_order(new_marking):
+                        queue.append(t2)
+                        marking_of[t2] = new_marking
+                visited.add(key)
+            i += 1
+        return visible
+
+    def _is_enabled(self, t, m):
+        return bool((m >= self.pre[t]).all())
+
+    def _paths_between(self, sources, targets):
+        # shortest invisible paths from the marked places to the target places, shortest first
+        paths = []
+        for p1 in sources:
+            if p1 in self.shortest_paths:
+                for p2 in targets:
+                    if p2 in self.shortest_paths[p1]:
+                        paths.append(self.shortest_paths[p1][p2])
+        return sorted(paths, key=len)
+
+    def _enable_hidden_transitions(self, t, m, fired, visited, paths):
+        positions = [0] * len(paths)
+        for z in range(10000000):
+            something_changed = False
+            g = z % len(paths)
+            for k in range(positions[g], len(paths[g])):
+                t3 = paths[g][positions[g]]
+                if t3 != t and self._is_enabled(t3, m) and t3 not in visited:
+                    m = m + self.change[t3]
+                    fired.append(t3)
+                    visited.add(t3)
+                    something_changed = True
+                positions[g] += 1
+                if self._is_enabled(t, m):
+                    break
+            if self._is_enabled(t, m) or not something_changed:
+                break
+        return m
+
+    def _apply_hidden_transitions(self, t, m, fired, visited, depth):
+        if depth >= TechnicalParameters.MAX_REC_DEPTH_HIDTRANSENABL.value or t in visited:
+            return m
+        visited.add(t)
+        missing_places = np.flatnonzero(m < self.pre[t])
+        paths = self._paths_between(np.flatnonzero(m > 0), missing_places)
+        if paths:
+            m = self._enable_hidden_transitions(t, m, fired, visited, paths)
+            if not self._is_enabled(t, m):
+                for path in self._paths_between(np.flatnonzero(m > 0), missing_places):
+                    for t4 in path:
+                        if t4 != t and t4 not in visited:
+                            if not self._is_enabled(t4, m):
+                                m = self._apply_hidden_transitions(t4, m, fired, visited, depth + 1)
+                            if self._is_enabled(t4, m):
+                                m = m + self.change[t4]
+                                fired.append(t4)
+                                visited.add(t4)
+        return m
+
+    def _step(self, m, a, walk_through_hidden, stop_immediately_unfit):
+        """
+        Replays one (known) activity in marking m.
+        Returns (marking, fired transitions, consumed, produced, missing, problem transition or None, stopped)
+        """
+        key = (m.tobytes(), a, walk_through_hidden, stop_immediately_unfit)
+        if key in self._step_cache:
+            return self._step_cache[key]
+
+        t = next((c for c in self.label_transitions[a] if self._is_enabled(c, m)), self.fallback_transition[a])
+        fired = []
+        if walk_through_hidden and not self._is_enabled(t, m):
+            m = self._apply_hidden_transitions(t, m, fired, set(), 0)
+        consumed = int(self.consumed[fired].sum())
+        produced = int(self.produced[fired].sum())
+
+        missing = 0
+        problem = None
+        stopped = False
+        if not self._is_enabled(t, m):
+            problem = t
+            if stop_immediately_unfit:
+                missing = 1
+                stopped = True
+            else:
+                # pm4py adds the full arc weight to every underfed place
+                underfed = m < self.pre[t]
+                missing = int((self.pre[t] - m)[underfed].sum())
+                m = m + np.where(underfed, self.pre[t], 0)
+        if not stopped:
+            consumed += int(self.consumed[t])
+            produced += int(self.produced[t])
+            m = m + self.change[t]
+            fired.append(t)
+
+        result = (m, tuple(fired), consumed, produced, missing, problem, stopped)
+        self._step_cache[key] = result
+        return result
+
+    def _final_marking_reached(self, m):
+        return bool((m[self.final_places] > 0).all())
+
+    def _reach_final_marking(self, m):
+        """
+        Fires invisible transitions towards the final marking. Returns (marking, fired transitions, consumed, produced)
+        """
+        key = m.tobytes()
+        if key in self._final_cache:
+            return self._final_cache[key]
+
+        fired = []
+        for _ in range(TechnicalParameters.MAX_IT_FINAL1.value):
+            if self._final_marking_reached(m):
+                break
+            for path in self._paths_between(np.flatnonzero(m > 0), self.final_places):
+                for t in path:
+                    if self._is_enabled(t, m):
+                        m = m + self.change[t]
+                        fired.append(t)
+                if self._final_marking_reached(m):
+                    break
+
+        if not self._final_marking_reached(m) and len(self.final_places) == 1:
+            sink = self.final_places[0]
+            connections = [self.shortest_paths[p][sink] for p in np.flatnonzero(m > 0)
+                           if p in self.shortest_paths and sink in self.shortest_paths[p]]
+            for _ in range(TechnicalParameters.MAX_IT_FINAL2.value):
+                for path in sorted(connections, key=len):
+                    for t in path:
+                        if not self._is_enabled(t, m):
+                            break
+                        m = m + self.change[t]
+                        fired.append(t)
+
+        result = (m, tuple(fired), int(self.consumed[fired].sum()), int(self.produced[fired].sum()))
+        self._final_cache[key] = result
+        return result
+
+    def replay(self, encoded, consider_remaining_in_fitness=True, try_to_reach_final_marking_through_hidden=True,
+               stop_immediately_unfit=False, walk_through_hidden_trans=True):
+        """
+        Replays an encoded variant, with the same parameters as pm4py's token replay.
+        Returns (trace_is_fit, trace_fitness, activated transitions, transitions with problems, reached marking,
+        missing, consumed, remaining, produced), transitions as indices and the marking as integer array.
+        """
+        m = self.initial_marking
+        activated = []
+        problems = []
+        missing = 0
+        consumed = 0
+        produced = int(self.initial_marking.sum())
+
+        for a in encoded:
+            if a < 0:
+                continue
+            m, fired, c, p, mi, problem, stopped = self._step(m, a, walk_through_hidden_trans, stop_immediately_unfit)
+            activated += fired
+            consumed += c
+            produced += p
+            missing += mi
+            if problem is not None:
+                problems.append(problem)
+            if stopped:
+                break
+        return self._complete(m, activated, problems, missing, consumed, produced, consider_remaining_in_fitness,
+                              try_to_reach_final_marking_through_hidden)
+
+    def _complete(self, m, activated, problems, missing, consumed, produced, consider_remaining_in_fitness=True,
+                  try_to_reach_final_marking_through_hidden=True):
+        # end of the trace: moves towards the final marking and counts the remaining and missing tokens
+        if try_to_reach_final_marking_through_hidden:
+            m, fired, c, p = self._reach_final_marking(m)
+            activated = activated + list(fired)
+            consumed += c
+            produced += p
+
+        remaining = int(np.maximum(m - self.final_marking, 0).sum())
+        is_fit = missing == 0 and (remaining == 0 or not consider_remaining_in_fitness)
+        consumed += int(self.final_marking.sum())
+        missing += int(np.maximum(self.final_marking - m, 0).sum())
+
+        if consumed > 0 and produced > 0:
+            trace_fitness = 0.5 * (1.0 - missing / consumed) + 0.5 * (1.0 - remaining / produced)
+        else:
+            trace_fitness = 1.0
+        return is_fit, trace_fitness, activated, problems, m, missing, consumed, remaining, produced
+
+
+def compile_net(net, im, fm):
+    """
+    Compiles a Petri net with initial and final marking for replay
+    """
+    return CompiledNet(net, im, fm)
+
+
+def get_trace_variants(log, activity_key="concept:name", case_id_key="case:concept:name"):
+    """
+    Returns the variant (tuple of activity labels) of every trace of an EventLog or DataFrame, in the order of pm4py
+    """
+    if pandas_utils.check_is_pandas_dataframe(log):
+        return [tuple(x) for x in log.groupby(case_id_key)[activity_key].agg(list).values]
+    return [tuple(e[activity_key] for e in tr) for tr in log]
+
+
+def get_variants(log, activity_key="concept:name", case_id_key="case:concept:name"):
+    """
+    Returns a Counter mapping each variant (tuple of activity labels) of an EventLog or DataFrame to its frequency
+    """
+    return Counter(get_trace_variants(log, activity_key=activity_key, case_id_key=case_id_key))
+
+
+def apply(log, compiled, **parameters):
+    """
+    Token-based replay of an EventLog, drop-in for pm4py's token_replay.apply (without return_names).
+    Each variant is replayed once, traces of the same variant share the same result dictionary.
+    The keyword parameters are those of CompiledNet.replay.
+    """
+    results = {}
+    replayed = []
+    for variant in get_trace_variants(log):
+        if variant not in results:
+            results[variant] = _to_result(compiled, compiled.replay(compiled.encode(variant), **parameters))
+        replayed.append(results[variant])
+    return replayed
+
+
+def _to_result(compiled, replayed):
+    is_fit, trace_fitness, activated, problems, m, missing, consumed, remaining, produced = replayed
+    return {"trace_is_fit": is_fit,
+            "trace_fitness": float(trace_fitness),
+            "activated_transitions": [compiled.transitions[t] for t in activated],
+            "reached_marking": compiled.to_marking(m),
+            "enabled_transitions_in_marking": compiled.enabled_visible_transitions(m),
+            "transitions_with_problems": [compiled.transitions[t] for t in problems],
+            "missing_tokens": missing,
+            "consumed_tokens": consumed,
+            "remaining_tokens": remaining,
+            "produced_tokens": produced}
+
+
+def fit_flags(variants, compiled):
+    """
+    Returns {variant: trace_is_fit} for the given variants (tuples of activity labels)
+    """
+    return {variant: compiled.replay(compiled.encode(variant))[0] for variant in variants}
+
+
+class LogIndex:
+    """
+    Log-side data of the token-based metrics, independent of the model:
+        trace_variants      variant of every trace, in the order of the log
+        variants            Counter of the variants
+        trie                prefix trie of the variants, nodes being [children {activity: node}, number of traces
+                            passing through, variant ending in the node or None]; the keys of the children are the
+                            follow-set of the prefix
+        start_activities    first activities of the variants
+    """
+
+    def __init__(self, log):
+        self.trace_variants = get_trace_variants(log)
+        self.variants = Counter(self.trace_variants)
+        self.trie = [{}, 0, None]
+        self.start_activities = set()
+        for variant, count in self.variants.items():
+            if len(variant) > 0:
+                self.start_activities.add(variant[0])
+            node = self.trie
+            for activity in variant:
+                node = node[0].setdefault(activity, [{}, 0, None])
+                node[1] += count
+            node[2] = variant
+
+    def __len__(self):
+        return len(self.trace_variants)
+
+    def follow_set(self, prefix):
+        """
+        Activities observed directly after the given prefix (tuple of activity labels)
+        """
+        node = self.trie
+        for activity in prefix:
+            if activity not in node[0]:
+                return set()
+            node = node[0][activity]
+        return set(node[0].keys())
+
+
+def get_log_index(log):
+    """
+    Returns the LogIndex of a log (or the log itself if it already is one), reusing the index of one of the most
+    recently indexed logs. Logs are recognised by identity, so a log must not be modified after it has been indexed.
+    """
+    if isinstance(log, LogIndex):
+        return log
+    for i, (indexed_log, index) in enumerate(_LOG_INDICES):
+        if indexed_log is log:
+            _LOG_INDICES.append(_LOG_INDICES.pop(i))
+            return index
+    index = LogIndex(log)
+    _LOG_INDICES.append((log, index))
+    if len(_LOG_INDICES) > LOG_INDEX_CACHE_SIZE:
+        _LOG_INDICES.pop(0)
+    return index
+
+
+def fitness(log, compiled):
+    """
+    Token-based fitness, same dictionary as pm4py.fitness_token_based_replay
+    """
+    index = get_log_index(log)
+    replayed = {variant: compiled.replay(compiled.encode(variant)) for variant in index.variants}
+    return _fitness_of_replays(index.trace_variants, replayed)
+
+
+def _fitness_of_replays(trace_variants, replayed):
+    no_traces = len(trace_variants)
+    fit_traces = sum(1 for variant in trace_variants if replayed[variant][0])
+    # summed trace by trace like pm4py, so that the average is the same to the last digit
+    sum_of_fitness = sum(replayed[variant][1] for variant in trace_variants)
+    total_m = total_c = total_r = total_p = 0
+    for variant, count in Counter(trace_variants).items():
+        _, _, _, _, _, missing, consumed, remaining, produced = replayed[variant]
+        total_m += missing * count
+        total_c += consumed * count
+        total_r += remaining * count
+        total_p += produced * count
+
+    perc_fit_traces = 0.0
+    average_fitness = 0.0
+    log_fitness = 0
+    if no_traces > 0 and total_c > 0 and total_p > 0:
+        perc_fit_traces = float(100.0 * fit_traces) / float(no_traces)
+        average_fitness = float(sum_of_fitness) / float(no_traces)
+        log_fitness = 0.5 * (1 - total_m / total_c) + 0.5 * (1 - total_r / total_p)
+    return {"perc_fit_traces": perc_fit_traces, "average_trace_fitness": average_fitness, "log_fitness": log_fitness,
+            "percentage_of_fitting_traces": perc_fit_traces}
+
+
+def precision(log, compiled):
+    """
+    Token-based ET Conformance precision, same value as pm4py.precision_token_based_replay.
+    The prefixes of the log are arranged in a trie and every distinct prefix is replayed once, extending the marking
+    of its parent prefix by one activity.
+    """
+    index = get_log_index(log)
+    no_traces = len(index)
+
+    trans_en_ini_marking = set(x.label for x in compiled.enabled_visible_transitions(compiled.initial_marking))
+    sum_at = no_traces * len(trans_en_ini_marking)
+    sum_ee = no_traces * len(trans_en_ini_marking.difference(index.start_activities))
+
+    # same replay parameters as pm4py's prefix replay: no final marking, stop at the first missing token
+    stack = [(child, compiled.initial_marking, activity) for activity, child in index.trie[0].items()]
+    while stack:
+        node, m, activity = stack.pop()
+        a = compiled.activities.get(activity, -1)
+        if a >= 0:
+            m, _, _, _, _, _, stopped = compiled._step(m, a, True, True)
+            if stopped:
+                continue
+        if node[0]:
+            prefix_count = sum(child[1] for child in node[0].values())
+            activated = set(x.label for x in compiled.enabled_visible_transitions(m) if x.label is not None)
+            sum_at += len(activated) * prefix_count
+            sum_ee += len(activated.difference(node[0].keys())) * prefix_count
+            stack += [(child, m, next_activity) for next_activity, child in node[0].items()]
+
+    return 1 - float(sum_ee) / float(sum_at) if sum_at > 0 else 1.0
+
+
+def generalization(log, compiled):
+    """
+    Token-based generalization, same value as pm4py.generalization_tbr
+    """
+    variants = get_log_index(log).variants
+    return _generalization_of_replays(compiled, variants,
+                                      {variant: compiled.replay(compiled.encode(variant)) for variant in variants})
+
+
+def _generalization_of_replays(compiled, variants, replayed):
+    trans_occ_map = Counter()
+    for variant, count in variants.items():
+        for t in replayed[variant][2]:
+            trans_occ_map[t] += count
+    inv_sq_occ_sum = sum(1.0 / math.sqrt(occ) for occ in trans_occ_map.values())
+    inv_sq_occ_sum += len(compiled.transitions) - len(trans_occ_map)
+    if len(compiled.transitions) == 0:
+        return 1.0
+    return 1.0 - inv_sq_occ_sum / float(len(compiled.transitions))
+
+
+def evaluate(log, compiled):
+    """
+    Token-based fitness, precision and generalization from a single replay of the log, same values as fitness,
+    precision and generalization. Returns a tuple (fitness, precision, generalization).
+
+    The log can also be given as its LogIndex. The variants are replayed once along the prefix trie of the index. As
+    long as a prefix replays without missing tokens, its marking is the one of pm4py's prefix replay for precision, so
+    the escaping edges are read from the same pass; at the end of every variant the replay is completed towards the
+    final marking for fitness and the activated transitions are counted for generalization.
+    """
+    index = get_log_index(log)
+    root = index.trie
+    no_traces = len(index)
+
+    trans_en_ini_marking = set(x.label for x in compiled.enabled_visible_transitions(compiled.initial_marking))
+    sum_at = no_traces * len(trans_en_ini_marking)
+    sum_ee = no_traces * len(trans_en_ini_marking.difference(index.start_activities))
+
+    replayed = {}
+    initial_state = (compiled.initial_marking, [], [], 0, 0, int(compiled.initial_marking.sum()), True)
+    stack = [(root, None, initial_state)]
+    while stack:
+        node, activity, (m, activated, problems, missing, consumed, produced, prefix_fit) = stack.pop()
+        a = -1 if activity is None else compiled.activities.get(activity, -1)
+        if a >= 0:
+            m, fired, c, p, mi, problem, _ = compiled._step(m, a, True, False)
+            activated = activated + list(fired)
+            consumed += c
+            produced += p
+            missing += mi
+            if problem is not None:
+                problems = problems + [problem]
+                # pm4py's prefix replay stops here, neither this prefix nor its extensions count for precision
+                prefix_fit = False
+        if node[2] is not None:
+            replayed[node[2]] = compiled._complete(m, activated, problems, missing, consumed, produced)
+        if node[0]:
+            if prefix_fit and node is not root:
+                prefix_count = sum(child[1] for child in node[0].values())
+                enabled = set(x.label for x in compiled.enabled_visible_transitions(m) if x.label is not None)
+                sum_at += len(enabled) * prefix_count
+                sum_ee += len(enabled.difference(node[0].keys())) * prefix_count
+            state = (m, activated, problems, missing, consumed, produced, prefix_fit)
+            stack += [(child, next_activity, state) for next_activity, child in node[0].items()]
+
+    precision_value = 1 - float(sum_ee) / float(sum_at) if sum_at > 0 else 1.0
+    return (_fitness_of_replays(index.trace_variants, replayed), precision_value,
+            _generalization_of_replays(compiled, index.variants, replayed))
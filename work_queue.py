@@ -0,0 +1,277 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import socket
+import threading
+import time
+import traceback
+
+
+"""
+Work queue on a shared filesystem
+
+Distributes the cells of a sweep over the machines that can see a shared directory, without a cluster scheduler.
+The coordinator writes one file per task, workers on any machine claim tasks by creating a lease file and write
+the result of a task when they are done:
+
+    <directory>/tasks/<task id>.task        the task (pickled), written by submit
+    <directory>/leases/<task id>.lease      the worker holding the task, created exclusively by claim
+    <directory>/results/<task id>.result    the result of the task (pickled)
+    <directory>/failed/<task id>.error      the traceback of a failed task
+
+A worker renews its lease (the modification time of the lease file) every third of lease_seconds while it runs a
+task. A lease that was not renewed for lease_seconds belongs to a worker that died or lost the shared directory, and
+the task is claimed again by the next worker looking for work. The worker first renames the expired lease away, and
+checks that the file it renamed is still expired: another worker may have taken the task over between the check
+and the rename, and its fresh lease is then put back. A worker that creates a lease in the moment a fresh one is
+renamed away can still end up running a task twice. Leases are compared to the clock of the worker, so the clocks of
+the machines have to be synchronized to well within lease_seconds.
+
+All files are written under a temporary name and renamed, so no process ever reads a partial file. A task that is run
+twice (because its lease expired while it was still running) writes the same result twice, as the seeded tasks of the
+sweeps are deterministic. A failed task stays failed until it is submitted again.
+
+Several workers on one machine are started with run_local_workers, which is also how the queue is tested without a
+second machine.
+"""
+
+
+LEASE_SECONDS = 600
+POLL_SECONDS = 2
+# a worker started with idle_seconds waits this long for new tasks after the queue has been drained
+IDLE_SECONDS = 60
+
+_EXTENSIONS = {'tasks': '.task', 'leases': '.lease', 'results': '.result', 'failed': '.error'}
+
+
+def task_id(*key):
+    """
+    Id of the task identified by the given key (strings), the same on every machine
+    """
+    return hashlib.sha1('\0'.join(key).encode()).hexdigest()[:20]
+
+
+def _write_atomically(path, data):
+    temporary_path = path + '.' + socket.gethostname() + '.' + str(os.getpid())
+    with open(temporary_path, 'wb') as f:
+        f.write(data)
+    os.replace(temporary_path, path)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class WorkQueue:
+
+    def __init__(self, directory, lease_seconds=LEASE_SECONDS):
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        for name in _EXTENSIONS:
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, kind, task):
+        return os.path.join(self.directory, kind, task + _EXTENSIONS[kind])
+
+    def _ids(self, kind):
+        extension = _EXTENSIONS[kind]
+        return set(name[:-len(extension)] for name in os.listdir(os.path.join(self.directory, kind))
+                   if name.endswith(extension))
+
+    def submit(self, tasks):
+        """
+        Adds tasks, given as (task id, task) pairs. Tasks that already have a result are kept as they are, failed
+        tasks are queued again. Returns the task ids in the given order.
+        """
+        done = self._ids('results')
+        ids = []
+        for task, payload in tasks:
+            ids.append(task)
+            if task in done:
+                continue
+            _remove(self._path('failed', task))
+            _write_atomically(self._path('tasks', task), pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+        return ids
+
+    def pending(self):
+        """
+        Ids of the tasks without result or error
+        """
+        return self._ids('tasks') - self._ids('results') - self._ids('failed')
+
+    def _take_lease(self, task, worker):
+        try:
+            descriptor = os.open(self._path('leases', task), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(descriptor, 'w') as f:
+            f.write(worker)
+        return True
+
+    def _expired(self, path):
+        try:
+            return time.time() - os.stat(path).st_mtime > self.lease_seconds
+        except FileNotFoundError:
+            return False
+
+    def claim(self, worker):
+        """
+        Claims a pending task that is not leased or whose lease expired. Returns (task id, task) or None.
+        """
+        for task in sorted(self.pending()):
+            lease = self._path('leases', task)
+            if not self._take_lease(task, worker):
+                if not self._expired(lease):
+                    continue
+                # of the workers finding the lease expired, the one renaming it takes the task over, unless what it
+                # renamed is the fresh lease of a worker that took the task over since (renaming keeps the mtime)
+                stale = lease + '.' + worker + '.expired'
+                try:
+                    os.rename(lease, stale)
+                except FileNotFoundError:
+                    continue
+                if not self._expired(stale):
+                    try:
+                        os.link(stale, lease)
+                    except FileExistsError:
+                        pass
+                    _remove(stale)
+                    continue
+                _remove(stale)
+                print(f"Lease of task {task} expired, claimed again by {worker}")
+                if not self._take_lease(task, worker):
+                    continue
+            # the task may have been finished since it was listed
+            if os.path.exists(self._path('results', task)):
+                _remove(lease)
+                continue
+            return task, _read(self._path('tasks', task))
+        return None
+
+    def renew(self, task):
+        try:
+            os.utime(self._path('leases', task))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task, result):
+        _write_atomically(self._path('results', task), pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        _remove(self._path('leases', task))
+
+    def fail(self, task, error):
+        _write_atomically(self._path('failed', task), error.encode())
+        _remove(self._path('leases', task))
+
+    def status(self):
+        tasks = self._ids('tasks')
+        results = self._ids('results') & tasks
+        failed = (self._ids('failed') & tasks) - results
+        leased = (self._ids('leases') & tasks) - results - failed
+        return {'tasks': len(tasks), 'done': len(results), 'failed': len(failed), 'running': len(leased),
+                'queued': len(tasks) - len(results) - len(failed) - len(leased)}
+
+    def wait(self, ids, poll_seconds=POLL_SECONDS):
+        """
+        Waits until all given tasks are finished and returns their results in the given order.
+        Raises RuntimeError if one of them failed.
+        """
+        while True:
+            results = self._ids('results')
+            failed = [task for task in ids if task not in results and os.path.exists(self._path('failed', task))]
+            if failed:
+                with open(self._path('failed', failed[0])) as f:
+                    raise RuntimeError(f"{len(failed)} task(s) failed, e.g. {failed[0]}:\n{f.read()}")
+            if all(task in results for task in ids):
+                return [_read(self._path('results', task)) for task in ids]
+            time.sleep(poll_seconds)
+
+
+def _renew_periodically(queue, task, stop):
+    while not stop.wait(queue.lease_seconds / 3):
+        queue.renew(task)
+
+
+def work(queue, run_task, worker=None, idle_seconds=IDLE_SECONDS, poll_seconds=POLL_SECONDS):
+    """
+    Runs tasks of the queue until it has no pending tasks for idle_seconds.
+
+    Parameters
+    ----------
+    queue : WorkQueue
+        The queue to work on.
+    run_task : callable
+        Called as run_task(task), returns the result of the task.
+    worker : str, optional
+        Name of the worker in its leases, defaults to host name and process id.
+    idle_seconds : float
+        Time to wait for new tasks once there are no pending tasks left. Tasks leased by other workers are pending
+        until they are finished, so that their leases are taken over if they expire.
+    poll_seconds : float
+        Time between two looks for work.
+
+    Returns
+    -------
+    int
+        Number of tasks run by this worker.
+    """
+    if worker is None:
+        worker = socket.gethostname() + '-' + str(os.getpid())
+    finished = 0
+    idle_since = None
+    while True:
+        claimed = queue.claim(worker)
+        if claimed is None:
+            if not queue.pending():
+                idle_since = idle_since or time.time()
+                if time.time() - idle_since >= idle_seconds:
+                    return finished
+            else:
+                idle_since = None
+            time.sleep(poll_seconds)
+            continue
+
+        idle_since = None
+        task, payload = claimed
+        stop = threading.Event()
+        renewal = threading.Thread(target=_renew_periodically, args=(queue, task, stop), daemon=True)
+        renewal.start()
+        try:
+            result = run_task(payload)
+        except Exception:
+            queue.fail(task, traceback.format_exc())
+            print(f"Task {task} failed:\n{traceback.format_exc()}")
+        else:
+            queue.complete(task, result)
+        finally:
+            stop.set()
+            renewal.join()
+        finished += 1
+
+
+def run_local_workers(queue, run_task, processes=None, idle_seconds=0, poll_seconds=POLL_SECONDS):
+    """
+    Works on the queue with the given number of processes on this machine (defaults to the number of cores) until
+    it has no pending tasks. The workers are forked from this process, 1 works in this process.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        work(queue, run_task, idle_seconds=idle_seconds, poll_seconds=poll_seconds)
+        return
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=work, args=(queue, run_task),
+                               kwargs={'idle_seconds': idle_seconds, 'poll_seconds': poll_seconds})
+               for _ in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
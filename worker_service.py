@@ -0,0 +1,166 @@
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import time
+from collections import OrderedDict
+
+
+"""
+Resident pipeline worker
+
+A worker process imports pm4py once and keeps the parsed event logs, the polluted logs of seeded jobs and the
+discovered models in LRU caches, so repeated pipeline jobs on the same logs only pay for the work that actually
+changed. Jobs are sent over a local Unix socket, one JSON object per line in each direction:
+
+    {"command": "run", "event_log": ..., "dqis": [...], "discovery": ..., "evaluation": ..., "seed": ..., ...}
+    {"command": "stats"}
+    {"command": "shutdown"}
+
+Every response carries "ok" and either the result or an "error" message. Unseeded jobs pollute the log anew each time,
+only seeded jobs are deterministic and have their polluted logs and models cached. Logs are recognised by path and
+modification time, so a log changed on disk is parsed again.
+
+This module only imports pm4py inside the worker, so the client side (main.py run --worker) starts quickly.
+"""
+
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'event_log_pollution_worker.sock')
+LOG_CACHE_SIZE = 8
+MODEL_CACHE_SIZE = 32
+
+
+class LRUCache:
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+        self.misses += 1
+        value = compute()
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return value
+
+    def stats(self):
+        return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class PipelineWorker:
+
+    def __init__(self, log_cache_size=LOG_CACHE_SIZE, model_cache_size=MODEL_CACHE_SIZE):
+        self.logs = LRUCache(log_cache_size)
+        self.models = LRUCache(model_cache_size)
+
+    def _load_log(self, path):
+        import pm4py
+
+        key = (path, os.path.getmtime(path))
+        return key, self.logs.get_or_compute(key, lambda: pm4py.read_xes(path, return_legacy_log_object=True))
+
+    def _prepare(self, job):
+        """
+        Returns the (possibly polluted) log of the job and its model, taken from the caches where possible
+        """
+        import log_pollution
+        import replicates
+
+        log_key, log = self._load_log(os.path.abspath(job['event_log']))
+        dqis = tuple(job.get('dqis') or ())
+        seed = job.get('seed')
+        if dqis:
+            if seed is None:
+                log_key = None
+                log = log_pollution.pollute_log(log, dqis)
+            else:
+                def pollute():
+                    replicates.seed_everything(seed)
+                    return log_pollution.pollute_log(log, dqis)
+                log_key = log_key + (dqis, seed)
+                log = self.logs.get_or_compute(log_key, pollute)
+
+        def discover():
+            return log_pollution.discover_model(log, job['discovery'])
+        if log_key is None:
+            net, im, fm = discover()
+        else:
+            net, im, fm = self.models.get_or_compute(log_key + (job['discovery'],), discover)
+        return log, net, im, fm
+
+    def run_job(self, job):
+        import log_pollution
+
+        start = time.perf_counter()
+        log, net, im, fm = self._prepare(job)
+        report = log_pollution.evaluate_model(log, net, im, fm, job['evaluation'], processes=job.get('processes'),
+                                              max_align_time_variant=job.get('max_align_time'),
+                                              max_align_memory_mb=job.get('max_align_memory'),
+                                              target_error=job.get('target_error'))
+        if job.get('out_dir'):
+            model_path = log_pollution.save_model(net, im, fm, job['out_dir'])
+            report.append(f"Model saved to {model_path}")
+        return {'report': report, 'seconds': time.perf_counter() - start}
+
+    def stats(self):
+        return {'logs': self.logs.stats(), 'models': self.models.stats()}
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            job = json.loads(line)
+            command = job.get('command', 'run')
+            if command == 'run':
+                response = dict(ok=True, **self.server.worker.run_job(job))
+            elif command == 'stats':
+                response = dict(ok=True, **self.server.worker.stats())
+            elif command == 'shutdown':
+                response = {'ok': True}
+                self.server.stopping = True
+            else:
+                raise ValueError(f"Command '{command}' is not supported.")
+        except Exception as e:
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+def serve(socket_path=DEFAULT_SOCKET, log_cache_size=LOG_CACHE_SIZE, model_cache_size=MODEL_CACHE_SIZE):
+    """
+    Runs a worker on the given Unix socket until it receives a shutdown command. Jobs are handled one at a time.
+    """
+    import pm4py
+    pm4py.util.constants.SHOW_PROGRESS_BAR = False
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.UnixStreamServer(socket_path, _JobHandler) as server:
+        server.worker = PipelineWorker(log_cache_size, model_cache_size)
+        server.stopping = False
+        print(f"Worker listening on {socket_path}")
+        try:
+            while not server.stopping:
+                server.handle_request()
+        finally:
+            os.remove(socket_path)
+
+
+def submit(job, socket_path=DEFAULT_SOCKET):
+    """
+    Sends a job to the worker on the given socket and returns its response
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall((json.dumps(job) + '\n').encode())
+        with connection.makefile('rb') as response:
+            return json.loads(response.readline())